@@ -2100,6 +2100,14 @@ component_check_generate_test_code () {
     record_status ./tests/scripts/test_generate_test_code.py 2>&1
 }
 
+component_check_analyze_outcomes () {
+    msg "unit test: analyze_outcomes.py"
+    # unittest writes out mundane stuff like number or tests run on stderr.
+    # Our convention is to reserve stderr for actual errors, and write
+    # harmless info on stdout so it can be suppress with --quiet.
+    record_status ./tests/scripts/test_analyze_outcomes.py 2>&1
+}
+
 ################################################################
 #### Termination
 ################################################################
@@ -7,12 +7,37 @@ less likely to be useful.
 """
 
 import argparse
+import array
+import collections
+import gzip
+import io
+import itertools
+import multiprocessing
+import operator
+import os
 import re
+import struct
 import sys
 import traceback
 
 import check_test_cases
 
+# Approximate size of the chunks of an outcome file that are read
+# concurrently. See outcome_file_chunks().
+OUTCOME_CHUNK_SIZE = 16 * 1024 * 1024
+
+# Compact outcome file format. See CompactOutcomeWriter.
+COMPACT_MAGIC = b'MBEDTLS-OUTCOMES-1\n'
+# Columns of a compact outcome file: the fields of a line of a CSV outcome
+# file, with the suite and description joined by ';'.
+COMPACT_COLUMNS = ('platform', 'config', 'key', 'result', 'cause')
+# Maximum number of rows in a block of a compact outcome file.
+COMPACT_BLOCK_ROWS = 64 * 1024
+# Compression level of compact outcome files: the default of the gzip
+# command, which is much faster than the maximum and almost as small.
+COMPACT_GZIP_LEVEL = 6
+GZIP_MAGIC = b'\x1f\x8b'
+
 class Results:
     """Process analysis results."""
 
@@ -34,22 +59,281 @@ class Results:
 
 class TestCaseOutcomes:
     """The outcomes of one test case across many configurations."""
-    # pylint: disable=too-few-public-methods
+
+    __slots__ = ('success_count', 'failure_count',
+                 'success_setups', 'failure_setups')
 
     def __init__(self):
-        # Collect a list of witnesses of the test case succeeding or failing.
-        # Currently we don't do anything with witnesses except count them.
-        # The format of a witness is determined by the read_outcome_file
-        # function; it's the platform and configuration joined by ';'.
-        self.successes = []
-        self.failures = []
+        # Count the witnesses of the test case succeeding or failing, and
+        # record the setups they ran on as bitsets: bit i is set if the
+        # test case ran on the setup with identifier i. A setup is a
+        # platform and configuration pair, identified by the OutcomeTable
+        # that the outcomes come from.
+        self.success_count = 0
+        self.failure_count = 0
+        self.success_setups = 0
+        self.failure_setups = 0
+
+    def add_success(self, setup_id):
+        """Record a witness of the test case succeeding on a setup."""
+        self.success_count += 1
+        self.success_setups |= 1 << setup_id
+
+    def add_failure(self, setup_id):
+        """Record a witness of the test case failing on a setup."""
+        self.failure_count += 1
+        self.failure_setups |= 1 << setup_id
 
     def hits(self):
         """Return the number of times a test case has been run.
 
         This includes passes and failures, but not skips.
         """
-        return len(self.successes) + len(self.failures)
+        return self.success_count + self.failure_count
+
+    def run_setups(self):
+        """Return the bitset of the setups the test case has been run on."""
+        return self.success_setups | self.failure_setups
+
+class StringTable:
+    """Intern strings into consecutive integer identifiers."""
+
+    def __init__(self):
+        self.ids = {}
+        self.strings = []
+
+    def __len__(self):
+        return len(self.strings)
+
+    def intern(self, string):
+        """Return the identifier of string, adding it if it is new."""
+        string_id = self.ids.get(string)
+        if string_id is None:
+            string_id = len(self.strings)
+            self.ids[string] = string_id
+            self.strings.append(string)
+        return string_id
+
+class OutcomeTable:
+    """The outcomes of a CI run, stored by column.
+
+    Each row is a line of the outcome file. The platform, configuration,
+    result and test case of a row are stored as integer identifiers in
+    compact arrays, and the strings are stored once in string tables. A test
+    case is identified by its suite and description identifiers. The cause
+    of a result is not stored since no analysis uses it.
+    """
+
+    # Results that count as a run of the test case.
+    HIT_RESULTS = frozenset(['PASS', 'FAIL'])
+
+    # Fields of a line of an outcome file that identify the string ids of
+    # its setup and result, and of its test case. See add_lines().
+    ROW_SETUP_FIELDS = operator.itemgetter(0, 1, 4)
+    ROW_KEY_FIELDS = operator.itemgetter(2, 3)
+
+    def __init__(self):
+        """Create an empty table."""
+        self.platforms = StringTable()
+        self.configs = StringTable()
+        self.suites = StringTable()
+        self.cases = StringTable()
+        self.results = StringTable()
+        # Test case identifiers, indexing the (suite id, case id) pairs
+        # of key_parts.
+        self.key_ids = {}
+        self.key_parts = []
+        # Setup identifiers, indexing the (platform id, config id) pairs
+        # of setup_parts. See TestCaseOutcomes.
+        self.setup_ids = {}
+        self.setup_parts = []
+        # Identifiers by strings, to intern a row with two lookups:
+        # (platform id, config id, result id) by (platform, config, result)
+        # and test case ids by (suite, description).
+        self._row_setup_ids = {}
+        self._row_key_ids = {}
+        # Columns, with one entry per row
+        self.platform_column = array.array('I')
+        self.config_column = array.array('I')
+        self.key_column = array.array('I')
+        self.result_column = array.array('B')
+
+    def __len__(self):
+        return len(self.key_column)
+
+    def key_id(self, suite_id, case_id):
+        """Return the identifier of a test case, adding it if it is new."""
+        parts = (suite_id, case_id)
+        key_id = self.key_ids.get(parts)
+        if key_id is None:
+            key_id = len(self.key_parts)
+            self.key_ids[parts] = key_id
+            self.key_parts.append(parts)
+        return key_id
+
+    def _intern_row_setup(self, fields):
+        """Intern the platform, configuration and result of a row."""
+        platform, config, result = fields
+        setup_ids = (self.platforms.intern(platform),
+                     self.configs.intern(config),
+                     self.results.intern(result))
+        self._row_setup_ids[fields] = setup_ids
+        return setup_ids
+
+    def _intern_row_key(self, fields):
+        """Intern the test case of a row."""
+        suite, case = fields
+        key_id = self.key_id(self.suites.intern(suite),
+                             self.cases.intern(case))
+        self._row_key_ids[fields] = key_id
+        return key_id
+
+    def add_lines(self, lines):
+        """Add the outcomes of the lines of an outcome file."""
+        # Look up the identifiers of the strings of a row with two lookups,
+        # with methods bound outside of the loop, since there are millions
+        # of rows in a full CI run.
+        setup_ids_get = self._row_setup_ids.get
+        key_ids_get = self._row_key_ids.get
+        setup_fields = self.ROW_SETUP_FIELDS
+        key_fields = self.ROW_KEY_FIELDS
+        append_platform = self.platform_column.append
+        append_config = self.config_column.append
+        append_result = self.result_column.append
+        append_key = self.key_column.append
+        for line in lines:
+            # platform;config;suite;description;result;cause
+            row = line.split(';')
+            if len(row) != 6:
+                raise ValueError('Malformed outcome line: ' + repr(line))
+            setup_ids = setup_ids_get(setup_fields(row))
+            if setup_ids is None:
+                setup_ids = self._intern_row_setup(setup_fields(row))
+            key_id = key_ids_get(key_fields(row))
+            if key_id is None:
+                key_id = self._intern_row_key(key_fields(row))
+            append_platform(setup_ids[0])
+            append_config(setup_ids[1])
+            append_result(setup_ids[2])
+            append_key(key_id)
+
+    def extend(self, other):
+        """Append the rows of another table, e.g. read from another chunk of
+        the outcome file or from another outcome file."""
+        platform_ids = [self.platforms.intern(platform)
+                        for platform in other.platforms.strings]
+        config_ids = [self.configs.intern(config)
+                      for config in other.configs.strings]
+        result_ids = [self.results.intern(result)
+                      for result in other.results.strings]
+        key_ids = [self.key_id(self.suites.intern(other.suites.strings[suite_id]),
+                               self.cases.intern(other.cases.strings[case_id]))
+                   for suite_id, case_id in other.key_parts]
+        for column, ids, other_column in [
+                (self.platform_column, platform_ids, other.platform_column),
+                (self.config_column, config_ids, other.config_column),
+                (self.result_column, result_ids, other.result_column),
+                (self.key_column, key_ids, other.key_column)]:
+            if ids == list(range(len(ids))):
+                # Same identifiers in both tables: copy the column as is
+                column.extend(other_column)
+            else:
+                column.extend(map(ids.__getitem__, other_column))
+
+    def setup_id(self, platform_id, config_id):
+        """Return the identifier of a setup, adding it if it is new."""
+        parts = (platform_id, config_id)
+        setup_id = self.setup_ids.get(parts)
+        if setup_id is None:
+            setup_id = len(self.setup_parts)
+            self.setup_ids[parts] = setup_id
+            self.setup_parts.append(parts)
+        return setup_id
+
+    def setup(self, setup_id):
+        """Return the platform and configuration of a setup, separated by a
+        semicolon."""
+        platform_id, config_id = self.setup_parts[setup_id]
+        return ';'.join([self.platforms.strings[platform_id],
+                         self.configs.strings[config_id]])
+
+    def setups(self, setup_bitset):
+        """Return the setups of a bitset from TestCaseOutcomes."""
+        return [self.setup(setup_id)
+                for setup_id in range(len(self.setup_parts))
+                if setup_bitset >> setup_id & 1]
+
+    def all_setups(self):
+        """Return the bitset of all the setups that ran any test case.
+
+        Setups are only known once to_outcomes() has been called. For
+        example, the setups that never ran a test case are
+        all_setups() & ~outcomes.run_setups(): see setups_not_run().
+        """
+        return (1 << len(self.setup_parts)) - 1
+
+    def key(self, key_id):
+        """Return the key of a test case: its suite and description,
+        separated by a semicolon."""
+        suite_id, case_id = self.key_parts[key_id]
+        return ';'.join([self.suites.strings[suite_id],
+                         self.cases.strings[case_id]])
+
+    def keys(self):
+        """Return the keys of the test cases, in order of first appearance."""
+        return [self.key(key_id) for key_id in range(len(self.key_parts))]
+
+    def hit_counts(self):
+        """Return the number of runs of each test case by key.
+
+        This includes passes and failures, but not skips. Test cases that
+        were never run are left out.
+        """
+        is_hit = [result in self.HIT_RESULTS
+                  for result in self.results.strings]
+        counts = collections.Counter(
+            itertools.compress(self.key_column,
+                               map(is_hit.__getitem__, self.result_column)))
+        return {self.key(key_id): count for key_id, count in counts.items()}
+
+    def to_outcomes(self):
+        """Return an outcome collection, as returned by read_outcome_file().
+
+        The setup identifiers of the outcomes are those of this table.
+        """
+        keys = self.keys()
+        outcomes = [TestCaseOutcomes() for _ in keys]
+        results = [{'PASS': TestCaseOutcomes.add_success,
+                    'FAIL': TestCaseOutcomes.add_failure}.get(result)
+                   for result in self.results.strings]
+        setup_ids = self.setup_ids
+        for platform_id, config_id, key_id, result_id in zip(
+                self.platform_column, self.config_column,
+                self.key_column, self.result_column):
+            add = results[result_id]
+            if add is None:
+                continue
+            setup_id = setup_ids.get((platform_id, config_id))
+            if setup_id is None:
+                setup_id = self.setup_id(platform_id, config_id)
+            add(outcomes[key_id], setup_id)
+        return dict(zip(keys, outcomes))
+
+    def setups_not_run(self):
+        """Return the setups that never ran each test case, by key.
+
+        Only the setups that ran at least one test case are considered, and
+        the test cases that ran on all of them are left out. See setup() for
+        the format of a setup.
+        """
+        outcomes = self.to_outcomes()
+        all_setups = self.all_setups()
+        setups_not_run = {}
+        for key, case_outcomes in outcomes.items():
+            setup_bitset = all_setups & ~case_outcomes.run_setups()
+            if setup_bitset:
+                setups_not_run[key] = self.setups(setup_bitset)
+        return setups_not_run
 
 class TestDescriptions(check_test_cases.TestDescriptionExplorer):
     """Collect the available test cases."""
@@ -57,36 +341,310 @@ class TestDescriptions(check_test_cases.TestDescriptionExplorer):
     def __init__(self):
         super().__init__()
         self.descriptions = set()
+        # Suite name of each file, computed once per file
+        self.base_names = {}
 
     def process_test_case(self, _per_file_state,
                           file_name, _line_number, description):
         """Record an available test case."""
-        base_name = re.sub(r'\.[^.]*$', '', re.sub(r'.*/', '', file_name))
+        base_name = self.base_names.get(file_name)
+        if base_name is None:
+            base_name = re.sub(r'\.[^.]*$', '', re.sub(r'.*/', '', file_name))
+            self.base_names[file_name] = base_name
         key = ';'.join([base_name, description.decode('utf-8')])
         self.descriptions.add(key)
 
-def collect_available_test_cases():
-    """Collect the available test cases."""
+def collect_available_test_cases(catalog_file=None):
+    """Collect the available test cases.
+
+    With a catalog file, only the test files that changed since the catalog
+    was saved are read. See check_test_cases.TestCaseCatalog.
+    """
     explorer = TestDescriptions()
-    explorer.walk_all()
+    if catalog_file:
+        check_test_cases.walk_all_with_catalog(explorer, catalog_file)
+    else:
+        explorer.walk_all()
     return sorted(explorer.descriptions)
 
-def analyze_coverage(results, outcomes):
+def outcome_hit_counts(outcomes):
+    """Return the number of runs of each test case by key.
+
+    outcomes is either an OutcomeTable or an outcome collection as returned
+    by read_outcome_file().
+    """
+    if isinstance(outcomes, OutcomeTable):
+        return outcomes.hit_counts()
+    return {key: case_outcomes.hits()
+            for key, case_outcomes in outcomes.items()
+            if case_outcomes.hits()}
+
+def analyze_coverage(results, outcomes, catalog_file=None):
     """Check that all available test cases are executed at least once."""
-    available = collect_available_test_cases()
+    available = collect_available_test_cases(catalog_file)
+    hit_counts = outcome_hit_counts(outcomes)
     for key in available:
-        hits = outcomes[key].hits() if key in outcomes else 0
+        hits = hit_counts.get(key, 0)
         if hits == 0:
             # Make this a warning, not an error, as long as we haven't
             # fixed this branch to have full coverage of test cases.
             results.warning('Test case not executed: {}', key)
 
-def analyze_outcomes(outcomes):
-    """Run all analyses on the given outcome collection."""
+def analyze_outcomes(outcomes, catalog_file=None):
+    """Run all analyses on the given outcomes.
+
+    outcomes is either an OutcomeTable or an outcome collection as returned
+    by read_outcome_file(). See collect_available_test_cases() for the
+    catalog_file parameter.
+    """
     results = Results()
-    analyze_coverage(results, outcomes)
+    analyze_coverage(results, outcomes, catalog_file)
     return results
 
+class CompactOutcomeWriter:
+    """Write outcomes in the compact outcome file format.
+
+    A compact outcome file is a gzip stream made of COMPACT_MAGIC followed by
+    blocks of up to COMPACT_BLOCK_ROWS rows. Each column of COMPACT_COLUMNS
+    is dictionary-encoded: a string is stored once, in the block where it
+    first appears, and rows refer to strings by their index in the order of
+    appearance in the file. A block consists of:
+    - the number of rows, as a 32-bit little-endian integer;
+    - for each column, the byte length of the strings that are new in this
+      block, as a 32-bit little-endian integer, followed by these strings
+      in UTF-8, each terminated by a newline;
+    - for each column, the string index of each row, as 32-bit little-endian
+      integers.
+    Storing the blocks by column keeps them small after compression and
+    lets readers decode a whole column at once.
+    """
+
+    def __init__(self, output_file):
+        self.output_file = gzip.open(output_file, 'wb', COMPACT_GZIP_LEVEL)
+        self.output_file.write(COMPACT_MAGIC)
+        # Identifiers of the strings written so far, for each column
+        self.string_ids = [{} for _ in COMPACT_COLUMNS]
+        # Rows of the next block
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    def write_lines(self, lines):
+        """Write the outcomes of the lines of a CSV outcome file."""
+        write = self.write
+        for line in lines:
+            (platform, config, suite, case, result, cause) = \
+                line.rstrip('\n').split(';')
+            write((platform, config, suite + ';' + case, result, cause))
+
+    def write(self, row):
+        """Write one outcome: a tuple with one string per column of
+        COMPACT_COLUMNS."""
+        self.rows.append(row)
+        if len(self.rows) >= COMPACT_BLOCK_ROWS:
+            self.flush()
+
+    def flush(self):
+        """Write the pending rows as a block."""
+        if not self.rows:
+            return
+        columns = list(zip(*self.rows))
+        parts = [struct.pack('<I', len(self.rows))]
+        for strings, string_ids in zip(columns, self.string_ids):
+            # The strings that are new in this block, in order of appearance
+            new_strings = [string for string in dict.fromkeys(strings)
+                           if string not in string_ids]
+            string_ids.update(zip(new_strings,
+                                  itertools.count(len(string_ids))))
+            data = ''.join(string + '\n'
+                           for string in new_strings).encode('utf-8')
+            parts += [struct.pack('<I', len(data)), data]
+        for strings, string_ids in zip(columns, self.string_ids):
+            column = array.array('I', map(string_ids.__getitem__, strings))
+            if sys.byteorder != 'little':
+                column.byteswap()
+            parts.append(column.tobytes())
+        self.output_file.write(b''.join(parts))
+        self.rows = []
+
+    def close(self):
+        self.flush()
+        self.output_file.close()
+
+def compact_outcome_blocks(outcome_file):
+    """Parse a compact outcome file written by CompactOutcomeWriter.
+
+    Yield one (new strings, columns) pair per block, where new strings is a
+    list of the strings that are new in this block, and columns is a list of
+    arrays of string indices, for each column of COMPACT_COLUMNS.
+    """
+    with gzip.open(outcome_file, 'rb') as input_file:
+        if input_file.read(len(COMPACT_MAGIC)) != COMPACT_MAGIC:
+            raise ValueError('{}: not a compact outcome file'
+                             .format(outcome_file))
+        while True:
+            header = input_file.read(4)
+            if not header:
+                break
+            (rows,) = struct.unpack('<I', header)
+            new_strings = []
+            for _ in COMPACT_COLUMNS:
+                (length,) = struct.unpack('<I', input_file.read(4))
+                data = input_file.read(length).decode('utf-8')
+                new_strings.append(data.split('\n')[:-1])
+            columns = []
+            for _ in COMPACT_COLUMNS:
+                column = array.array('I')
+                column.frombytes(input_file.read(rows * column.itemsize))
+                if sys.byteorder != 'little':
+                    column.byteswap()
+                columns.append(column)
+            yield new_strings, columns
+
+def read_compact_outcome_lines(outcome_file):
+    """Parse a compact outcome file and yield the lines of the equivalent CSV
+    outcome file."""
+    strings = [[] for _ in COMPACT_COLUMNS]
+    for new_strings, columns in compact_outcome_blocks(outcome_file):
+        for column_strings, column_new_strings in zip(strings, new_strings):
+            column_strings += column_new_strings
+        for row in zip(*[map(column_strings.__getitem__, column)
+                         for column_strings, column
+                         in zip(strings, columns)]):
+            yield ';'.join(row) + '\n'
+
+def add_compact_outcomes(table, outcome_file):
+    """Add the outcomes of a compact outcome file to an OutcomeTable."""
+    def intern_key(key):
+        suite, case = key.split(';', 1)
+        return table.key_id(table.suites.intern(suite),
+                            table.cases.intern(case))
+    # Identifiers in the table of the strings of the file, for each column
+    ids = [[] for _ in COMPACT_COLUMNS]
+    interns = [table.platforms.intern, table.configs.intern, intern_key,
+               table.results.intern, None]
+    table_columns = [table.platform_column, table.config_column,
+                     table.key_column, table.result_column, None]
+    for new_strings, columns in compact_outcome_blocks(outcome_file):
+        for column_ids, column_new_strings, intern, column, table_column in \
+            zip(ids, new_strings, interns, columns, table_columns):
+            if table_column is None:
+                # The cause of a result is not stored in the table
+                continue
+            column_ids += map(intern, column_new_strings)
+            if column_ids != list(range(len(column_ids))):
+                column = map(column_ids.__getitem__, column)
+            elif column.typecode != table_column.typecode:
+                # Same identifiers in the file and in the table, but
+                # stored with a different size
+                column = column.tolist()
+            table_column.extend(column)
+
+def is_compact_outcome_file(outcome_file):
+    """Whether the outcome file is in the compact format rather than CSV."""
+    with open(outcome_file, 'rb') as input_file:
+        return input_file.read(len(GZIP_MAGIC)) == GZIP_MAGIC
+
+def read_outcome_lines(outcome_file):
+    """Yield the lines of an outcome file in either format, as CSV."""
+    if is_compact_outcome_file(outcome_file):
+        yield from read_compact_outcome_lines(outcome_file)
+    else:
+        with open(outcome_file, 'r', encoding='utf-8') as input_file:
+            yield from input_file
+
+def add_outcome_file(table, outcome_file):
+    """Add the outcomes of an outcome file in either format to an
+    OutcomeTable."""
+    if is_compact_outcome_file(outcome_file):
+        add_compact_outcomes(table, outcome_file)
+    else:
+        with open(outcome_file, 'r', encoding='utf-8') as input_file:
+            table.add_lines(input_file)
+
+def convert_outcome_files(outcome_files, output_file):
+    """Convert outcome files and concatenate them into output_file.
+
+    The output is a CSV outcome file if its name ends with .csv, and a
+    compact outcome file otherwise. The input files can be in either format.
+    """
+    lines = itertools.chain.from_iterable(map(read_outcome_lines,
+                                              outcome_files))
+    if output_file.endswith('.csv'):
+        with open(output_file, 'w', encoding='utf-8') as output:
+            output.writelines(lines)
+    else:
+        with CompactOutcomeWriter(output_file) as writer:
+            writer.write_lines(lines)
+
+def read_outcome_table(outcome_file):
+    """Parse an outcome file and return an OutcomeTable."""
+    table = OutcomeTable()
+    add_outcome_file(table, outcome_file)
+    return table
+
+def outcome_file_chunks(outcome_file, chunk_size=OUTCOME_CHUNK_SIZE):
+    """Split an outcome file into chunks of whole lines.
+
+    Return a list of (file name, start offset, end offset) tuples.
+    """
+    size = os.path.getsize(outcome_file)
+    chunks = []
+    start = 0
+    with open(outcome_file, 'rb') as input_file:
+        while start < size:
+            input_file.seek(min(start + chunk_size, size))
+            input_file.readline()
+            end = min(input_file.tell(), size)
+            chunks.append((outcome_file, start, end))
+            start = end
+    return chunks
+
+def read_outcome_chunk(chunk):
+    """Parse a chunk from outcome_file_chunks() and return an OutcomeTable.
+
+    A chunk with no offsets is a whole outcome file.
+    """
+    outcome_file, start, end = chunk
+    if start is None:
+        return read_outcome_table(outcome_file)
+    with open(outcome_file, 'rb') as input_file:
+        input_file.seek(start)
+        data = input_file.read(end - start)
+    table = OutcomeTable()
+    table.add_lines(io.StringIO(data.decode('utf-8')))
+    return table
+
+def read_outcome_files(outcome_files, jobs=1):
+    """Parse outcome files and return an OutcomeTable of all their outcomes.
+
+    With jobs > 1, chunks of the files are parsed concurrently by a pool of
+    worker processes, and the tables of the chunks are merged in file order.
+    0 means one worker per CPU. Compact outcome files cannot be split into
+    chunks, so each of them is parsed by a single worker.
+    """
+    if jobs == 0:
+        jobs = multiprocessing.cpu_count()
+    if jobs <= 1:
+        table = OutcomeTable()
+        for outcome_file in outcome_files:
+            add_outcome_file(table, outcome_file)
+        return table
+    chunks = [chunk
+              for outcome_file in outcome_files
+              for chunk in (outcome_file_chunks(outcome_file)
+                            if not is_compact_outcome_file(outcome_file)
+                            else [(outcome_file, None, None)])]
+    table = OutcomeTable()
+    with multiprocessing.Pool(min(jobs, max(len(chunks), 1))) as pool:
+        for chunk_table in pool.imap(read_outcome_chunk, chunks):
+            table.extend(chunk_table)
+    return table
+
 def read_outcome_file(outcome_file):
     """Parse an outcome file and return an outcome collection.
 
@@ -94,32 +652,52 @@ An outcome collection is a dictionary mapping keys to TestCaseOutcomes objects.
 The keys are the test suite name and the test case description, separated
 by a semicolon.
 """
-    outcomes = {}
-    with open(outcome_file, 'r', encoding='utf-8') as input_file:
-        for line in input_file:
-            (platform, config, suite, case, result, _cause) = line.split(';')
-            key = ';'.join([suite, case])
-            setup = ';'.join([platform, config])
-            if key not in outcomes:
-                outcomes[key] = TestCaseOutcomes()
-            if result == 'PASS':
-                outcomes[key].successes.append(setup)
-            elif result == 'FAIL':
-                outcomes[key].failures.append(setup)
-    return outcomes
+    return read_outcome_table(outcome_file).to_outcomes()
 
 def analyze_outcome_file(outcome_file):
     """Analyze the given outcome file."""
-    outcomes = read_outcome_file(outcome_file)
+    outcomes = read_outcome_table(outcome_file)
     return analyze_outcomes(outcomes)
 
+def analyze_outcome_files(outcome_files, jobs=1, catalog_file=None):
+    """Analyze the combined outcomes of the given outcome files.
+
+    See read_outcome_files() for the jobs parameter and
+    collect_available_test_cases() for the catalog_file parameter.
+    """
+    outcomes = read_outcome_files(outcome_files, jobs)
+    return analyze_outcomes(outcomes, catalog_file)
+
 def main():
     try:
         parser = argparse.ArgumentParser(description=__doc__)
-        parser.add_argument('outcomes', metavar='OUTCOMES.CSV',
-                            help='Outcome file to analyze')
+        parser.add_argument('outcomes', metavar='OUTCOMES.CSV', nargs='+',
+                            help='Outcome file to analyze, in CSV or'
+                            ' compact format. The outcomes of several'
+                            ' files, e.g. from different CI nodes, are'
+                            ' analyzed together.')
+        parser.add_argument('--jobs', '-j', type=int, default=1,
+                            help='Number of processes reading the outcome'
+                            ' files concurrently. 0 means one per CPU.'
+                            ' Default: 1.')
+        parser.add_argument('--catalog', metavar='CATALOG_FILE',
+                            help='Catalog of the available test cases.'
+                            ' Only the test files that changed since they'
+                            ' were recorded in CATALOG_FILE are read, and'
+                            ' the catalog is updated.')
+        parser.add_argument('--convert-to', metavar='OUTPUT_FILE',
+                            help='Instead of analyzing the outcome files,'
+                            ' concatenate them into OUTPUT_FILE, in CSV'
+                            ' format if its name ends with .csv and in the'
+                            ' smaller compact format otherwise.')
         options = parser.parse_args()
-        results = analyze_outcome_file(options.outcomes)
+        if options.jobs < 0:
+            parser.error('--jobs must not be negative')
+        if options.convert_to:
+            convert_outcome_files(options.outcomes, options.convert_to)
+            return
+        results = analyze_outcome_files(options.outcomes, options.jobs,
+                                        options.catalog)
         if results.error_count > 0:
             sys.exit(1)
     except Exception: # pylint: disable=broad-except
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""Benchmark the test suite code generator generate_test_code.py.
+
+Each benchmark times one stage of the generator on real or synthetic
+inputs and prints the best time over several repetitions. Where relevant,
+the benchmark also times a straightforward reference implementation of
+the same stage, to show the effect of the optimizations in the generator.
+"""
+
+# Copyright The Mbed TLS Contributors
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import functools
+import io
+import os
+import re
+import shutil
+import string
+import sys
+import tempfile
+import timeit
+import tracemalloc
+
+import generate_test_code
+from generate_test_code import FileWrapper
+
+SUITES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          os.pardir, 'suites')
+
+
+def best_time(func, repeat):
+    """Return the best wall clock time of func() over repeat runs."""
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def report(name, seconds, reference=None):
+    """Print a benchmark result, with the speedup over a reference time."""
+    line = '{:<40} {:10.2f} ms'.format(name, seconds * 1000)
+    if reference is not None:
+        line += '  ({:.1f}x)'.format(reference / seconds)
+    print(line)
+
+
+def classify_lines_reference(lines):
+    """Classify .function lines with one regex search per line type."""
+    patterns = [generate_test_code.BEGIN_HEADER_REGEX,
+                generate_test_code.BEGIN_SUITE_HELPERS_REGEX,
+                generate_test_code.BEGIN_DEP_REGEX,
+                generate_test_code.BEGIN_CASE_REGEX,
+                generate_test_code.END_CASE_REGEX]
+    for line in lines:
+        for pattern in patterns:
+            if re.search(pattern, line):
+                break
+
+
+def classify_lines(lines):
+    """Classify .function lines with the generator's tokenizer."""
+    for line in lines:
+        generate_test_code.classify_function_line(line)
+
+
+def benchmark_functions(options):
+    """Benchmark the parsing of a .function file."""
+    funcs_file = options.functions_file or \
+        os.path.join(SUITES_DIR, 'test_suite_psa_crypto.function')
+    with open(funcs_file) as funcs_f:
+        lines = funcs_f.readlines()
+    print('{}: {} lines'.format(funcs_file, len(lines)))
+    reference = best_time(lambda: classify_lines_reference(lines),
+                          options.repeat)
+    report('line classification (reference)', reference)
+    report('line classification',
+           best_time(lambda: classify_lines(lines), options.repeat),
+           reference)
+
+    def parse():
+        with FileWrapper(funcs_file) as funcs_f:
+            generate_test_code.parse_functions(funcs_f)
+    report('parse_functions()', best_time(parse, options.repeat))
+
+
+class LineReader(object):
+    """In-memory stand-in for generate_test_code.FileWrapper.
+
+    This keeps file I/O out of benchmarks of the parsing code.
+    """
+
+    def __init__(self, name, lines):
+        self.name = name
+        self.line_no = 0
+        self._lines = iter(lines)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = next(self._lines)
+        self.line_no += 1
+        return line
+
+
+def synthetic_function_file(size):
+    """Return the lines of a synthetic .function file of about size lines.
+
+    A tenth of the file is a header block, the rest is split evenly
+    between one very long test function and many short ones, so that
+    every accumulation path of the parser gets a large input.
+    """
+    lines = ['/* BEGIN_HEADER */\n']
+    lines += ['#define HELPER_%d %d\n' % (i, i) for i in range(size // 10)]
+    lines += ['/* END_HEADER */\n',
+              '/* BEGIN_CASE */\n',
+              'void long_function( int x )\n',
+              '{\n']
+    lines += ['    x += %d;\n' % i for i in range(size * 9 // 20)]
+    lines += ['}\n', '/* END_CASE */\n']
+    for i in range(size * 9 // 20 // 10):
+        lines += ['/* BEGIN_CASE */\n',
+                  'void short_function_%d( int x, char * s )\n' % i,
+                  '{\n']
+        lines += ['    x += %d;\n' % j for j in range(5)]
+        lines += ['}\n', '/* END_CASE */\n']
+    return lines
+
+
+def benchmark_scaling(options):
+    """Check that parse_functions() scales linearly with the input size."""
+    sizes = [options.lines // 4, options.lines // 2, options.lines]
+    for size in sizes:
+        lines = synthetic_function_file(size)
+        seconds = best_time(
+            lambda lines=lines: generate_test_code.parse_functions(
+                LineReader('synthetic.function', lines)),
+            options.repeat)
+        report('parse_functions() {} lines'.format(len(lines)), seconds)
+        print('{:<40} {:10.2f} us/line'.format('',
+                                                seconds * 1e6 / len(lines)))
+
+
+def intern_reference(values):
+    """Intern values in a list, looking up identifiers with list.index()."""
+    unique_values = []
+    for value in values:
+        if value not in unique_values:
+            unique_values.append(value)
+        unique_values.index(value)
+
+
+def intern_values(values):
+    """Intern values with the generator's InternTable."""
+    table = generate_test_code.InternTable()
+    for value in values:
+        table.add(value)
+
+
+def benchmark_interning(options):
+    """Benchmark the interning of expressions and dependencies."""
+    sizes = [options.lines // 40, options.lines // 20, options.lines // 10]
+    for size in sizes:
+        # Each value appears twice, as in .data files where expressions
+        # and dependencies are shared by several test cases.
+        values = ['MACRO_%d' % (i % size) for i in range(2 * size)]
+        reference = best_time(lambda values=values: intern_reference(values),
+                              1)
+        report('interning {} values (reference)'.format(size), reference)
+        report('interning {} values'.format(size),
+               best_time(lambda values=values: intern_values(values),
+                         options.repeat),
+               reference)
+
+
+def write_synthetic_data_file(data_file, cases):
+    """Write a synthetic .data file with the given number of test cases.
+
+    Test cases cycle through a fixed set of dependencies and expressions,
+    like NIST CAVP vectors converted to .data files, so the size of the
+    generated code doesn't depend on the number of cases.
+    """
+    with open(data_file, 'w') as data_f:
+        for i in range(cases):
+            data_f.write('Test vector #{0}\n'
+                         'depends_on:DEP_{1}\n'
+                         'func:MACRO_{2}:"{0:064x}"\n\n'
+                         .format(i, i % 100, i % 1000))
+
+
+def benchmark_memory(options):
+    """Check that .data processing runs in bounded memory."""
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        data_file = os.path.join(tmp_dir, 'test_suite_synthetic.data')
+        out_data_file = os.path.join(tmp_dir, 'test_suite_synthetic.datax')
+        func_info = {'test_func': (0, ('int', 'data_t *'))}
+        for cases in [options.lines // 4, options.lines // 2, options.lines]:
+            write_synthetic_data_file(data_file, cases)
+            snippets = {}
+            tracemalloc.start()
+            try:
+                generate_test_code.generate_intermediate_data_file(
+                    data_file, out_data_file,
+                    generate_test_code.FunctionFileInfo([], func_info),
+                    snippets)
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+                for snippet in snippets.values():
+                    snippet.close()
+            print('{:<40} {:10.1f} MB  (peak {:.1f} MB)'.format(
+                '{} test cases'.format(cases),
+                os.path.getsize(data_file) / 1e6, peak / 1e6))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+class FileIOWrapperReference(io.FileIO):
+    """Unbuffered line reader that FileWrapper used to be."""
+
+    def __init__(self, file_name):
+        super().__init__(file_name, 'r')
+        self.line_no = 0
+
+    def __next__(self):
+        line = super().__next__()
+        self.line_no += 1
+        return line.decode(sys.getdefaultencoding()).rstrip() + '\n'
+
+
+def read_lines(funcs_f):
+    """Read all lines of a file object as the generator does."""
+    with funcs_f:
+        for _ in funcs_f:
+            pass
+
+
+def benchmark_files(options):
+    """Benchmark reading the largest .data files with FileWrapper."""
+    data_files = sorted((os.path.join(SUITES_DIR, name)
+                         for name in os.listdir(SUITES_DIR)
+                         if name.endswith('.data')),
+                        key=os.path.getsize, reverse=True)[:3]
+    for data_file in data_files:
+        name = os.path.basename(data_file)
+        reference = best_time(
+            lambda data_file=data_file: read_lines(
+                FileIOWrapperReference(data_file)),
+            options.repeat)
+        report('{} (reference)'.format(name), reference)
+        report(name,
+               best_time(lambda data_file=data_file: read_lines(
+                   FileWrapper(data_file)), options.repeat),
+               reference)
+        with FileIOWrapperReference(data_file) as reference_f, \
+             FileWrapper(data_file) as data_f:
+            assert list(reference_f) == list(data_f)
+
+
+def render_template_reference(template, snippets, out_f):
+    """Render a template with one string.Template per line."""
+    for line_no, line in enumerate(template.splitlines(True), 1):
+        snippets['line_no'] = line_no + 1
+        out_f.write(string.Template(line).substitute(**snippets))
+
+
+def render_reference(template, snippets):
+    """Render a template with render_template_reference() to a string."""
+    out_f = io.StringIO()
+    render_template_reference(template, dict(snippets), out_f)
+    return out_f.getvalue()
+
+
+def render(template, snippets):
+    """Compile and render a template as the generator does, to a string."""
+    out_f = io.StringIO()
+    generate_test_code.render_template(
+        generate_test_code.compile_template(template), snippets, out_f)
+    return out_f.getvalue()
+
+
+def benchmark_template(options):
+    """Benchmark the rendering of the C files of the largest suites."""
+    data_files = sorted((os.path.join(SUITES_DIR, name)
+                         for name in os.listdir(SUITES_DIR)
+                         if name.endswith('.data')),
+                        key=os.path.getsize, reverse=True)[:3]
+    template_file = os.path.join(SUITES_DIR, 'main_test.function')
+    for data_file in data_files:
+        snippets = {'generator_script': 'generate_test_code.py',
+                    'shared_dependencies': '',
+                    'dep_check_table': '', 'expression_table': ''}
+        generate_test_code.read_code_from_input_files(
+            os.path.join(SUITES_DIR, 'host_test.function'),
+            os.path.join(SUITES_DIR, 'helpers.function'),
+            'test_suite.datax', snippets)
+        generate_test_code.add_input_info(
+            generate_test_code.get_functions_file(data_file, SUITES_DIR),
+            data_file, template_file, 'test_suite.c', snippets)
+        generate_test_code.parse_function_file(snippets['test_case_file'],
+                                               snippets)
+        # Render the check code from memory, like the reference does
+        snippets['dep_check_code'] = 'case 0: break;\n' * 100
+        snippets['expression_code'] = 'case 0: break;\n' * 100
+        with open(template_file) as template_f:
+            template = template_f.read()
+        name = os.path.basename(data_file)
+        reference = best_time(
+            functools.partial(render_reference, template, snippets),
+            options.repeat)
+        report('{} (reference)'.format(name), reference)
+        report(name,
+               best_time(functools.partial(render, template, snippets),
+                         options.repeat),
+               reference)
+        assert render(template, snippets) == \
+            render_reference(template, snippets)
+
+
+BENCHMARKS = {
+    'files': benchmark_files,
+    'functions': benchmark_functions,
+    'memory': benchmark_memory,
+    'interning': benchmark_interning,
+    'scaling': benchmark_scaling,
+    'template': benchmark_template,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', '-r', type=int, default=5,
+                        help='Number of repetitions of each benchmark'
+                        ' (default: 5)')
+    parser.add_argument('--functions-file', '-f', metavar='FILE',
+                        help='.function file to benchmark'
+                        ' (default: test_suite_psa_crypto.function)')
+    parser.add_argument('--lines', '-l', type=int, default=100000,
+                        help='Size of the largest synthetic input'
+                        ' (default: 100000)')
+    parser.add_argument('benchmarks', metavar='BENCHMARK', nargs='*',
+                        help='Benchmarks to run: {} (default: all)'
+                        .format(', '.join(sorted(BENCHMARKS))))
+    options = parser.parse_args()
+    for name in options.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error('unknown benchmark: ' + name)
+    for name in options.benchmarks or sorted(BENCHMARKS):
+        BENCHMARKS[name](options)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -23,6 +23,7 @@ independently of the checks.
 
 import argparse
 import glob
+import json
 import os
 import re
 import sys
@@ -123,16 +124,122 @@ state may override this method.
         directories = [tests_dir]
         return directories
 
-    def walk_all(self):
-        """Iterate over all named test cases."""
+    def collect_test_files(self):
+        """Get the files containing named test cases.
+
+Return a list of (file name, walk method) pairs.
+"""
+        test_files = []
         test_directories = self.collect_test_directories()
         for directory in test_directories:
             for data_file_name in glob.glob(os.path.join(directory, 'suites',
                                                          '*.data')):
-                self.walk_test_suite(data_file_name)
+                test_files.append((data_file_name, self.walk_test_suite))
             ssl_opt_sh = os.path.join(directory, 'ssl-opt.sh')
             if os.path.exists(ssl_opt_sh):
-                self.walk_ssl_opt_sh(ssl_opt_sh)
+                test_files.append((ssl_opt_sh, self.walk_ssl_opt_sh))
+        return test_files
+
+    def walk_all(self):
+        """Iterate over all named test cases."""
+        for file_name, walk in self.collect_test_files():
+            walk(file_name)
+
+class TestCaseCatalog(TestDescriptionExplorer):
+    """A persistent catalog of the named test cases.
+
+The catalog records the test cases of each file with the modification time
+and size of the file. update() only walks the files that changed since the
+catalog was saved, and replay() feeds the recorded test cases to another
+explorer, as if it walked all the files itself.
+"""
+
+    # Catalog file format version, to ignore catalogs saved by an
+    # incompatible version of this script.
+    VERSION = 1
+
+    def __init__(self, catalog_file):
+        """Load the catalog from catalog_file, if it exists and is valid."""
+        self.catalog_file = catalog_file
+        # Dictionary mapping file names to a dictionary with the 'mtime' and
+        # 'size' of the file and the list of its test cases as
+        # [line number, description] pairs. Descriptions are decoded as
+        # Latin-1 so that they can be saved as JSON and encoded back to the
+        # original bytes.
+        self.files = {}
+        # Test cases of the file being walked
+        self.file_test_cases = []
+        try:
+            with open(catalog_file, 'r', encoding='utf-8') as input_file:
+                catalog = json.load(input_file)
+            if catalog.get('version') == self.VERSION:
+                self.files = catalog['files']
+        except (OSError, ValueError, KeyError):
+            # No valid catalog: all files will be walked.
+            pass
+
+    def new_per_file_state(self):
+        """List of the [line number, description] pairs of the file."""
+        self.file_test_cases = []
+        return self.file_test_cases
+
+    def process_test_case(self, per_file_state,
+                          file_name, line_number, description):
+        """Record a test case."""
+        per_file_state.append([line_number, description.decode('latin-1')])
+
+    def update(self):
+        """Walk the files that changed since the catalog was saved.
+
+Return True if the catalog changed.
+"""
+        changed = False
+        files = {}
+        for file_name, walk in self.collect_test_files():
+            stat = os.stat(file_name)
+            record = self.files.get(file_name)
+            if record is None or \
+               record['mtime'] != stat.st_mtime_ns or \
+               record['size'] != stat.st_size:
+                walk(file_name)
+                record = {'mtime': stat.st_mtime_ns,
+                          'size': stat.st_size,
+                          'test_cases': self.file_test_cases}
+                changed = True
+            files[file_name] = record
+        if set(files) != set(self.files):
+            changed = True
+        # Keep the files in walk order, so that replay() processes them
+        # in the same order as walk_all().
+        self.files = files
+        return changed
+
+    def save(self):
+        """Save the catalog, replacing the catalog file atomically."""
+        tmp_file = '{}.{}.tmp'.format(self.catalog_file, os.getpid())
+        with open(tmp_file, 'w', encoding='utf-8') as output_file:
+            json.dump({'version': self.VERSION, 'files': self.files},
+                      output_file)
+        os.replace(tmp_file, self.catalog_file)
+
+    def replay(self, explorer):
+        """Feed the recorded test cases to another explorer."""
+        for file_name in self.files:
+            per_file_state = explorer.new_per_file_state()
+            for line_number, description in self.files[file_name]['test_cases']:
+                explorer.process_test_case(per_file_state,
+                                           file_name, line_number,
+                                           description.encode('latin-1'))
+
+def walk_all_with_catalog(explorer, catalog_file):
+    """Iterate over all named test cases, using a persistent catalog.
+
+Only the files that changed since the catalog file was saved are walked.
+"""
+    catalog = TestCaseCatalog(catalog_file)
+    if catalog.update():
+        catalog.save()
+    catalog.replay(explorer)
 
 class DescriptionChecker(TestDescriptionExplorer):
     """Check all test case descriptions.
@@ -179,10 +286,16 @@ def main():
     parser.add_argument('--verbose', '-v',
                         action='store_false', dest='quiet',
                         help='Show warnings (default: on; undoes --quiet)')
+    parser.add_argument('--catalog', metavar='CATALOG_FILE',
+                        help='Only read the test files that changed since'
+                        ' they were recorded in CATALOG_FILE, and update it')
     options = parser.parse_args()
     results = Results(options)
     checker = DescriptionChecker(results)
-    checker.walk_all()
+    if options.catalog:
+        walk_all_with_catalog(checker, options.catalog)
+    else:
+        checker.walk_all()
     if (results.warnings or results.errors) and not options.quiet:
         sys.stderr.write('{}: {} errors, {} warnings\n'
                          .format(sys.argv[0], results.errors, results.warnings))
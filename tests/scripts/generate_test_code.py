@@ -150,6 +150,17 @@ $dep_check_code             <-- This script enumerates all
                                 code to handle enumerated build
                                 dependency Id and return status: if
                                 the dependency is defined or not.
+$expression_table           <-- With --check-code-format table, the
+                                expression value table that replaces
+                                the $expression_code cases.
+$dep_check_table            <-- With --check-code-format table, the
+                                dependency bitmap that replaces the
+                                $dep_check_code cases.
+$shared_dependencies        <-- With --shared-deps, includes the
+                                declaration of the dependency table
+                                shared by all test suites, whose
+                                dependencies are left out of
+                                $dep_check_code.
 $dispatch_code              <-- This script enumerates the functions
                                 specified in the input test data file
                                 and generates the initializer for the
@@ -160,13 +171,27 @@ $platform_code              <-- Platform specific setup and test
 
 """
 
+# pylint: disable=too-many-lines
 
 import io
 import os
+import json
+import time
 import re
 import sys
+import shutil
 import string
+import struct
+import binascii
+import filecmp
+import hashlib
+import heapq
+import operator
 import argparse
+import tempfile
+import contextlib
+import collections
+import multiprocessing
 
 
 BEGIN_HEADER_REGEX = r'/\*\s*BEGIN_HEADER\s*\*/'
@@ -195,6 +220,183 @@ CHAR_CHECK_REGEX = r'char\s*\*\s*.*'
 DATA_T_CHECK_REGEX = r'data_t\s*\*\s*.*'
 FUNCTION_ARG_LIST_END_REGEX = r'.*\)'
 EXIT_LABEL_REGEX = r'^exit:'
+INT_LITERAL_REGEX = r'(\d+|0x[0-9a-f]+)$'
+
+# Precompiled patterns for the regular expressions matched against
+# every line of the input files.
+END_DEP_PATTERN = re.compile(END_DEP_REGEX)
+BEGIN_CASE_PATTERN = re.compile(BEGIN_CASE_REGEX)
+END_CASE_PATTERN = re.compile(END_CASE_REGEX)
+DEPENDENCY_PATTERN = re.compile(DEPENDENCY_REGEX)
+CONDITION_PATTERN = re.compile(CONDITION_REGEX, re.I)
+TEST_FUNCTION_VALIDATION_PATTERN = re.compile(TEST_FUNCTION_VALIDATION_REGEX,
+                                              re.I)
+INT_CHECK_PATTERN = re.compile(INT_CHECK_REGEX)
+CHAR_CHECK_PATTERN = re.compile(CHAR_CHECK_REGEX)
+DATA_T_CHECK_PATTERN = re.compile(DATA_T_CHECK_REGEX)
+FUNCTION_ARG_LIST_END_PATTERN = re.compile(FUNCTION_ARG_LIST_END_REGEX)
+EXIT_LABEL_PATTERN = re.compile(EXIT_LABEL_REGEX)
+INT_LITERAL_PATTERN = re.compile(INT_LITERAL_REGEX, re.I)
+
+# Line types of a .function file, see classify_function_line()
+LINE_BEGIN_HEADER = 'begin_header'
+LINE_END_HEADER = 'end_header'
+LINE_BEGIN_SUITE_HELPERS = 'begin_suite_helpers'
+LINE_END_SUITE_HELPERS = 'end_suite_helpers'
+LINE_BEGIN_DEPENDENCIES = 'begin_dependencies'
+LINE_END_DEPENDENCIES = 'end_dependencies'
+LINE_BEGIN_CASE = 'begin_case'
+LINE_END_CASE = 'end_case'
+LINE_CODE = 'code'
+
+# Single pattern classifying the special lines of a .function file.
+# The name of the matching alternative is the line type.
+FUNCTION_LINE_PATTERN = re.compile('|'.join(
+    '(?P<%s>%s)' % (line_type, regex) for line_type, regex in [
+        (LINE_BEGIN_HEADER, BEGIN_HEADER_REGEX),
+        (LINE_END_HEADER, END_HEADER_REGEX),
+        (LINE_BEGIN_SUITE_HELPERS, BEGIN_SUITE_HELPERS_REGEX),
+        (LINE_END_SUITE_HELPERS, END_SUITE_HELPERS_REGEX),
+        (LINE_BEGIN_DEPENDENCIES, BEGIN_DEP_REGEX),
+        (LINE_END_DEPENDENCIES, END_DEP_REGEX),
+        (LINE_BEGIN_CASE, BEGIN_CASE_REGEX),
+        (LINE_END_CASE, END_CASE_REGEX),
+    ]))
+
+# Source of this script. Part of the generation cache key, so that
+# changing the generator invalidates the cached outputs.
+GENERATOR_SOURCE_FILE = os.path.splitext(os.path.abspath(__file__))[0] + '.py'
+
+# Size of the chunks read from the input files by FileWrapper
+READ_BUFFER_SIZE = 256 * 1024
+
+# Template placeholder of the line number of the next template line, for
+# #line directives. It is resolved when the template is compiled, see
+# compile_template().
+LINE_NO_PLACEHOLDER = 'line_no'
+
+# Size above which the dependency and expression check code spools
+# move from memory to a temporary file.
+CODE_SPOOL_MAX_SIZE = 1024 * 1024
+
+# Intermediate data file formats. The text format is line based and
+# readable by all platforms. The binary format, for host_test.function
+# only, holds length-prefixed records with pre-converted parameters,
+# after an index of the records that allows random access to the test
+# cases of a memory-mapped file:
+#
+#   magic       DATAX_BINARY_MAGIC
+#   u32         record count
+#   u32...      offset of each record from the start of the file
+#   record...   u32 record size, then the record:
+#       u32 name size, name with terminating NUL
+#       u32 dependency count, u32 dependency ids
+#       u32 function id
+#       u32 parameter count, then for each parameter a type byte and:
+#           'i' (int)   i32 value
+#           'e' (exp)   u32 expression id
+#           's' (char*) u32 size, string with terminating NUL
+#           'h' (hex)   u32 size, decoded bytes
+#
+# All integers are little-endian.
+DATAX_TEXT = 'text'
+DATAX_BINARY = 'binary'
+DATAX_FORMATS = (DATAX_TEXT, DATAX_BINARY)
+DATAX_BINARY_MAGIC = b'\x7fDATAX\x01\n'
+# Must match DATAX_RECORD_MAX_SIZE in host_test.function
+DATAX_RECORD_MAX_SIZE = 16384
+# Size above which the records of a binary intermediate data file move
+# from memory to a temporary file until the index is written
+RECORD_SPOOL_MAX_SIZE = 16 * 1024 * 1024
+
+# Formats of the dependency and expression check code. The switch format
+# checks each identifier in a case of the dep_check() and get_expression()
+# switch statements. The table format computes the checks in a dependency
+# bitmap and an expression value table instead, which compile faster and
+# are looked up in constant time.
+CHECK_CODE_SWITCH = 'switch'
+CHECK_CODE_TABLE = 'table'
+CHECK_CODE_FORMATS = (CHECK_CODE_SWITCH, CHECK_CODE_TABLE)
+
+# Suffix of the test case index written next to an intermediate data
+# file. Each line of the index describes a test case as
+# "<offset> <function id> <name>", where offset is the position of the
+# test case in the intermediate data file. Must match host_test.function.
+DATAX_INDEX_SUFFIX = '.index'
+
+# Name of a shard of an intermediate data file, from the intermediate
+# data file name without its extension, the shard number and the
+# extension. Each shard is a complete intermediate data file, which the
+# test suite built from the common C file can run on its own.
+DATAX_SHARD_FORMAT = '%s.shard%d%s'
+
+# Field separator of the test duration hints file, as in outcome files.
+# Each line of the file is "<test suite>;<test case>;<duration in s>".
+DURATION_HINTS_SEPARATOR = ';'
+
+# Entry of the dependency table shared by all test suites, see
+# gen_shared_dependencies_table(). The comment of each entry gives its
+# identifier and dependency, so that the table can be read back and
+# extended without renumbering the existing dependencies.
+SHARED_DEPENDENCY_PATTERN = re.compile(r'    /\* (\d+): (.*) \*/$')
+
+# Macro definition in a functions file, see collect_defined_macros()
+MACRO_DEFINITION_PATTERN = re.compile(r'\s*#\s*define\s+(\w+)')
+
+# Escape sequences in .data string parameters, replaced by the test code
+ESCAPED_CHAR_PATTERN = re.compile(r'\\([n:?])')
+
+# Directory of scripts/config.py, which reads the configuration that
+# test cases are checked against to drop the unreachable ones.
+# See load_config().
+CONFIG_SCRIPTS_DIR = os.path.join(os.path.dirname(GENERATOR_SOURCE_FILE),
+                                  os.pardir, os.pardir, 'scripts')
+
+# Configuration file that decides which dependencies go into the shared
+# dependency table when --config isn't given.
+# See update_shared_dependencies().
+DEFAULT_CONFIG_FILE = os.path.join(os.path.dirname(GENERATOR_SOURCE_FILE),
+                                   os.pardir, os.pardir, 'include', 'mbedtls',
+                                   'config.h')
+
+# Comparison operators of dependency conditions, see CONDITION_REGEX
+CONDITION_OPERATORS = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+# generate_code() parameters that don't affect the generated output
+# and are left out of the generation cache key.
+CACHE_KEY_IGNORED_PARAMS = ('input_cache', 'cache_dir', 'write_if_changed',
+                            'profile_file')
+
+# generate_code() parameters that only affect the generated C file and are
+# left out of the intermediate data cache key. See get_data_cache_key().
+DATA_CACHE_KEY_IGNORED_PARAMS = CACHE_KEY_IGNORED_PARAMS + (
+    'funcs_file', 'template_file', 'platform_file', 'helpers_file',
+    'suites_dir', 'c_file', 'shared_deps_file')
+
+# Snippets of the dependency and expression check code, which are
+# generated with the intermediate data file.
+CHECK_CODE_SNIPPETS = ('dep_check_code', 'expression_code',
+                       'dep_check_table', 'expression_table')
+
+# Generation phases timed with --profile, in the order they run
+PROFILE_PHASES = ('read_code_from_input_files', 'parse_function_file',
+                  'generate_intermediate_data_file', 'write_test_source_file')
+
+# Wall and CPU clocks of the generation profile. time.perf_counter() and
+# time.process_time() are only available in Python 3.
+if hasattr(time, 'perf_counter'):
+    WALL_CLOCK = time.perf_counter
+    CPU_CLOCK = time.process_time
+else:
+    WALL_CLOCK = time.time
+    CPU_CLOCK = time.clock  # pylint: disable=no-member
 
 
 class GeneratorInputError(Exception):
@@ -206,43 +408,51 @@ class GeneratorInputError(Exception):
     pass
 
 
-class FileWrapper(io.FileIO):
+class FileWrapper(object):
     """
-    This class extends built-in io.FileIO class with attribute line_no,
-    that indicates line number for the line that is read.
+    Buffered UTF-8 text file reader with attribute line_no, that
+    indicates line number for the line that is read.
+
+    Lines are split on line feeds only. Each line is returned with
+    trailing whitespace stripped and terminated with a single line feed.
     """
 
-    def __init__(self, file_name):
+    def __init__(self, file_name, buffer_size=READ_BUFFER_SIZE):
         """
-        Instantiate the base class and initialize the line number to 0.
+        Open the file and initialize the line number to 0.
 
         :param file_name: File path to open.
+        :param buffer_size: Size of the chunks read from the file.
         """
-        super(FileWrapper, self).__init__(file_name, 'r')
+        self.name = file_name
+        self._file = io.open(file_name, 'r', buffer_size,
+                             encoding='utf-8', newline='\n')
         self._line_no = 0
 
-    def next(self):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __iter__(self):
+        return self
+
+    def close(self):
+        """
+        Close the underlying file.
         """
-        Python 2 iterator method. This method overrides base class's
-        next method and extends the next method to count the line
-        numbers as each line is read.
+        self._file.close()
 
-        It works for both Python 2 and Python 3 by checking iterator
-        method name in the base iterator object.
+    def next(self):
+        """
+        Python 2 iterator method. Reads the next line and counts it.
 
         :return: Line read from file.
         """
-        parent = super(FileWrapper, self)
-        if hasattr(parent, '__next__'):
-            line = parent.__next__()  # Python 3
-        else:
-            line = parent.next()  # Python 2 # pylint: disable=no-member
-        if line is not None:
-            self._line_no += 1
-            # Convert byte array to string with correct encoding and
-            # strip any whitespaces added in the decoding process.
-            return line.decode(sys.getdefaultencoding()).rstrip() + '\n'
-        return None
+        line = next(self._file)
+        self._line_no += 1
+        return line.rstrip() + '\n'
 
     # Python 3 iterator method
     __next__ = next
@@ -256,6 +466,69 @@ class FileWrapper(io.FileIO):
     line_no = property(get_line_no)
 
 
+class InternTable(object):
+    """
+    Table of unique values, each identified by its insertion index.
+
+    It is used to replace dependencies and expressions in the
+    intermediate data file with identifiers. Lookups go through a
+    dict, so interning is O(1) however many values the table holds.
+    The table compares equal to the list of its values.
+    """
+
+    def __init__(self, values=()):
+        """
+        Initialize the table, optionally with initial values.
+
+        :param values: Values to add in order.
+        """
+        self._ids = {}
+        self._values = []
+        for value in values:
+            self.add(value)
+
+    def add(self, value):
+        """
+        Add value to the table if it is not there yet.
+
+        :param value: Value to intern.
+        :return: Tuple of the value identifier and whether the value
+                 has been added by this call.
+        """
+        value_id = self._ids.get(value)
+        if value_id is not None:
+            return value_id, False
+        value_id = len(self._values)
+        self._ids[value] = value_id
+        self._values.append(value)
+        return value_id, True
+
+    def __contains__(self, value):
+        return value in self._ids
+
+    def __getitem__(self, value_id):
+        return self._values[value_id]
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __eq__(self, other):
+        if isinstance(other, InternTable):
+            other = other._values
+        return self._values == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'InternTable(%r)' % (self._values,)
+
+
 def split_dep(dep):
     """
     Split NOT character '!' from dependency. Used by gen_dependencies()
@@ -359,6 +632,37 @@ def gen_dispatch(name, dependencies):
     return dispatch_code
 
 
+def classify_function_line(line):
+    """
+    Classifies a line of a .function file with a single pattern match.
+
+    :param line: Line from .function file
+    :return: Line type (one of the LINE_xxx constants) and the match
+             object, or (LINE_CODE, None) for a plain code line.
+    """
+    # All special lines have a BEGIN_ or END_ marker. Checking for these
+    # substrings is much cheaper than a pattern search on code lines.
+    if 'BEGIN_' not in line and 'END_' not in line:
+        return LINE_CODE, None
+    match = FUNCTION_LINE_PATTERN.search(line)
+    if match is None:
+        return LINE_CODE, None
+    return match.lastgroup, match
+
+
+def tokenize_function_file(funcs_f):
+    """
+    Tokenizes a .function file: yields each line read from the file
+    object with its line type. The file object is read lazily, so the
+    caller may consume lines from it directly between tokens.
+
+    :param funcs_f: file object for .function file
+    :return: Generator that yields line type and line.
+    """
+    for line in funcs_f:
+        yield classify_function_line(line)[0], line
+
+
 def parse_until_pattern(funcs_f, end_regex):
     """
     Matches pattern end_regex to the lines read from the file object.
@@ -368,16 +672,17 @@ def parse_until_pattern(funcs_f, end_regex):
     :param end_regex: Pattern to stop parsing
     :return: Lines read before the end pattern
     """
-    headers = '#line %d "%s"\n' % (funcs_f.line_no + 1, funcs_f.name)
+    end_pattern = re.compile(end_regex)
+    headers = ['#line %d "%s"\n' % (funcs_f.line_no + 1, funcs_f.name)]
     for line in funcs_f:
-        if re.search(end_regex, line):
+        if end_pattern.search(line):
             break
-        headers += line
+        headers.append(line)
     else:
         raise GeneratorInputError("file: %s - end pattern [%s] not found!" %
                                   (funcs_f.name, end_regex))
 
-    return headers
+    return ''.join(headers)
 
 
 def validate_dependency(dependency):
@@ -387,7 +692,7 @@ def validate_dependency(dependency):
     :return: input dependency stripped of leading & trailing white spaces.
     """
     dependency = dependency.strip()
-    if not re.match(CONDITION_REGEX, dependency, re.I):
+    if not CONDITION_PATTERN.match(dependency):
         raise GeneratorInputError('Invalid dependency %s' % dependency)
     return dependency
 
@@ -416,14 +721,14 @@ def parse_suite_dependencies(funcs_f):
     """
     dependencies = []
     for line in funcs_f:
-        match = re.search(DEPENDENCY_REGEX, line.strip())
+        match = DEPENDENCY_PATTERN.search(line.strip())
         if match:
             try:
                 dependencies = parse_dependencies(match.group('dependencies'))
             except GeneratorInputError as error:
                 raise GeneratorInputError(
                     str(error) + " - %s:%d" % (funcs_f.name, funcs_f.line_no))
-        if re.search(END_DEP_REGEX, line):
+        if END_DEP_PATTERN.search(line):
             break
     else:
         raise GeneratorInputError("file: %s - end dependency pattern [%s]"
@@ -443,10 +748,10 @@ def parse_function_dependencies(line):
     :return: List of dependencies.
     """
     dependencies = []
-    match = re.search(BEGIN_CASE_REGEX, line)
+    match = BEGIN_CASE_PATTERN.search(line)
     dep_str = match.group('depends_on')
     if dep_str:
-        match = re.search(DEPENDENCY_REGEX, dep_str)
+        match = DEPENDENCY_PATTERN.search(dep_str)
         if match:
             dependencies += parse_dependencies(match.group('dependencies'))
 
@@ -478,13 +783,13 @@ def parse_function_arguments(line):
         arg = arg.strip()
         if arg == '':
             continue
-        if re.search(INT_CHECK_REGEX, arg.strip()):
+        if INT_CHECK_PATTERN.search(arg):
             args.append('int')
             args_dispatch.append('*( (int *) params[%d] )' % arg_idx)
-        elif re.search(CHAR_CHECK_REGEX, arg.strip()):
+        elif CHAR_CHECK_PATTERN.search(arg):
             args.append('char*')
             args_dispatch.append('(char *) params[%d]' % arg_idx)
-        elif re.search(DATA_T_CHECK_REGEX, arg.strip()):
+        elif DATA_T_CHECK_PATTERN.search(arg):
             args.append('hex')
             # create a structure
             pointer_initializer = '(uint8_t *) params[%d]' % arg_idx
@@ -540,49 +845,55 @@ def parse_function_code(funcs_f, dependencies, suite_dependencies):
     :return: Function name, arguments, function code and dispatch code.
     """
     line_directive = '#line %d "%s"\n' % (funcs_f.line_no + 1, funcs_f.name)
-    code = ''
+    # Code is collected as a list of lines and joined once, since
+    # repeated string concatenation is quadratic in the function size.
+    code = []
     has_exit_label = False
     for line in funcs_f:
         # Check function signature. Function signature may be split
         # across multiple lines. Here we try to find the start of
         # arguments list, then remove '\n's and apply the regex to
-        # detect function start.
-        up_to_arg_list_start = code + line[:line.find('(') + 1]
-        match = re.match(TEST_FUNCTION_VALIDATION_REGEX,
-                         up_to_arg_list_start.replace('\n', ' '), re.I)
+        # detect function start. The signature can only be complete
+        # on a line containing '(', so other lines are not checked.
+        if '(' not in line:
+            code.append(line)
+            continue
+        up_to_arg_list_start = ''.join(code) + line[:line.find('(') + 1]
+        match = TEST_FUNCTION_VALIDATION_PATTERN.match(
+            up_to_arg_list_start.replace('\n', ' '))
         if match:
             # check if we have full signature i.e. split in more lines
             name = match.group('func_name')
-            if not re.match(FUNCTION_ARG_LIST_END_REGEX, line):
+            if not FUNCTION_ARG_LIST_END_PATTERN.match(line):
                 for lin in funcs_f:
                     line += lin
-                    if re.search(FUNCTION_ARG_LIST_END_REGEX, line):
+                    if FUNCTION_ARG_LIST_END_PATTERN.search(line):
                         break
             args, local_vars, args_dispatch = parse_function_arguments(
                 line)
-            code += line
+            code.append(line)
             break
-        code += line
+        code.append(line)
     else:
         raise GeneratorInputError("file: %s - Test functions not found!" %
                                   funcs_f.name)
 
     # Prefix test function name with 'test_'
-    code = code.replace(name, 'test_' + name, 1)
+    code = [''.join(code).replace(name, 'test_' + name, 1)]
     name = 'test_' + name
 
     for line in funcs_f:
-        if re.search(END_CASE_REGEX, line):
+        if END_CASE_PATTERN.search(line):
             break
         if not has_exit_label:
             has_exit_label = \
-                re.search(EXIT_LABEL_REGEX, line.strip()) is not None
-        code += line
+                EXIT_LABEL_PATTERN.search(line.strip()) is not None
+        code.append(line)
     else:
         raise GeneratorInputError("file: %s - end case pattern [%s] not "
                                   "found!" % (funcs_f.name, END_CASE_REGEX))
 
-    code = line_directive + code
+    code = line_directive + ''.join(code)
     code = generate_function_code(name, code, local_vars, args_dispatch,
                                   dependencies)
     dispatch_code = gen_dispatch(name, suite_dependencies + dependencies)
@@ -599,21 +910,22 @@ def parse_functions(funcs_f):
              code, function code and a dict with function identifiers
              and arguments info.
     """
-    suite_helpers = ''
+    suite_helpers = []
     suite_dependencies = []
-    suite_functions = ''
+    suite_functions = []
     func_info = {}
     function_idx = 0
-    dispatch_code = ''
-    for line in funcs_f:
-        if re.search(BEGIN_HEADER_REGEX, line):
-            suite_helpers += parse_until_pattern(funcs_f, END_HEADER_REGEX)
-        elif re.search(BEGIN_SUITE_HELPERS_REGEX, line):
-            suite_helpers += parse_until_pattern(funcs_f,
-                                                 END_SUITE_HELPERS_REGEX)
-        elif re.search(BEGIN_DEP_REGEX, line):
+    dispatch_code = []
+    for line_type, line in tokenize_function_file(funcs_f):
+        if line_type == LINE_BEGIN_HEADER:
+            suite_helpers.append(parse_until_pattern(funcs_f,
+                                                     END_HEADER_REGEX))
+        elif line_type == LINE_BEGIN_SUITE_HELPERS:
+            suite_helpers.append(parse_until_pattern(funcs_f,
+                                                     END_SUITE_HELPERS_REGEX))
+        elif line_type == LINE_BEGIN_DEPENDENCIES:
             suite_dependencies += parse_suite_dependencies(funcs_f)
-        elif re.search(BEGIN_CASE_REGEX, line):
+        elif line_type == LINE_BEGIN_CASE:
             try:
                 dependencies = parse_function_dependencies(line)
             except GeneratorInputError as error:
@@ -622,20 +934,20 @@ def parse_functions(funcs_f):
                                    str(error)))
             func_name, args, func_code, func_dispatch =\
                 parse_function_code(funcs_f, dependencies, suite_dependencies)
-            suite_functions += func_code
+            suite_functions.append(func_code)
             # Generate dispatch code and enumeration info
             if func_name in func_info:
                 raise GeneratorInputError(
                     "file: %s - function %s re-declared at line %d" %
                     (funcs_f.name, func_name, funcs_f.line_no))
             func_info[func_name] = (function_idx, args)
-            dispatch_code += '/* Function Id: %d */\n' % function_idx
-            dispatch_code += func_dispatch
+            dispatch_code.append('/* Function Id: %d */\n' % function_idx)
+            dispatch_code.append(func_dispatch)
             function_idx += 1
 
-    func_code = (suite_helpers +
-                 suite_functions).join(gen_dependencies(suite_dependencies))
-    return suite_dependencies, dispatch_code, func_code, func_info
+    func_code = ''.join(suite_helpers + suite_functions).join(
+        gen_dependencies(suite_dependencies))
+    return suite_dependencies, ''.join(dispatch_code), func_code, func_info
 
 
 def escaped_split(inp_str, split_char):
@@ -698,7 +1010,7 @@ def parse_test_data(data_f):
             state = __state_read_args
         elif state == __state_read_args:
             # Check dependencies
-            match = re.search(DEPENDENCY_REGEX, line)
+            match = DEPENDENCY_PATTERN.search(line)
             if match:
                 try:
                     dependencies = parse_dependencies(
@@ -733,31 +1045,368 @@ def gen_dep_check(dep_id, dep):
     if dep_id < 0:
         raise GeneratorInputError("Dependency Id should be a positive "
                                   "integer.")
+    dep_check = '''
+        case {id}:
+            {{
+#if {condition}
+                ret = DEPENDENCY_SUPPORTED;
+#else
+                ret = DEPENDENCY_NOT_SUPPORTED;
+#endif
+            }}
+            break;'''.format(id=dep_id, condition=gen_dep_condition(dep))
+    return dep_check
+
+
+def gen_dep_condition(dep):
+    """
+    Generate the preprocessor condition that holds when a dependency
+    is met.
+
+    :param dep: Dependency macro
+    :return: Preprocessor condition
+    """
     _not, dep = ('!', dep[1:]) if dep[0] == '!' else ('', dep)
     if not dep:
         raise GeneratorInputError("Dependency should not be an empty string.")
 
-    dependency = re.match(CONDITION_REGEX, dep, re.I)
+    dependency = CONDITION_PATTERN.match(dep)
     if not dependency:
         raise GeneratorInputError('Invalid dependency %s' % dep)
 
     _defined = '' if dependency.group(2) else 'defined'
     _cond = dependency.group(2) if dependency.group(2) else ''
     _value = dependency.group(3) if dependency.group(3) else ''
+    return '{_not}{_defined}({macro}{_cond}{_value})'.format(
+        _not=_not, _defined=_defined, macro=dependency.group(1),
+        _cond=_cond, _value=_value)
 
-    dep_check = '''
-        case {id}:
-            {{
-#if {_not}{_defined}({macro}{_cond}{_value})
-                ret = DEPENDENCY_SUPPORTED;
+
+def get_dependency_macro(dep):
+    """
+    Returns the macro that a dependency checks.
+
+    :param dep: Dependency
+    :return: Macro name, or None if the dependency is invalid
+    """
+    dependency = CONDITION_PATTERN.match(split_dep(dep)[1])
+    return dependency.group(1) if dependency else None
+
+
+def get_shared_deps_header(table_file):
+    """
+    Returns the name of the header that declares the shared dependency
+    table defined in table_file.
+
+    :param table_file: Shared dependency table C file name
+    :return: Header file name
+    """
+    return os.path.splitext(table_file)[0] + '.h'
+
+
+def gen_shared_dependencies_header():
+    """
+    Generate the header that declares the dependency table shared by
+    all test suites. It doesn't depend on the table contents, so that
+    adding dependencies to the table doesn't make the test suites
+    recompile.
+
+    :return: Header contents
+    """
+    return '''/*
+ * *** THIS FILE HAS BEEN MACHINE GENERATED ***
+ *
+ * Declaration of the dependency table shared by all test suites, generated
+ * by {generator_script} --shared-deps.
+ */
+
+#ifndef MBEDTLS_TEST_SHARED_DEPENDENCIES_H
+#define MBEDTLS_TEST_SHARED_DEPENDENCIES_H
+
+#include <stddef.h>
+
+/* Whether each dependency is met, indexed by dependency identifier */
+extern const unsigned char mbedtls_test_shared_dependencies[];
+
+/* Number of dependencies in mbedtls_test_shared_dependencies */
+extern const size_t mbedtls_test_shared_dependency_count;
+
+#endif /* MBEDTLS_TEST_SHARED_DEPENDENCIES_H */
+'''.format(generator_script=os.path.basename(__file__))
+
+
+def gen_shared_dependencies_table(dependencies, header_name):
+    """
+    Generate the C file that defines the dependency table shared by all
+    test suites. It is compiled once and linked into every test suite.
+    Dependencies are identified by their index in the table, in all the
+    intermediate data files generated with it. Dependencies missing from
+    the table are still checked by the dep_check() switch of their test
+    suite.
+
+    :param dependencies: Dependencies in identifier order
+    :param header_name: Name of the header declaring the table, relative
+                        to the C file. See gen_shared_dependencies_header().
+    :return: C file contents
+    """
+    entries = []
+    for dep_id, dep in enumerate(dependencies):
+        entries.append('''    /* {id}: {dep} */
+#if {condition}
+    1,
 #else
-                ret = DEPENDENCY_NOT_SUPPORTED;
+    0,
 #endif
-            }}
-            break;'''.format(_not=_not, _defined=_defined,
-                             macro=dependency.group(1), id=dep_id,
-                             _cond=_cond, _value=_value)
-    return dep_check
+'''.format(id=dep_id, dep=dep, condition=gen_dep_condition(dep)))
+    return '''/*
+ * *** THIS FILE HAS BEEN MACHINE GENERATED ***
+ *
+ * Dependency table shared by all test suites, generated by
+ * {generator_script} --shared-deps.
+ */
+
+#include <test/helpers.h>
+
+#include "{header_name}"
+
+const unsigned char mbedtls_test_shared_dependencies[] =
+{{
+{entries}    0 /* End of table */
+}};
+
+const size_t mbedtls_test_shared_dependency_count = {count};
+'''.format(generator_script=os.path.basename(__file__),
+           header_name=header_name, count=len(dependencies),
+           entries=''.join(entries))
+
+
+def read_shared_dependencies(table_file):
+    """
+    Read the dependency table of a C file written by
+    gen_shared_dependencies_table().
+
+    :param table_file: Shared dependency table C file name
+    :return: Dependencies in identifier order
+    """
+    dependencies = []
+    with FileWrapper(table_file) as table_f:
+        for line in table_f:
+            match = SHARED_DEPENDENCY_PATTERN.match(line)
+            if match:
+                if int(match.group(1)) != len(dependencies):
+                    raise GeneratorInputError(
+                        "%s:%d: Unexpected dependency identifier %s" %
+                        (table_file, table_f.line_no, match.group(1)))
+                dependencies.append(match.group(2))
+    return dependencies
+
+
+def collect_data_file_dependencies(data_file):
+    """
+    Collect the dependencies of the test cases of a data file.
+
+    :param data_file: Data file name
+    :return: Set of dependencies
+    """
+    dependencies = set()
+    with FileWrapper(data_file) as data_f:
+        for _, _, test_dependencies, _ in parse_test_data(data_f):
+            dependencies.update(test_dependencies)
+    return dependencies
+
+
+def collect_defined_macros(funcs_file):
+    """
+    Collect the names of the macros that a functions file defines.
+
+    :param funcs_file: Functions file name
+    :return: Set of macro names
+    """
+    with FileWrapper(funcs_file) as funcs_f:
+        return set(match.group(1) for match in
+                   map(MACRO_DEFINITION_PATTERN.match, funcs_f) if match)
+
+
+def is_shared_dependency(dep, config):
+    """
+    Checks whether a dependency can go into the shared dependency table.
+    The table is compiled separately from the test suites, with only the
+    configuration and the test helpers: it doesn't see the macros that
+    library headers other than the configuration, or functions files,
+    define. So it only holds the dependencies that the configuration file
+    decides, see evaluate_dependency().
+
+    :param dep: Dependency
+    :param config: Configuration, see load_config()
+    :return: True if the dependency can go into the table
+    """
+    return evaluate_dependency(dep, config) is not None
+
+
+def update_shared_dependencies(table_file, suites, config,
+                               write_if_changed=True):
+    """
+    Write or extend the shared dependency table with the dependencies
+    of the given test suites. Existing dependencies keep their
+    identifiers, new ones are appended in sorted order, so that
+    intermediate data files generated with an earlier version of the
+    table remain valid.
+
+    Only the dependencies that the configuration decides go into the
+    table, see is_shared_dependency(). The others, e.g. on macros that
+    a library header or a functions file defines, are left to the
+    dep_check() switch of each suite. An existing table with other
+    dependencies is written from scratch. Suites that can't be read or
+    parsed are skipped: their errors are reported when generating them.
+
+    :param table_file: Shared dependency table C file name. The header
+                       declaring the table is written next to it.
+                       See get_shared_deps_header().
+    :param suites: List of (functions file, data file) tuples
+    :param config: Configuration, see load_config()
+    :param write_if_changed: Leave the table untouched if no dependency
+                             is added. See open_output_file().
+    :return: Dependencies in identifier order
+    """
+    dependencies = []
+    if os.path.exists(table_file):
+        dependencies = read_shared_dependencies(table_file)
+        if not all(is_shared_dependency(dep, config)
+                   for dep in dependencies):
+            dependencies = []
+    new_dependencies = set()
+    suite_macros = set()
+    for funcs_file, data_file in suites:
+        try:
+            new_dependencies.update(collect_data_file_dependencies(data_file))
+            suite_macros.update(collect_defined_macros(funcs_file))
+        except (IOError, GeneratorInputError):
+            continue
+    new_dependencies.difference_update(dependencies)
+    dependencies += sorted(dep for dep in new_dependencies
+                           if get_dependency_macro(dep) not in suite_macros
+                           and is_shared_dependency(dep, config))
+    header_file = get_shared_deps_header(table_file)
+    with open_output_file(header_file, write_if_changed=True) as header_f:
+        header_f.write(gen_shared_dependencies_header())
+    with open_output_file(table_file, write_if_changed) as table_f:
+        table_f.write(gen_shared_dependencies_table(
+            dependencies, os.path.basename(header_file)))
+    return dependencies
+
+
+def load_config(config_file):
+    """
+    Read a configuration file with scripts/config.py, which requires
+    Python 3.
+
+    :param config_file: Configuration file name, e.g. config.h
+    :return: config.ConfigFile object
+    """
+    if sys.version_info < (3,):
+        raise GeneratorInputError("Reading configuration file %s requires "
+                                  "Python 3" % config_file)
+    if not os.path.exists(config_file):
+        raise IOError("ERROR: Configuration file [%s] not found!" %
+                      config_file)
+    if CONFIG_SCRIPTS_DIR not in sys.path:
+        sys.path.append(CONFIG_SCRIPTS_DIR)
+    import config  # pylint: disable=import-error
+    return config.ConfigFile(config_file)
+
+
+def evaluate_dependency(dep, config):
+    """
+    Evaluate a dependency statically against a configuration, with
+    the semantics of gen_dep_condition(). Only the settings of the
+    configuration file decide a dependency: macros that it doesn't
+    define, and commented out settings that have a value, may still be
+    defined by other headers.
+
+    :param dep: Dependency macro
+    :param config: Configuration, see load_config()
+    :return: True if the dependency is met, False if it isn't, None if
+             the configuration doesn't decide it.
+    """
+    _not, dep = split_dep(dep)
+    dependency = CONDITION_PATTERN.match(dep)
+    if not dependency:
+        raise GeneratorInputError('Invalid dependency %s' % dep)
+    macro, condition, value = dependency.group(1, 2, 3)
+    if not config.known(macro):
+        return None
+    if condition is None:
+        if macro not in config and config[macro]:
+            return None
+        met = macro in config
+    else:
+        if macro not in config:
+            return None
+        try:
+            met = CONDITION_OPERATORS[condition](int(config[macro], 0),
+                                                 int(value, 0))
+        except ValueError:
+            return None
+    return met != bool(_not)
+
+
+def collect_function_dependencies(funcs_file):
+    """
+    Collect the dependencies of the test functions of a functions file,
+    i.e. the dependencies on their BEGIN_CASE lines.
+
+    :param funcs_file: Functions file name
+    :return: Dict mapping the name of each test function, with the 'test_'
+             prefix of its generated code, to its list of dependencies.
+    """
+    function_dependencies = {}
+    dependencies = None
+    with FileWrapper(funcs_file) as funcs_f:
+        for line_type, line in tokenize_function_file(funcs_f):
+            if line_type == LINE_BEGIN_CASE:
+                dependencies = parse_function_dependencies(line)
+            elif dependencies is not None:
+                match = TEST_FUNCTION_VALIDATION_PATTERN.match(line)
+                if match:
+                    function_dependencies['test_' + match.group('func_name')] \
+                        = dependencies
+                    dependencies = None
+    return function_dependencies
+
+
+def get_unreachable_check(config, suite_dependencies, function_dependencies):
+    """
+    Gives a write_test_data() check of the test cases that can't run in
+    a configuration, because a dependency of the test suite, of the test
+    function or of the test case itself is statically false.
+
+    :param config: Configuration, see load_config()
+    :param suite_dependencies: Test suite dependencies
+    :param function_dependencies: Test function dependencies, see
+                                  collect_function_dependencies()
+    :return: Function of the test function name and the test case
+             dependencies, true if the test case is unreachable
+    """
+    results = {}
+
+    def is_false(dep):
+        """
+        Evaluates a dependency once.
+        """
+        if dep not in results:
+            results[dep] = evaluate_dependency(dep, config) is False
+        return results[dep]
+
+    suite_unreachable = any(map(is_false, suite_dependencies))
+
+    def is_unreachable(function_name, test_dependencies):
+        """
+        Checks whether a test case is unreachable.
+        """
+        return suite_unreachable or \
+            any(map(is_false, function_dependencies.get(function_name, ()))) \
+            or any(map(is_false, test_dependencies))
+    return is_unreachable
 
 
 def gen_expression_check(exp_id, exp):
@@ -783,7 +1432,113 @@ def gen_expression_check(exp_id, exp):
     return exp_code
 
 
-def write_dependencies(out_data_f, test_dependencies, unique_dependencies):
+def gen_dep_bitmap_entry(dep_id, dep):
+    """
+    Generate the bit of a dependency in the dependency bitmap of the
+    table check code format. Each byte of the bitmap is a 0 followed
+    by the bits of its dependencies, so that entries can be generated
+    one at a time. See gen_dep_bitmap_guards().
+
+    :param dep_id: Dependency identifier
+    :param dep: Dependency macro
+    :return: Dependency bitmap entry
+    """
+    if dep_id < 0:
+        raise GeneratorInputError("Dependency Id should be a positive "
+                                  "integer.")
+    byte_start = '    , 0\n' if dep_id > 0 and dep_id % 8 == 0 else ''
+    return '''{byte_start}    /* {id}: {dep} */
+#if {condition}
+    | 0x{bit:02x}
+#endif
+'''.format(byte_start=byte_start, id=dep_id, dep=dep,
+           condition=gen_dep_condition(dep), bit=1 << dep_id % 8)
+
+
+def gen_dep_bitmap_guards(first_dep_id=0):
+    """
+    Generate the code before and after the entries of the dependency
+    bitmap of the table check code format. Identifiers below
+    first_dep_id, i.e. those of the shared dependency table, keep
+    their place in the bitmap with cleared bits.
+
+    :param first_dep_id: Identifier of the first bitmap entry
+    :return: Code to put before and after the bitmap entries
+    """
+    return ('''
+#define MBEDTLS_TEST_DEPENDENCY_BITMAP
+
+/* Bit dep_id % 8 of byte dep_id / 8 is set if dependency dep_id is met */
+static const unsigned char test_dependency_bitmap[] =
+{
+    0
+''' + '    , 0\n' * (max(first_dep_id - 1, 0) // 8), '};\n')
+
+
+def gen_expression_table_entry(exp_id, exp):
+    """
+    Generate the entry of an expression in the expression value table
+    of the table check code format. See gen_expression_table_guards().
+
+    :param exp_id: Expression Identifier
+    :param exp: Expression/Macro
+    :return: Expression table entry
+    """
+    if exp_id < 0:
+        raise GeneratorInputError("Expression Id should be a positive "
+                                  "integer.")
+    if not exp:
+        raise GeneratorInputError("Expression should not be an empty string.")
+    # A trailing semicolon is harmless in the switch format's assignment
+    # but not in an initializer
+    expression = exp.rstrip().rstrip(';')
+    return '    /* {exp_id} */ ( {expression} ),\n'.format(
+        exp_id=exp_id, expression=expression)
+
+
+def gen_expression_table_guards():
+    """
+    Generate the code before and after the entries of the expression
+    value table of the table check code format.
+
+    :return: Code to put before and after the table entries
+    """
+    return ('''
+#define MBEDTLS_TEST_EXPRESSION_TABLE
+
+/* Value of each expression, indexed by expression identifier */
+static const int32_t test_expression_values[] =
+{
+''', '''    0 /* End of table */
+};
+''')
+
+
+def intern_dependencies(test_dependencies, unique_dependencies,
+                        gen_check=gen_dep_check):
+    """
+    Replaces test dependencies with identifiers and generates
+    dependency check code for new ones.
+
+    :param test_dependencies: Dependencies
+    :param unique_dependencies: InternTable to track unique dependencies
+           that are global to this re-entrant function.
+    :param gen_check: Dependency check code generator, gen_dep_check()
+           or gen_dep_bitmap_entry().
+    :return: Dependency identifiers and dependency check code.
+    """
+    dep_ids = []
+    dep_check_code = []
+    for dep in test_dependencies:
+        dep_id, added = unique_dependencies.add(dep)
+        if added:
+            dep_check_code.append(gen_check(dep_id, dep))
+        dep_ids.append(dep_id)
+    return dep_ids, ''.join(dep_check_code)
+
+
+def write_dependencies(out_data_f, test_dependencies, unique_dependencies,
+                       gen_check=gen_dep_check):
     """
     Write dependencies to intermediate test data file, replacing
     the string form with identifiers. Also, generates dependency
@@ -791,26 +1546,54 @@ def write_dependencies(out_data_f, test_dependencies, unique_dependencies):
 
     :param out_data_f: Output intermediate data file
     :param test_dependencies: Dependencies
-    :param unique_dependencies: Mutable list to track unique dependencies
+    :param unique_dependencies: InternTable to track unique dependencies
            that are global to this re-entrant function.
+    :param gen_check: Dependency check code generator.
+           See intern_dependencies().
     :return: returns dependency check code.
     """
-    dep_check_code = ''
-    if test_dependencies:
+    dep_ids, dep_check_code = intern_dependencies(test_dependencies,
+                                                  unique_dependencies,
+                                                  gen_check)
+    if dep_ids:
         out_data_f.write('depends_on')
-        for dep in test_dependencies:
-            if dep not in unique_dependencies:
-                unique_dependencies.append(dep)
-                dep_id = unique_dependencies.index(dep)
-                dep_check_code += gen_dep_check(dep_id, dep)
-            else:
-                dep_id = unique_dependencies.index(dep)
+        for dep_id in dep_ids:
             out_data_f.write(':' + str(dep_id))
         out_data_f.write('\n')
     return dep_check_code
 
 
-def write_parameters(out_data_f, test_args, func_args, unique_expressions):
+def intern_parameters(test_args, func_args, unique_expressions,
+                      gen_check=gen_expression_check):
+    """
+    Types test parameters, replacing integer expressions with
+    identifiers, and generates expression check code for new ones.
+
+    :param test_args: Test parameters
+    :param func_args: Function arguments
+    :param unique_expressions: InternTable to track unique
+           expressions that are global to this re-entrant function.
+    :param gen_check: Expression check code generator,
+           gen_expression_check() or gen_expression_table_entry().
+    :return: List of parameter type and value pairs and expression
+             check code.
+    """
+    params = []
+    expression_code = []
+    for typ, val in zip(func_args, test_args):
+        # check if val is a non literal int val (i.e. an expression)
+        if typ == 'int' and not INT_LITERAL_PATTERN.match(val):
+            typ = 'exp'
+            exp_id, added = unique_expressions.add(val)
+            if added:
+                expression_code.append(gen_check(exp_id, val))
+            val = exp_id
+        params.append((typ, val))
+    return params, ''.join(expression_code)
+
+
+def write_parameters(out_data_f, test_args, func_args, unique_expressions,
+                     gen_check=gen_expression_check):
     """
     Writes test parameters to the intermediate data file, replacing
     the string form with identifiers. Also, generates expression
@@ -819,114 +1602,517 @@ def write_parameters(out_data_f, test_args, func_args, unique_expressions):
     :param out_data_f: Output intermediate data file
     :param test_args: Test parameters
     :param func_args: Function arguments
-    :param unique_expressions: Mutable list to track unique
+    :param unique_expressions: InternTable to track unique
            expressions that are global to this re-entrant function.
+    :param gen_check: Expression check code generator.
+           See intern_parameters().
     :return: Returns expression check code.
     """
-    expression_code = ''
-    for i, _ in enumerate(test_args):
-        typ = func_args[i]
-        val = test_args[i]
-
-        # check if val is a non literal int val (i.e. an expression)
-        if typ == 'int' and not re.match(r'(\d+|0x[0-9a-f]+)$',
-                                         val, re.I):
-            typ = 'exp'
-            if val not in unique_expressions:
-                unique_expressions.append(val)
-                # exp_id can be derived from len(). But for
-                # readability and consistency with case of existing
-                # let's use index().
-                exp_id = unique_expressions.index(val)
-                expression_code += gen_expression_check(exp_id, val)
-                val = exp_id
-            else:
-                val = unique_expressions.index(val)
+    params, expression_code = intern_parameters(test_args, func_args,
+                                                unique_expressions,
+                                                gen_check)
+    for typ, val in params:
         out_data_f.write(':' + typ + ':' + str(val))
     out_data_f.write('\n')
     return expression_code
 
 
-def gen_suite_dep_checks(suite_dependencies, dep_check_code, expression_code):
+def unquote_string_parameter(val):
     """
-    Generates preprocessor checks for test suite dependencies.
+    Replaces escape sequences in a string parameter and strips the
+    enclosing quotes, as the text format reader in the test code does.
 
-    :param suite_dependencies: Test suite dependencies read from the
-            .function file.
-    :param dep_check_code: Dependency check code
-    :param expression_code: Expression check code
-    :return: Dependency and expression code guarded by test suite
-             dependencies.
+    :param val: String parameter from the .data file
+    :return: String value
     """
-    if suite_dependencies:
-        preprocessor_check = gen_dependencies_one_line(suite_dependencies)
-        dep_check_code = '''
-{preprocessor_check}
-{code}
-#endif
-'''.format(preprocessor_check=preprocessor_check, code=dep_check_code)
-        expression_code = '''
-{preprocessor_check}
-{code}
-#endif
-'''.format(preprocessor_check=preprocessor_check, code=expression_code)
-    return dep_check_code, expression_code
+    val = ESCAPED_CHAR_PATTERN.sub(
+        lambda m: '\n' if m.group(1) == 'n' else m.group(1), val)
+    if len(val) < 2 or val[0] != '"' or val[-1] != '"':
+        raise GeneratorInputError("Expected string (with \"\") for "
+                                  "parameter and got: %s" % val)
+    return val[1:-1]
 
 
-def gen_from_test_data(data_f, out_data_f, func_info, suite_dependencies):
+def encode_binary_parameter(typ, val):
     """
-    This function reads test case name, dependencies and test vectors
-    from the .data file. This information is correlated with the test
-    functions file for generating an intermediate data file replacing
-    the strings for test function names, dependencies and integer
-    constant expressions with identifiers. Mainly for optimising
-    space for on-target execution.
-    It also generates test case dependency check code and expression
-    evaluation code.
+    Encodes a typed test parameter for the binary intermediate data
+    file format. See DATAX_BINARY_MAGIC.
 
-    :param data_f: Data file object
-    :param out_data_f: Output intermediate data file
-    :param func_info: Dict keyed by function and with function id
-           and arguments info
-    :param suite_dependencies: Test suite dependencies
-    :return: Returns dependency and expression check code
+    :param typ: Parameter type
+    :param val: Parameter value
+    :return: Encoded parameter
+    """
+    if typ == 'int':
+        if val[1:2] in ('x', 'X'):
+            value = int(val, 16)
+        else:
+            value = int(val, 10)
+        # Like strtol() on a 64-bit host followed by a conversion to int
+        value = min(value, 0x7fffffffffffffff) & 0xffffffff
+        return b'i' + struct.pack('<I', value)
+    if typ == 'exp':
+        return b'e' + struct.pack('<I', val)
+    if typ == 'char*':
+        value = unquote_string_parameter(val).encode('utf-8') + b'\0'
+        return b's' + struct.pack('<I', len(value)) + value
+    if typ == 'hex':
+        try:
+            value = binascii.unhexlify(unquote_string_parameter(val))
+        except (TypeError, ValueError):
+            raise GeneratorInputError("Invalid hex string parameter: %s" %
+                                      val)
+        return b'h' + struct.pack('<I', len(value)) + value
+    raise GeneratorInputError("Invalid parameter type: %s" % typ)
+
+
+def write_binary_record(out_data_f, test_name, dep_ids, func_id, params):
+    """
+    Writes a test case to a binary intermediate data file.
+    See DATAX_BINARY_MAGIC for the format.
+
+    :param out_data_f: Output intermediate data file, in binary mode
+    :param test_name: Test case name
+    :param dep_ids: Dependency identifiers
+    :param func_id: Test function identifier
+    :param params: List of parameter type and value pairs
+    :return:
+    """
+    name = test_name.encode('utf-8') + b'\0'
+    record = [struct.pack('<I', len(name)), name,
+              struct.pack('<I', len(dep_ids))]
+    record.extend(struct.pack('<I', dep_id) for dep_id in dep_ids)
+    record.append(struct.pack('<II', func_id, len(params)))
+    record.extend(encode_binary_parameter(typ, val) for typ, val in params)
+    record = b''.join(record)
+    if len(record) > DATAX_RECORD_MAX_SIZE:
+        raise GeneratorInputError("Test case %s is too large: %d bytes" %
+                                  (test_name, len(record)))
+    out_data_f.write(struct.pack('<I', len(record)) + record)
+
+
+class BinaryDataWriter(object):
+    """
+    File-like object collecting the records of a binary intermediate
+    data file, as written by write_binary_record(), to write them after
+    the record index.
     """
-    unique_dependencies = []
-    unique_expressions = []
-    dep_check_code = ''
-    expression_code = ''
-    for test_name, function_name, test_dependencies, test_args in \
-            parse_test_data(data_f):
-        out_data_f.write(test_name + '\n')
-
-        # Write dependencies
-        dep_check_code += write_dependencies(out_data_f, test_dependencies,
-                                             unique_dependencies)
-
-        # Write test function name
-        test_function_name = 'test_' + function_name
-        if test_function_name not in func_info:
-            raise GeneratorInputError("Function %s not found!" %
-                                      test_function_name)
-        func_id, func_args = func_info[test_function_name]
-        out_data_f.write(str(func_id))
-
-        # Write parameters
-        if len(test_args) != len(func_args):
-            raise GeneratorInputError("Invalid number of arguments in test "
-                                      "%s. See function %s signature." %
-                                      (test_name, function_name))
-        expression_code += write_parameters(out_data_f, test_args, func_args,
-                                            unique_expressions)
-
-        # Write a newline as test case separator
-        out_data_f.write('\n')
 
-    dep_check_code, expression_code = gen_suite_dep_checks(
-        suite_dependencies, dep_check_code, expression_code)
+    def __init__(self):
+        """
+        Creates the record spool.
+        """
+        self._records_f = tempfile.SpooledTemporaryFile(
+            RECORD_SPOOL_MAX_SIZE, 'w+b')
+        self._offsets = []
+        self._size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Deletes the record spool.
+        """
+        self._records_f.close()
+
+    def tell(self):
+        """
+        Gives the offset of the next record from the end of the index.
+        See header_size.
+
+        :return: Offset of the next record
+        """
+        return self._size
+
+    def get_header_size(self):
+        """
+        Gives the size of the magic number and the record index, with
+        the records added so far.
+
+        :return: Header size
+        """
+        return len(DATAX_BINARY_MAGIC) + 4 * (len(self._offsets) + 1)
+
+    header_size = property(get_header_size)
+
+    def write(self, record):
+        """
+        Adds a record. Each write must be one complete record.
+
+        :param record: Record with its size prefix
+        :return:
+        """
+        self._offsets.append(self._size)
+        self._size += len(record)
+        self._records_f.write(record)
+
+    def write_data_file(self, out_data_f):
+        """
+        Writes the binary intermediate data file with the records
+        added so far. See DATAX_BINARY_MAGIC for the format.
+
+        :param out_data_f: Output intermediate data file, in binary mode
+        :return:
+        """
+        header_size = self.header_size
+        if header_size + self._size > 0xffffffff:
+            raise GeneratorInputError("Intermediate data file too large: "
+                                      "%d bytes" %
+                                      (header_size + self._size))
+        out_data_f.write(DATAX_BINARY_MAGIC)
+        out_data_f.write(struct.pack('<I', len(self._offsets)))
+        # Write the index in chunks to bound memory use
+        for start in range(0, len(self._offsets), 4096):
+            chunk = self._offsets[start:start + 4096]
+            out_data_f.write(struct.pack(
+                '<%dI' % len(chunk), *[offset + header_size
+                                       for offset in chunk]))
+        self._records_f.seek(0)
+        shutil.copyfileobj(self._records_f, out_data_f)
+
+
+def gen_suite_dep_checks(suite_dependencies, dep_check_code, expression_code):
+    """
+    Generates preprocessor checks for test suite dependencies.
+
+    :param suite_dependencies: Test suite dependencies read from the
+            .function file.
+    :param dep_check_code: Dependency check code
+    :param expression_code: Expression check code
+    :return: Dependency and expression code guarded by test suite
+             dependencies.
+    """
+    guard_start, guard_end = gen_suite_dep_guards(suite_dependencies)
+    return (guard_start + dep_check_code + guard_end,
+            guard_start + expression_code + guard_end)
+
+
+def gen_suite_dep_guards(suite_dependencies):
+    """
+    Generates the preprocessor lines enclosing dependency and expression
+    check code, for test suite dependencies.
+
+    :param suite_dependencies: Test suite dependencies read from the
+            .function file.
+    :return: Code to put before and after the guarded code.
+    """
+    if not suite_dependencies:
+        return '', ''
+    preprocessor_check = gen_dependencies_one_line(suite_dependencies)
+    return '\n' + preprocessor_check + '\n', '\n#endif\n'
+
+
+class OffsetTrackingWriter(object):
+    """
+    Wrapper of a text output file that keeps track of the number of
+    bytes written, without flushing the file like tell() does.
+    """
+
+    # Extra bytes written for each line feed by newline translation
+    NEWLINE_EXTRA_SIZE = len(os.linesep) - 1
+
+    def __init__(self, out_f):
+        """
+        :param out_f: Output file, in text mode
+        """
+        self._out_f = out_f
+        self._offset = 0
+
+    def tell(self):
+        """
+        :return: Number of bytes written so far
+        """
+        return self._offset
+
+    def write(self, text):
+        """
+        Writes text to the output file.
+
+        :param text: Text to write
+        :return:
+        """
+        self._out_f.write(text)
+        self._offset += len(text.encode('utf-8'))
+        if self.NEWLINE_EXTRA_SIZE:
+            self._offset += text.count('\n') * self.NEWLINE_EXTRA_SIZE
+
+
+class DataOptions(collections.namedtuple('DataOptions', [
+        'write_if_changed', 'datax_format', 'index_file', 'shards',
+        'duration_hints', 'shared_dependencies', 'is_unreachable',
+        'check_code_format'])):
+    """
+    Options of the intermediate data file generation. All fields are
+    optional:
+
+    write_if_changed: Leave outputs untouched if their contents don't
+                      change. See open_output_file().
+    datax_format: Intermediate data file format, DATAX_TEXT (default)
+                  or DATAX_BINARY.
+    index_file: Test case index file to write. See DATAX_INDEX_SUFFIX.
+    shards: Number of shards to split the intermediate data file into,
+            in addition to writing it whole. See write_data_shards().
+    duration_hints: Durations of the test cases by name, to balance the
+                    shards. See read_duration_hints().
+    shared_dependencies: Dependencies of the table shared by all test
+                         suites, see gen_shared_dependencies_table().
+                         They keep their table identifier and need no
+                         dependency check code.
+    is_unreachable: Check of the test function name and the test case
+                    dependencies, true for test cases that can't run
+                    and are left out. See get_unreachable_check().
+    check_code_format: Format of the dependency and expression check
+                       code, CHECK_CODE_SWITCH (default) or
+                       CHECK_CODE_TABLE.
+    """
+    __slots__ = ()
+
+
+DataOptions.__new__.__defaults__ = (False, DATAX_TEXT, None, 0, None, (),
+                                    None, CHECK_CODE_SWITCH)
+
+
+class DataCallbacks(collections.namedtuple('DataCallbacks', [
+        'write_dep_check', 'write_expression', 'write_index_entry'])):
+    """
+    Callbacks receiving the outputs of write_test_data() other than the
+    intermediate data:
+
+    write_dep_check: Callback receiving dependency check code
+    write_expression: Callback receiving expression check code
+    write_index_entry: Optional callback receiving the offset of each
+                       test case in the intermediate data file, as
+                       given by its tell() method, its function id and
+                       its name.
+    """
+    __slots__ = ()
+
+
+DataCallbacks.__new__.__defaults__ = (None,)
+
+
+class IntermediateDataWriter(object):
+    """
+    Writes test cases to an intermediate data file, replacing the
+    strings for dependencies and integer constant expressions with
+    identifiers that are unique in the test suite.
+    """
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, out_data_f, options):
+        """
+        :param out_data_f: Output intermediate data file. In binary
+               format, only the records are written, see
+               BinaryDataWriter.
+        :param options: DataOptions. Only datax_format,
+               shared_dependencies and check_code_format are used.
+        """
+        self._out_data_f = out_data_f
+        self._binary = options.datax_format == DATAX_BINARY
+        self._unique_dependencies = InternTable(options.shared_dependencies)
+        self._unique_expressions = InternTable()
+        self._gen_dep, self._gen_expression = \
+            gen_dep_check, gen_expression_check
+        if options.check_code_format == CHECK_CODE_TABLE:
+            self._gen_dep, self._gen_expression = \
+                gen_dep_bitmap_entry, gen_expression_table_entry
+
+    def write(self, test_case, func_id, func_args):
+        """
+        Writes a test case.
+
+        :param test_case: Test case name, function name, dependencies
+               and parameters, as yielded by parse_test_data().
+        :param func_id: Test function identifier
+        :param func_args: Test function argument types
+        :return: Dependency check code and expression check code of the
+                 identifiers first used by the test case.
+        """
+        test_name, _, test_dependencies, test_args = test_case
+        if self._binary:
+            dep_ids, dep_check_code = intern_dependencies(
+                test_dependencies, self._unique_dependencies, self._gen_dep)
+            params, expression_code = intern_parameters(
+                test_args, func_args, self._unique_expressions,
+                self._gen_expression)
+            write_binary_record(self._out_data_f, test_name, dep_ids, func_id,
+                                params)
+        else:
+            self._out_data_f.write(test_name + '\n')
+            dep_check_code = write_dependencies(self._out_data_f,
+                                                test_dependencies,
+                                                self._unique_dependencies,
+                                                self._gen_dep)
+            self._out_data_f.write(str(func_id))
+            expression_code = write_parameters(self._out_data_f, test_args,
+                                               func_args,
+                                               self._unique_expressions,
+                                               self._gen_expression)
+            # Write a newline as test case separator
+            self._out_data_f.write('\n')
+        return dep_check_code, expression_code
+
+
+def get_test_function(data_f, func_info, test_case):
+    """
+    Looks up the test function of a test case and checks its number of
+    arguments.
+
+    :param data_f: Data file object, for error messages
+    :param func_info: Dict keyed by function and with function id
+           and arguments info
+    :param test_case: Test case from parse_test_data()
+    :return: Test function id and argument types
+    """
+    test_name, function_name, _, test_args = test_case
+    test_function_name = 'test_' + function_name
+    if test_function_name not in func_info:
+        raise GeneratorInputError("%s:%d: Function %s not found!" %
+                                  (data_f.name, data_f.line_no,
+                                   test_function_name))
+    func_id, func_args = func_info[test_function_name]
+    if len(test_args) != len(func_args):
+        raise GeneratorInputError("%s:%d: Invalid number of arguments "
+                                  "in test %s. See function %s "
+                                  "signature." %
+                                  (data_f.name, data_f.line_no,
+                                   test_name, function_name))
+    return func_id, func_args
+
+
+def write_test_data(data_f, out_data_f, func_info, callbacks,
+                    options=DataOptions()):
+    """
+    This function reads test case name, dependencies and test vectors
+    from the .data file and writes them to the intermediate data file
+    as it goes. The strings for test function names, dependencies and
+    integer constant expressions are replaced with identifiers.
+    The dependency check and expression evaluation code for each new
+    identifier is passed to the given callbacks, so that no generated
+    output has to be held in memory.
+
+    :param data_f: Data file object
+    :param out_data_f: Output intermediate data file
+    :param func_info: Dict keyed by function and with function id
+           and arguments info
+    :param callbacks: DataCallbacks receiving the check code and the
+           index entries.
+    :param options: DataOptions. In binary format, only the records are
+           written to out_data_f, see BinaryDataWriter.
+    :return: Number of test cases read and number of test cases left
+             out.
+    """
+    writer = IntermediateDataWriter(out_data_f, options)
+    test_count = 0
+    dropped_count = 0
+    for test_case in parse_test_data(data_f):
+        func_id, func_args = get_test_function(data_f, func_info, test_case)
+        test_count += 1
+        if options.is_unreachable is not None and \
+                options.is_unreachable('test_' + test_case[1], test_case[2]):
+            dropped_count += 1
+            continue
+        if callbacks.write_index_entry is not None:
+            callbacks.write_index_entry(out_data_f.tell(), func_id,
+                                        test_case[0])
+        try:
+            dep_check_code, expression_code = writer.write(test_case,
+                                                           func_id,
+                                                           func_args)
+        except GeneratorInputError as error:
+            raise GeneratorInputError("%s:%d: %s" % (data_f.name,
+                                                     data_f.line_no,
+                                                     str(error)))
+        if dep_check_code:
+            callbacks.write_dep_check(dep_check_code)
+        if expression_code:
+            callbacks.write_expression(expression_code)
+    return test_count, dropped_count
+
+
+def gen_from_test_data(data_f, out_data_f, func_info, suite_dependencies):
+    """
+    This function reads test case name, dependencies and test vectors
+    from the .data file. This information is correlated with the test
+    functions file for generating an intermediate data file replacing
+    the strings for test function names, dependencies and integer
+    constant expressions with identifiers. Mainly for optimising
+    space for on-target execution.
+    It also generates test case dependency check code and expression
+    evaluation code.
+
+    :param data_f: Data file object
+    :param out_data_f: Output intermediate data file
+    :param func_info: Dict keyed by function and with function id
+           and arguments info
+    :param suite_dependencies: Test suite dependencies
+    :return: Returns dependency and expression check code
+    """
+    dep_check_code = []
+    expression_code = []
+    write_test_data(data_f, out_data_f, func_info,
+                    DataCallbacks(dep_check_code.append,
+                                  expression_code.append))
+    dep_check_code, expression_code = gen_suite_dep_checks(
+        suite_dependencies, ''.join(dep_check_code), ''.join(expression_code))
     return dep_check_code, expression_code
 
 
+def replace_file(src, dst):
+    """
+    Rename src to dst, replacing dst if it exists.
+
+    :param src: Source file name
+    :param dst: Destination file name
+    :return:
+    """
+    if hasattr(os, 'replace'):
+        os.replace(src, dst)  # pylint: disable=no-member
+    else:
+        # Python 2: rename() doesn't replace existing files on Windows.
+        if os.name == 'nt' and os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
+
+
+@contextlib.contextmanager
+def open_output_file(file_name, write_if_changed=False, binary=False):
+    """
+    Opens a generated output file for writing.
+
+    In write-if-changed mode, the output is written to a temporary file
+    next to file_name. On success, it replaces file_name only if the
+    contents differ, so that unchanged outputs keep their timestamp and
+    don't trigger a rebuild. The replacement is a rename, so file_name
+    is never left partially written.
+
+    :param file_name: Output file name
+    :param write_if_changed: Enable write-if-changed mode
+    :param binary: Open the file in binary mode
+    :return: Context manager yielding the file object to write to
+    """
+    mode = 'wb' if binary else 'w'
+    if not write_if_changed:
+        with open(file_name, mode) as out_f:
+            yield out_f
+        return
+    tmp_name = '%s.%d.tmp' % (file_name, os.getpid())
+    try:
+        with open(tmp_name, mode) as out_f:
+            yield out_f
+        if os.path.exists(file_name) and \
+                filecmp.cmp(tmp_name, file_name, shallow=False):
+            os.remove(tmp_name)
+        else:
+            replace_file(tmp_name, file_name)
+    finally:
+        if os.path.exists(tmp_name):
+            os.remove(tmp_name)
+
+
 def add_input_info(funcs_file, data_file, template_file,
                    c_file, snippets):
     """
@@ -946,8 +2132,28 @@ def add_input_info(funcs_file, data_file, template_file,
     snippets['test_case_data_file'] = data_file
 
 
+def read_input_file(file_name, input_cache=None):
+    """
+    Read an input file that is common to all test suites, like the
+    template, helpers and platform files.
+
+    :param file_name: Input file name
+    :param input_cache: Optional dictionary of file contents keyed by
+                        file name. When given, a file is read from the
+                        file system only the first time it is requested.
+    :return: File contents
+    """
+    if input_cache is not None and file_name in input_cache:
+        return input_cache[file_name]
+    with open(file_name, 'r') as input_f:
+        content = input_f.read()
+    if input_cache is not None:
+        input_cache[file_name] = content
+    return content
+
+
 def read_code_from_input_files(platform_file, helpers_file,
-                               out_data_file, snippets):
+                               out_data_file, snippets, input_cache=None):
     """
     Read code from input files and create substitutions for replacement
     strings in the template file.
@@ -957,33 +2163,116 @@ def read_code_from_input_files(platform_file, helpers_file,
     :param out_data_file: Output intermediate data file object
     :param snippets: Dictionary to contain code pieces to be
                      substituted in the template.
+    :param input_cache: Optional cache of input file contents.
+                        See read_input_file().
     :return:
     """
-    # Read helpers
-    with open(helpers_file, 'r') as help_f, open(platform_file, 'r') as \
-            platform_f:
-        snippets['test_common_helper_file'] = helpers_file
-        snippets['test_common_helpers'] = help_f.read()
-        snippets['test_platform_file'] = platform_file
-        snippets['platform_code'] = platform_f.read().replace(
+    snippets['test_common_helper_file'] = helpers_file
+    snippets['test_common_helpers'] = read_input_file(helpers_file,
+                                                      input_cache)
+    snippets['test_platform_file'] = platform_file
+    snippets['platform_code'] = read_input_file(
+        platform_file, input_cache).replace(
             'DATA_FILE', out_data_file.replace('\\', '\\\\'))  # escape '\'
 
 
-def write_test_source_file(template_file, c_file, snippets):
+def compile_template(template):
+    """
+    Compiles a template into a list of segments, so that it can be
+    rendered in a single pass by render_template(). Placeholders follow
+    the string.Template syntax. LINE_NO_PLACEHOLDER is replaced with
+    the line number following its own.
+
+    :param template: Template contents
+    :return: List of segments: literal strings, and (name,) tuples for
+             the placeholders of snippets.
+    """
+    segments = []
+    literal = []
+    line_no = 1
+    pos = 0
+    for match in string.Template.pattern.finditer(template):
+        line_no += template.count('\n', pos, match.start())
+        literal.append(template[pos:match.start()])
+        pos = match.end()
+        name = match.group('named') or match.group('braced')
+        if match.group('escaped') is not None:
+            literal.append('$')
+        elif name == LINE_NO_PLACEHOLDER:
+            # +1 as #line directive sets next line number
+            literal.append(str(line_no + 1))
+        elif name is not None:
+            segments.append(''.join(literal))
+            segments.append((name,))
+            literal = []
+        else:
+            raise ValueError("Invalid placeholder in template: line %d" %
+                             line_no)
+    literal.append(template[pos:])
+    segments.append(''.join(literal))
+    return [segment for segment in segments if segment]
+
+
+def render_template(segments, snippets, out_f):
+    """
+    Renders a compiled template, joining its literals and snippets into
+    as few writes as possible.
+
+    :param segments: Template segments from compile_template()
+    :param snippets: Code snippets by placeholder name. Snippets may
+                     also be file objects, whose contents are copied to
+                     the output.
+    :param out_f: Output file object
+    :return:
+    """
+    parts = []
+    for segment in segments:
+        if isinstance(segment, tuple):
+            snippet = snippets[segment[0]]
+            if hasattr(snippet, 'read'):
+                # Stream the snippet from its spool file
+                out_f.write(''.join(parts))
+                parts = []
+                snippet.seek(0)
+                shutil.copyfileobj(snippet, out_f)
+                continue
+            segment = '%s' % snippet
+        parts.append(segment)
+    out_f.write(''.join(parts))
+
+
+def write_test_source_file(template_file, c_file, snippets,
+                           input_cache=None, write_if_changed=False):
     """
     Write output source file with generated source code.
 
     :param template_file: Template file name
     :param c_file: Output source file
-    :param snippets: Generated and code snippets
+    :param snippets: Generated and code snippets. Snippets may also be
+                     file objects, whose contents are copied to the
+                     output.
+    :param input_cache: Optional cache of input file contents.
+                        See read_input_file().
+    :param write_if_changed: Leave c_file untouched if its contents
+                             don't change. See open_output_file().
     :return:
     """
-    with open(template_file, 'r') as template_f, open(c_file, 'w') as c_f:
-        for line_no, line in enumerate(template_f.readlines(), 1):
-            # Update line number. +1 as #line directive sets next line number
-            snippets['line_no'] = line_no + 1
-            code = string.Template(line).substitute(**snippets)
-            c_f.write(code)
+    segments = compile_template(read_input_file(template_file, input_cache))
+    with open_output_file(c_file, write_if_changed) as c_f:
+        render_template(segments, snippets, c_f)
+
+
+class FunctionFileInfo(collections.namedtuple('FunctionFileInfo', [
+        'suite_dependencies', 'func_info'])):
+    """
+    Information read from a functions file that the intermediate data
+    file depends on:
+
+    suite_dependencies: List of suite dependencies.
+    func_info: Dict keyed by function and with function id and
+               arguments info.
+    """
+    __slots__ = ()
 
 
 def parse_function_file(funcs_file, snippets):
@@ -993,36 +2282,756 @@ def parse_function_file(funcs_file, snippets):
     :param funcs_file: Functions file name
     :param snippets: Dictionary to contain code pieces to be
                      substituted in the template.
-    :return:
+    :return: FunctionFileInfo
     """
     with FileWrapper(funcs_file) as funcs_f:
         suite_dependencies, dispatch_code, func_code, func_info = \
             parse_functions(funcs_f)
         snippets['functions_code'] = func_code
         snippets['dispatch_code'] = dispatch_code
-        return suite_dependencies, func_info
+        return FunctionFileInfo(suite_dependencies, func_info)
+
 
+def open_check_code_snippets(suite_dependencies, snippets, options):
+    """
+    Opens the spool files of the dependency and expression check code
+    snippets, and writes the start of their guards.
 
-def generate_intermediate_data_file(data_file, out_data_file,
-                                    suite_dependencies, func_info, snippets):
+    :param suite_dependencies: List of suite dependencies.
+    :param snippets: Dictionary to contain code pieces to be
+                     substituted in the template. The spool files are
+                     added to it. See generate_intermediate_data_file().
+    :param options: DataOptions
+    :return: Dependency and expression check code spool files, and the
+             ends of their guards.
+    """
+    guard_start, guard_end = gen_suite_dep_guards(suite_dependencies)
+    dep_guard_start, dep_guard_end = guard_start, guard_end
+    expression_guard_start, expression_guard_end = guard_start, guard_end
+    dep_check_f = tempfile.SpooledTemporaryFile(CODE_SPOOL_MAX_SIZE, 'w+')
+    expression_f = tempfile.SpooledTemporaryFile(CODE_SPOOL_MAX_SIZE, 'w+')
+    if options.check_code_format == CHECK_CODE_TABLE:
+        bitmap_start, bitmap_end = \
+            gen_dep_bitmap_guards(len(options.shared_dependencies))
+        table_start, table_end = gen_expression_table_guards()
+        dep_guard_start += bitmap_start
+        dep_guard_end = bitmap_end + guard_end
+        expression_guard_start += table_start
+        expression_guard_end = table_end + guard_end
+        snippets['dep_check_table'] = dep_check_f
+        snippets['expression_table'] = expression_f
+    else:
+        snippets['dep_check_code'] = dep_check_f
+        snippets['expression_code'] = expression_f
+    dep_check_f.write(dep_guard_start)
+    expression_f.write(expression_guard_start)
+    return dep_check_f, expression_f, (dep_guard_end, expression_guard_end)
+
+
+def write_data_file(data_file, out_data_file, func_info, callbacks,
+                    options):
+    """
+    Writes the intermediate data file of a data file in either format.
+
+    :param data_file: Data file name
+    :param out_data_file: Output/Intermediate data file
+    :param func_info: Function info parsed from functions file.
+    :param callbacks: DataCallbacks. See write_test_data().
+    :param options: DataOptions
+    :return: Number of test cases read and number of test cases left
+             out, and the offset in out_data_file of the offsets given
+             to callbacks.write_index_entry.
+    """
+    if options.datax_format == DATAX_BINARY:
+        with FileWrapper(data_file) as data_f, \
+                BinaryDataWriter() as records_f:
+            counts = write_test_data(data_f, records_f, func_info,
+                                     callbacks, options)
+            with open_output_file(out_data_file, options.write_if_changed,
+                                  binary=True) as out_data_f:
+                records_f.write_data_file(out_data_f)
+            return counts, records_f.header_size
+    with FileWrapper(data_file) as data_f, \
+            open_output_file(out_data_file, options.write_if_changed) \
+            as out_data_f:
+        counts = write_test_data(data_f, OffsetTrackingWriter(out_data_f),
+                                 func_info, callbacks, options)
+    return counts, 0
+
+
+def generate_intermediate_data_file(data_file, out_data_file, functions,
+                                    snippets, options=DataOptions()):
     """
     Generates intermediate data file from input data file and
     information read from functions file.
 
     :param data_file: Data file name
     :param out_data_file: Output/Intermediate data file
-    :param suite_dependencies: List of suite dependencies.
-    :param func_info: Function info parsed from functions file.
+    :param functions: FunctionFileInfo parsed from functions file.
     :param snippets: Dictionary to contain code pieces to be
-                     substituted in the template.
+                     substituted in the template. The dependency and
+                     expression check code are added as spool files,
+                     which the caller must close. In table check code
+                     format, they are the dep_check_table and
+                     expression_table snippets instead of the
+                     dep_check_code and expression_code snippets.
+    :param options: DataOptions
+    :return: Number of test cases read and number of test cases left
+             out.
+    """
+    dep_check_f, expression_f, guard_ends = open_check_code_snippets(
+        functions.suite_dependencies, snippets, options)
+    index_f = None
+    entries = None
+    write_index_entry = None
+    if options.index_file:
+        # Entries are spooled since binary file offsets are only known
+        # once the size of the record index is.
+        index_f = tempfile.SpooledTemporaryFile(CODE_SPOOL_MAX_SIZE, 'w+')
+        write_index_entry = lambda offset, func_id, test_name: \
+            index_f.write('%d %d %s\n' % (offset, func_id, test_name))
+    if options.shards:
+        entries = []
+        write_index_entry = get_entry_collector(entries, write_index_entry)
+    try:
+        counts, base_offset = write_data_file(
+            data_file, out_data_file, functions.func_info,
+            DataCallbacks(dep_check_f.write, expression_f.write,
+                          write_index_entry), options)
+        if index_f is not None:
+            write_spooled_index(index_f, base_offset, options)
+        if entries is not None:
+            write_data_shards(out_data_file,
+                              [(offset + base_offset, func_id, test_name)
+                               for offset, func_id, test_name in entries],
+                              options)
+    finally:
+        if index_f is not None:
+            index_f.close()
+    dep_check_f.write(guard_ends[0])
+    expression_f.write(guard_ends[1])
+    return counts
+
+
+def write_spooled_index(index_f, base_offset, options):
+    """
+    Writes the test case index file from the entries spooled by
+    generate_intermediate_data_file().
+
+    :param index_f: Spool file of the index entries
+    :param base_offset: Offset to add to the spooled offsets
+    :param options: DataOptions with the index file name
     :return:
     """
-    with FileWrapper(data_file) as data_f, \
-            open(out_data_file, 'w') as out_data_f:
-        dep_check_code, expression_code = gen_from_test_data(
-            data_f, out_data_f, func_info, suite_dependencies)
-        snippets['dep_check_code'] = dep_check_code
-        snippets['expression_code'] = expression_code
+    index_f.seek(0)
+    with open_output_file(options.index_file,
+                          options.write_if_changed) as out_f:
+        for line in index_f:
+            offset, entry = line.split(' ', 1)
+            out_f.write('%d %s' % (int(offset) + base_offset, entry))
+
+
+def get_entry_collector(entries, write_index_entry=None):
+    """
+    Gives a write_test_data() index entry callback that collects the
+    entries in a list.
+
+    :param entries: List to append (offset, function id, name) tuples to
+    :param write_index_entry: Optional callback to pass the entries on to
+    :return: Index entry callback
+    """
+    def collect_entry(offset, func_id, test_name):
+        """
+        Collects an index entry.
+        """
+        entries.append((offset, func_id, test_name))
+        if write_index_entry is not None:
+            write_index_entry(offset, func_id, test_name)
+    return collect_entry
+
+
+def get_shard_file(out_data_file, shard):
+    """
+    Gives the name of a shard of an intermediate data file.
+    See DATAX_SHARD_FORMAT.
+
+    :param out_data_file: Intermediate data file name
+    :param shard: Shard number
+    :return: Shard file name
+    """
+    root, ext = os.path.splitext(out_data_file)
+    return DATAX_SHARD_FORMAT % (root, shard, ext)
+
+
+def read_duration_hints(hints_file, suite_name):
+    """
+    Reads the durations of the test cases of a test suite from a
+    duration hints file. See DURATION_HINTS_SEPARATOR. Empty lines and
+    lines starting with '#' are ignored.
+
+    :param hints_file: Duration hints file name
+    :param suite_name: Test suite name, e.g. test_suite_ssl
+    :return: Dictionary of durations in seconds by test case name
+    """
+    hints = {}
+    with io.open(hints_file, 'r', encoding='utf-8') as hints_f:
+        for line_no, line in enumerate(hints_f, 1):
+            line = line.rstrip('\r\n')
+            if not line or line.startswith('#'):
+                continue
+            try:
+                suite, rest = line.split(DURATION_HINTS_SEPARATOR, 1)
+                test_name, duration = rest.rsplit(DURATION_HINTS_SEPARATOR, 1)
+                duration = float(duration)
+            except ValueError:
+                raise GeneratorInputError("%s:%d: Invalid duration hint: %s" %
+                                          (hints_file, line_no, line))
+            if suite == suite_name:
+                hints[test_name] = duration
+    return hints
+
+
+def get_test_case_weights(test_names, duration_hints=None):
+    """
+    Gives the weights of test cases for balancing shards: their
+    durations if known, else the mean duration of the test cases whose
+    duration is known. Without duration hints, all test cases weigh 1.
+
+    :param test_names: Test case names
+    :param duration_hints: Optional durations of the test cases by name
+    :return: List of weights
+    """
+    if not duration_hints:
+        return [1.0] * len(test_names)
+    known = [duration_hints[name] for name in test_names
+             if name in duration_hints]
+    default = sum(known) / len(known) if known else 1.0
+    return [duration_hints.get(name, default) for name in test_names]
+
+
+def partition_test_cases(weights, shards):
+    """
+    Assigns test cases to shards of about the same total weight. Test
+    cases are assigned from the heaviest to the lightest, each to the
+    currently lightest shard. Ties are broken by test case and shard
+    order, so that the partition is stable.
+
+    :param weights: Weight of each test case
+    :param shards: Number of shards
+    :return: Shard number of each test case
+    """
+    loads = [(0.0, shard) for shard in range(shards)]
+    assignment = [0] * len(weights)
+    for index in sorted(range(len(weights)),
+                        key=lambda case: (-weights[case], case)):
+        load, shard = heapq.heappop(loads)
+        assignment[index] = shard
+        heapq.heappush(loads, (load + weights[index], shard))
+    return assignment
+
+
+def write_data_shards(out_data_file, entries, options):
+    """
+    Splits an intermediate data file into shards, copying the test cases
+    of each shard in their original order. Test cases are contiguous in
+    both formats, so each one extends to the next one's offset.
+    The shards are balanced with partition_test_cases().
+
+    :param out_data_file: Intermediate data file name
+    :param entries: (offset, function id, name) of the test cases in the
+                    intermediate data file, in file order
+    :param options: DataOptions: the number of shards, the duration
+                    hints and the format of the intermediate data file.
+                    Unchanged shards are left untouched in
+                    write_if_changed mode, and each shard gets a test
+                    case index if index_file is set.
+    :return:
+    """
+    assignment = partition_test_cases(
+        get_test_case_weights([entry[2] for entry in entries],
+                              options.duration_hints),
+        options.shards)
+    ends = [entry[0] for entry in entries[1:]]
+    ends.append(os.path.getsize(out_data_file))
+    with open(out_data_file, 'rb') as data_f:
+        for shard in range(options.shards):
+            shard_file = get_shard_file(out_data_file, shard)
+            cases = [(entry, end) for entry, end, case_shard
+                     in zip(entries, ends, assignment)
+                     if case_shard == shard]
+            shard_entries = write_data_shard(data_f, cases, shard_file,
+                                             options)
+            if options.index_file:
+                with open_output_file(shard_file + DATAX_INDEX_SUFFIX,
+                                      options.write_if_changed) as out_f:
+                    for entry in shard_entries:
+                        out_f.write('%d %d %s\n' % entry)
+
+
+def write_data_shard(data_f, cases, shard_file, options):
+    """
+    Copies test cases of an intermediate data file to a shard.
+
+    :param data_f: Intermediate data file object, in binary mode
+    :param cases: ((offset, function id, name), end offset) of the test
+                  cases of the shard, in file order
+    :param shard_file: Shard file name
+    :param options: DataOptions
+    :return: (offset, function id, name) of the test cases in the shard
+    """
+    shard_entries = []
+    if options.datax_format == DATAX_BINARY:
+        with BinaryDataWriter() as records_f:
+            for (offset, func_id, test_name), end in cases:
+                data_f.seek(offset)
+                shard_entries.append((records_f.tell(), func_id, test_name))
+                records_f.write(data_f.read(end - offset))
+            with open_output_file(shard_file, options.write_if_changed,
+                                  binary=True) as out_f:
+                records_f.write_data_file(out_f)
+            base_offset = records_f.header_size
+        return [(offset + base_offset, func_id, test_name)
+                for offset, func_id, test_name in shard_entries]
+    with open_output_file(shard_file, options.write_if_changed,
+                          binary=True) as out_f:
+        position = 0
+        for (offset, func_id, test_name), end in cases:
+            data_f.seek(offset)
+            shard_entries.append((position, func_id, test_name))
+            out_f.write(data_f.read(end - offset))
+            position += end - offset
+    return shard_entries
+
+
+def hash_file(hasher, file_name):
+    """
+    Feed the contents of a file to a hash object.
+
+    :param hasher: hashlib hash object
+    :param file_name: File name
+    :return:
+    """
+    with open(file_name, 'rb') as input_f:
+        for chunk in iter(lambda: input_f.read(1 << 16), b''):
+            hasher.update(chunk)
+
+
+def get_cache_key(**input_info):
+    """
+    Computes the generation cache key of a test suite. The key is a
+    hash of the generator source, of the generate_code() parameters
+    (including the input and output file names that are referred to in
+    the generated code) and of the contents of the input files.
+
+    :param input_info: generate_code() parameters.
+    :return: Key as a hex string
+    """
+    input_cache = input_info.get('input_cache')
+    hasher = hashlib.sha256()
+    hash_file(hasher, GENERATOR_SOURCE_FILE)
+    for name in sorted(input_info):
+        if name not in CACHE_KEY_IGNORED_PARAMS:
+            hasher.update(repr((name, input_info[name])).encode('utf-8'))
+    for name in ('template_file', 'platform_file', 'helpers_file'):
+        hasher.update(read_input_file(input_info[name],
+                                      input_cache).encode('utf-8'))
+    for name in ('funcs_file', 'data_file'):
+        hash_file(hasher, input_info[name])
+    for name in ('duration_hints_file', 'config_file'):
+        if input_info.get(name):
+            hash_file(hasher, input_info[name])
+    return hasher.hexdigest()
+
+
+def get_data_cache_key(suite_dependencies, func_info,
+                       function_dependencies=None, **input_info):
+    """
+    Computes the intermediate data cache key of a test suite. Unlike
+    get_cache_key(), the key doesn't depend on the whole functions file
+    but on the fingerprints of its test functions that the intermediate
+    data file depends on: their names, identifiers and argument types,
+    and their dependencies when test cases are left out by
+    configuration. Editing the body of a test function leaves the key
+    unchanged, so that only the C file has to be generated again.
+
+    :param suite_dependencies: Test suite dependencies
+    :param func_info: Function identifiers and argument types by name,
+                      from parse_function_file().
+    :param function_dependencies: Optional function dependencies by
+                                  name, from
+                                  collect_function_dependencies().
+    :param input_info: generate_code() parameters.
+    :return: Key as a hex string
+    """
+    hasher = hashlib.sha256()
+    hash_file(hasher, GENERATOR_SOURCE_FILE)
+    for name in sorted(input_info):
+        if name not in DATA_CACHE_KEY_IGNORED_PARAMS:
+            hasher.update(repr((name, input_info[name])).encode('utf-8'))
+    hash_file(hasher, input_info['data_file'])
+    for name in ('duration_hints_file', 'config_file'):
+        if input_info.get(name):
+            hash_file(hasher, input_info[name])
+    hasher.update(repr(list(suite_dependencies)).encode('utf-8'))
+    for func_name in sorted(func_info):
+        func_id, args = func_info[func_name]
+        fingerprint = (func_name, func_id, tuple(args))
+        if function_dependencies is not None:
+            fingerprint += (tuple(function_dependencies.get(func_name,
+                                                            ())),)
+        hasher.update(repr(fingerprint).encode('utf-8'))
+    return 'data-' + hasher.hexdigest()
+
+
+def get_cached_outputs(c_file, out_data_file, index_file=None, shards=0):
+    """
+    Lists the outputs of a test suite that are stored in the generation
+    cache.
+
+    :param c_file: Output C file name
+    :param out_data_file: Output intermediate data file name
+    :param index_file: Optional test case index file name
+    :param shards: Optional number of intermediate data file shards
+    :return: List of (cache entry file name, output file name) tuples
+    """
+    outputs = [('c', c_file), ('datax', out_data_file)]
+    if index_file:
+        outputs.append(('index', index_file))
+    for shard in range(shards):
+        shard_file = get_shard_file(out_data_file, shard)
+        outputs.append(('shard%d' % shard, shard_file))
+        if index_file:
+            outputs.append(('shard%d.index' % shard,
+                            shard_file + DATAX_INDEX_SUFFIX))
+    return outputs
+
+
+def copy_from_cache(cache_dir, key, outputs, write_if_changed=False):
+    """
+    Copies output files from a generation cache entry.
+
+    :param cache_dir: Generation cache dir
+    :param key: Cache key of the entry
+    :param outputs: List of (cache entry file name, output file name)
+                    tuples
+    :param write_if_changed: Leave outputs untouched if their contents
+                             don't change. See open_output_file().
+    :return: True if the entry was found in the cache
+    """
+    entry_dir = os.path.join(cache_dir, key)
+    if not os.path.isdir(entry_dir):
+        return False
+    # Binary mode, since the intermediate data file may be binary
+    for name, out_file in outputs:
+        with open(os.path.join(entry_dir, name), 'rb') as cached_f, \
+                open_output_file(out_file, write_if_changed,
+                                 binary=True) as out_f:
+            shutil.copyfileobj(cached_f, out_f)
+    return True
+
+
+def copy_to_cache(cache_dir, key, outputs, snippets=None):
+    """
+    Copies output files, and optionally snippets, to a new generation
+    cache entry. The entry is created under a temporary name and
+    renamed, so that concurrent generators never see a partial entry.
+
+    :param cache_dir: Generation cache dir
+    :param key: Cache key of the entry
+    :param outputs: List of (cache entry file name, output file name)
+                    tuples
+    :param snippets: Optional snippets to store, by cache entry file
+                     name. Strings or file objects.
+    :return:
+    """
+    if not os.path.exists(cache_dir):
+        try:
+            os.makedirs(cache_dir)
+        except OSError:
+            # Created concurrently by another generator
+            if not os.path.isdir(cache_dir):
+                raise
+    tmp_dir = tempfile.mkdtemp(prefix='tmp-', dir=cache_dir)
+    try:
+        for name, out_file in outputs:
+            shutil.copyfile(out_file, os.path.join(tmp_dir, name))
+        for name, snippet in (snippets or {}).items():
+            with open(os.path.join(tmp_dir, name), 'w') as cached_f:
+                if hasattr(snippet, 'read'):
+                    snippet.seek(0)
+                    shutil.copyfileobj(snippet, cached_f)
+                else:
+                    cached_f.write(snippet)
+        os.rename(tmp_dir, os.path.join(cache_dir, key))
+    except OSError:
+        # The same entry has been stored concurrently.
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def get_cached_data_outputs(out_data_file, index_file=None, shards=0):
+    """
+    Lists the intermediate data outputs of a test suite that are stored
+    in an intermediate data cache entry. See get_data_cache_key().
+
+    :param out_data_file: Output intermediate data file name
+    :param index_file: Optional test case index file name
+    :param shards: Optional number of intermediate data file shards
+    :return: List of (cache entry file name, output file name) tuples
+    """
+    return [(name, out_file) for name, out_file
+            in get_cached_outputs(None, out_data_file, index_file, shards)
+            if name != 'c']
+
+
+def restore_data_from_cache(cache_dir, key, outputs, snippets,
+                            write_if_changed=False):
+    """
+    Copies the intermediate data outputs of a test suite from the
+    generation cache, and opens its cached check code snippets in
+    place of generate_intermediate_data_file().
+
+    :param cache_dir: Generation cache dir
+    :param key: Cache key from get_data_cache_key()
+    :param outputs: Intermediate data outputs from
+                    get_cached_data_outputs()
+    :param snippets: Dictionary to contain the check code snippets, as
+                     file objects which the caller must close.
+    :param write_if_changed: Leave outputs untouched if their contents
+                             don't change. See open_output_file().
+    :return: Number of test cases read and number of test cases left
+             out, or None if the outputs are not in the cache.
+    """
+    if not copy_from_cache(cache_dir, key, outputs, write_if_changed):
+        return None
+    entry_dir = os.path.join(cache_dir, key)
+    for name in CHECK_CODE_SNIPPETS:
+        snippet_file = os.path.join(entry_dir, name)
+        if os.path.exists(snippet_file):
+            snippets[name] = open(snippet_file, 'r')
+    with open(os.path.join(entry_dir, 'counts'), 'r') as counts_f:
+        test_count, dropped_count = counts_f.read().split()
+    return int(test_count), int(dropped_count)
+
+
+def store_data_in_cache(cache_dir, key, outputs, snippets, counts):
+    """
+    Copies the intermediate data outputs of a test suite and its check
+    code snippets to the generation cache.
+
+    :param cache_dir: Generation cache dir
+    :param key: Cache key from get_data_cache_key()
+    :param outputs: Intermediate data outputs from
+                    get_cached_data_outputs()
+    :param snippets: Snippets from generate_intermediate_data_file()
+    :param counts: Number of test cases read and number of test cases
+                   left out
+    :return:
+    """
+    cached_snippets = {'counts': '%d %d\n' % counts}
+    for name in CHECK_CODE_SNIPPETS:
+        if hasattr(snippets.get(name), 'read'):
+            cached_snippets[name] = snippets[name]
+    copy_to_cache(cache_dir, key, outputs, cached_snippets)
+
+
+class GenerationProfile(object):
+    """
+    Wall and CPU time of the generation phases of a test suite, with the
+    size of its inputs and outputs and the number of records generated.
+    Written as one JSON object per line, so that the profiles of all
+    the suites of a build can be appended to the same file and
+    aggregated.
+    """
+
+    def __init__(self, suite_name):
+        """
+        Instantiate the profile of a test suite.
+
+        :param suite_name: Test suite name, the data file base name.
+        """
+        self.suite_name = suite_name
+        self.phases = {}
+        self.sizes = {}
+        self.counts = {}
+        self.cached = False
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """
+        Times a generation phase. The times of a phase entered several
+        times add up.
+
+        :param name: Phase name, one of PROFILE_PHASES.
+        :return: Context manager timing its body
+        """
+        wall_start, cpu_start = WALL_CLOCK(), CPU_CLOCK()
+        try:
+            yield
+        finally:
+            times = self.phases.setdefault(name, {'wall': 0.0, 'cpu': 0.0})
+            times['wall'] += WALL_CLOCK() - wall_start
+            times['cpu'] += CPU_CLOCK() - cpu_start
+
+    def add_file_sizes(self, **files):
+        """
+        Records the size of input or output files that exist.
+
+        :param files: File names by profile key, e.g. c_file.
+        :return:
+        """
+        for name, file_name in files.items():
+            if file_name and os.path.exists(file_name):
+                self.sizes[name] = os.path.getsize(file_name)
+
+    def to_json(self):
+        """
+        Serializes the profile as a single line of JSON.
+
+        :return: JSON string, without line feed
+        """
+        return json.dumps({'suite': self.suite_name,
+                           'cached': self.cached,
+                           'phases': self.phases,
+                           'bytes': self.sizes,
+                           'counts': self.counts}, sort_keys=True)
+
+    def append_to(self, profile_file):
+        """
+        Appends the profile to a profile file. The line is written with
+        a single write to a file opened in append mode, so that the
+        suites generated concurrently in batch mode don't interleave
+        partial lines.
+
+        :param profile_file: Profile file name
+        :return:
+        """
+        line = (self.to_json() + '\n').encode('utf-8')
+        fd = os.open(profile_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                     0o666)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+
+def check_input_files(input_info):
+    """
+    Checks that the input files of a test suite exist.
+
+    :param input_info: generate_code() parameters.
+    :return:
+    """
+    for name, key in [('Functions file', 'funcs_file'),
+                      ('Data file', 'data_file'),
+                      ('Template file', 'template_file'),
+                      ('Platform file', 'platform_file'),
+                      ('Helpers code file', 'helpers_file'),
+                      ('Suites dir', 'suites_dir')]:
+        if not os.path.exists(input_info[key]):
+            raise IOError("ERROR: %s [%s] not found!" %
+                          (name, input_info[key]))
+
+
+def get_data_options(input_info):
+    """
+    Gives the intermediate data options of a test suite, except the
+    duration hints and the unreachable check, which are only read when
+    the intermediate data is generated. See generate_or_restore_data().
+
+    :param input_info: generate_code() parameters.
+    :return: DataOptions
+    """
+    index_file = None
+    if input_info.get('write_index', False):
+        index_file = input_info['out_data_file'] + DATAX_INDEX_SUFFIX
+    return DataOptions(
+        write_if_changed=input_info.get('write_if_changed', False),
+        datax_format=input_info.get('datax_format', DATAX_TEXT),
+        index_file=index_file,
+        shards=input_info.get('shards', 0),
+        shared_dependencies=input_info.get('shared_dependencies', ()),
+        check_code_format=input_info.get('check_code_format',
+                                         CHECK_CODE_SWITCH))
+
+
+def get_input_snippets(input_info):
+    """
+    Gives the snippets of a test suite that don't depend on the contents
+    of its input files: the generator and input file names, and the
+    include of the shared dependency table. The check code snippets are
+    empty until generated.
+
+    :param input_info: generate_code() parameters.
+    :return: Dictionary of code pieces to be substituted in the template.
+    """
+    snippets = {'generator_script': os.path.basename(__file__)}
+    add_input_info(input_info['funcs_file'], input_info['data_file'],
+                   input_info['template_file'], input_info['c_file'],
+                   snippets)
+    for name in ('shared_dependencies', 'dep_check_code', 'expression_code',
+                 'dep_check_table', 'expression_table'):
+        snippets[name] = ''
+    shared_deps_file = input_info.get('shared_deps_file')
+    if shared_deps_file:
+        snippets['shared_dependencies'] = '#include "%s"' % \
+            os.path.relpath(get_shared_deps_header(shared_deps_file),
+                            os.path.dirname(
+                                os.path.abspath(input_info['c_file']))) \
+            .replace(os.sep, '/')
+    return snippets
+
+
+def generate_or_restore_data(functions, snippets, options, profile,
+                             input_info):
+    """
+    Generates the intermediate data outputs and check code snippets of a
+    test suite, or restores them from the generation cache when only the
+    bodies of its test functions changed. See get_data_cache_key().
+
+    :param functions: FunctionFileInfo parsed from the functions file.
+    :param snippets: Dictionary to contain the check code snippets, as
+                     file objects which the caller must close.
+    :param options: DataOptions from get_data_options()
+    :param profile: GenerationProfile of the test suite
+    :param input_info: generate_code() parameters.
+    :return: Number of test cases read and number of test cases left
+             out.
+    """
+    cache_dir = input_info.get('cache_dir')
+    config_file = input_info.get('config_file')
+    function_dependencies = None
+    if config_file:
+        function_dependencies = \
+            collect_function_dependencies(input_info['funcs_file'])
+    data_cache_key = None
+    if cache_dir:
+        data_cache_key = get_data_cache_key(functions.suite_dependencies,
+                                            functions.func_info,
+                                            function_dependencies,
+                                            **input_info)
+        cached_outputs = get_cached_data_outputs(input_info['out_data_file'],
+                                                 options.index_file,
+                                                 options.shards)
+        counts = restore_data_from_cache(cache_dir, data_cache_key,
+                                         cached_outputs, snippets,
+                                         options.write_if_changed)
+        if counts is not None:
+            return counts
+    if options.shards and input_info.get('duration_hints_file'):
+        options = options._replace(duration_hints=read_duration_hints(
+            input_info['duration_hints_file'], profile.suite_name))
+    if config_file:
+        options = options._replace(is_unreachable=get_unreachable_check(
+            load_config(config_file), functions.suite_dependencies,
+            function_dependencies))
+    with profile.phase('generate_intermediate_data_file'):
+        counts = generate_intermediate_data_file(input_info['data_file'],
+                                                 input_info['out_data_file'],
+                                                 functions, snippets, options)
+    if data_cache_key:
+        store_data_in_cache(cache_dir, data_cache_key, cached_outputs,
+                            snippets, counts)
+    return counts
 
 
 def generate_code(**input_info):
@@ -1039,41 +3048,263 @@ def generate_code(**input_info):
     suites_dir: Test suites dir
     c_file: Output C file object
     out_data_file: Output intermediate data file object
+    input_cache: Optional cache of the common input files contents.
+                 See read_input_file().
+    cache_dir: Optional generation cache dir. When the outputs for
+               identical inputs are found there, they are restored
+               instead of being generated. So are the intermediate
+               data outputs when only the bodies of test functions
+               change. See get_data_cache_key().
+    write_if_changed: Optional flag to leave outputs untouched when
+                      their contents don't change.
+                      See open_output_file().
+    datax_format: Optional intermediate data file format, DATAX_TEXT
+                  (default) or DATAX_BINARY.
+    write_index: Optional flag to write a test case index next to the
+                 intermediate data file. See DATAX_INDEX_SUFFIX.
+    shards: Optional number of shards to split the intermediate data
+            file into, all run by the same test suite binary.
+            See DATAX_SHARD_FORMAT.
+    duration_hints_file: Optional test duration hints file, to balance
+                         the shards by duration instead of by test case
+                         count. See read_duration_hints().
+    shared_deps_file: Optional C file of the dependency table shared
+                      by all test suites. The C file includes the
+                      header that declares it.
+                      See gen_shared_dependencies_table().
+    shared_dependencies: Dependencies of the shared dependency table,
+                         required with shared_deps_file.
+    config_file: Optional configuration file, e.g. config.h, that the
+                 test suite is built with. Test cases that can't run
+                 in this configuration are left out of the intermediate
+                 data file, and their number is reported.
+                 See evaluate_dependency().
+    check_code_format: Optional format of the dependency and expression
+                       check code, CHECK_CODE_SWITCH (default) or
+                       CHECK_CODE_TABLE.
+    profile_file: Optional file to append the GenerationProfile of the
+                  suite to.
     :return:
     """
-    funcs_file = input_info['funcs_file']
-    data_file = input_info['data_file']
-    template_file = input_info['template_file']
-    platform_file = input_info['platform_file']
-    helpers_file = input_info['helpers_file']
-    suites_dir = input_info['suites_dir']
+    check_input_files(input_info)
     c_file = input_info['c_file']
     out_data_file = input_info['out_data_file']
-    for name, path in [('Functions file', funcs_file),
-                       ('Data file', data_file),
-                       ('Template file', template_file),
-                       ('Platform file', platform_file),
-                       ('Helpers code file', helpers_file),
-                       ('Suites dir', suites_dir)]:
-        if not os.path.exists(path):
-            raise IOError("ERROR: %s [%s] not found!" % (name, path))
+    cache_dir = input_info.get('cache_dir')
+    profile_file = input_info.get('profile_file')
+    options = get_data_options(input_info)
+    suite_name = os.path.splitext(os.path.basename(input_info['data_file']))[0]
+    profile = GenerationProfile(suite_name)
+    profile.add_file_sizes(functions_file=input_info['funcs_file'],
+                           data_file=input_info['data_file'])
+    if cache_dir:
+        cache_key = get_cache_key(**input_info)
+        cached_outputs = get_cached_outputs(c_file, out_data_file,
+                                            options.index_file, options.shards)
+        if copy_from_cache(cache_dir, cache_key, cached_outputs,
+                           options.write_if_changed):
+            if profile_file:
+                profile.cached = True
+                profile.add_file_sizes(c_file=c_file,
+                                       datax_file=out_data_file)
+                profile.append_to(profile_file)
+            return
+
+    snippets = get_input_snippets(input_info)
+    with profile.phase('read_code_from_input_files'):
+        read_code_from_input_files(input_info['platform_file'],
+                                   input_info['helpers_file'],
+                                   out_data_file, snippets,
+                                   input_info.get('input_cache'))
+    with profile.phase('parse_function_file'):
+        functions = parse_function_file(input_info['funcs_file'], snippets)
+    try:
+        test_count, dropped_count = generate_or_restore_data(
+            functions, snippets, options, profile, input_info)
+        with profile.phase('write_test_source_file'):
+            write_test_source_file(input_info['template_file'], c_file,
+                                   snippets, input_info.get('input_cache'),
+                                   options.write_if_changed)
+    finally:
+        for snippet in snippets.values():
+            if hasattr(snippet, 'close'):
+                snippet.close()
+    if input_info.get('config_file'):
+        sys.stdout.write("%s: %d of %d test cases left out, unreachable "
+                         "with %s\n" % (suite_name, dropped_count,
+                                        test_count, input_info['config_file']))
+    if cache_dir:
+        copy_to_cache(cache_dir, cache_key, cached_outputs)
+    if profile_file:
+        profile.counts.update(test_functions=len(functions.func_info),
+                              test_cases=test_count,
+                              test_cases_left_out=dropped_count)
+        profile.add_file_sizes(c_file=c_file, datax_file=out_data_file)
+        profile.append_to(profile_file)
+
+
+def get_functions_file(data_file, suites_dir):
+    """
+    Find the functions file for a data file, following the naming
+    convention test_suite_<module>[.<optional sub module>].data
+    -> test_suite_<module>.function.
 
-    snippets = {'generator_script': os.path.basename(__file__)}
-    read_code_from_input_files(platform_file, helpers_file,
-                               out_data_file, snippets)
-    add_input_info(funcs_file, data_file, template_file,
-                   c_file, snippets)
-    suite_dependencies, func_info = parse_function_file(funcs_file, snippets)
-    generate_intermediate_data_file(data_file, out_data_file,
-                                    suite_dependencies, func_info, snippets)
-    write_test_source_file(template_file, c_file, snippets)
+    :param data_file: Data file name
+    :param suites_dir: Test suites dir
+    :return: Functions file name
+    """
+    suite_name = os.path.basename(data_file).split('.')[0]
+    return os.path.join(suites_dir, suite_name + '.function')
 
 
-def main():
+def get_output_files(data_file, out_dir):
+    """
+    Construct the output C and intermediate data file names for a data
+    file, creating the output directory if needed.
+
+    :param data_file: Data file name
+    :param out_dir: Output directory
+    :return: Output C file name and intermediate data file name
+    """
+    data_file_name = os.path.basename(data_file)
+    data_name = os.path.splitext(data_file_name)[0]
+
+    out_c_file = os.path.join(out_dir, data_name + '.c')
+    out_data_file = os.path.join(out_dir, data_name + '.datax')
+
+    out_c_file_dir = os.path.dirname(out_c_file)
+    out_data_file_dir = os.path.dirname(out_data_file)
+    for directory in [out_c_file_dir, out_data_file_dir]:
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+    return out_c_file, out_data_file
+
+
+def parse_batch_manifest(manifest_f, suites_dir):
+    """
+    Parses the list of test suites to generate in batch mode.
+    Each non-empty line that is not a '#' comment names a data file,
+    optionally preceded by its functions file:
+
+     [FUNCTIONS_FILE] DATA_FILE
+
+    When the functions file is omitted, it is derived from the data file
+    name with get_functions_file().
+
+    :param manifest_f: file object of the manifest file.
+    :param suites_dir: Test suites dir
+    :return: List of (functions file, data file) tuples
+    """
+    suites = []
+    for line_no, line in enumerate(manifest_f, 1):
+        words = line.split()
+        if not words or words[0].startswith('#'):
+            continue
+        if len(words) == 1:
+            suites.append((get_functions_file(words[0], suites_dir),
+                           words[0]))
+        elif len(words) == 2:
+            suites.append((words[0], words[1]))
+        else:
+            raise GeneratorInputError(
+                "%s:%d: expected [FUNCTIONS_FILE] DATA_FILE" %
+                (manifest_f.name, line_no))
+    return suites
+
+
+# Input file cache of a suite generation worker process
+_WORKER_INPUT_CACHE = {}
+
+
+def generate_suite(suite, out_dir, input_info, input_cache=None):
+    """
+    Generates one test suite of a batch, reporting input errors instead
+    of raising them, so that the other suites of the batch can still be
+    generated.
+
+    :param suite: (functions file, data file) tuple
+    :param out_dir: Dir where generated code and data files are written
+    :param input_info: Common generate_code() parameters.
+    :param input_cache: Optional cache of input file contents.
+                        See read_input_file().
+    :return: Error message or None on success
+    """
+    funcs_file, data_file = suite
+    try:
+        c_file, out_data_file = get_output_files(data_file, out_dir)
+        generate_code(funcs_file=funcs_file, data_file=data_file,
+                      c_file=c_file, out_data_file=out_data_file,
+                      input_cache=input_cache, **input_info)
+    except (GeneratorInputError, EnvironmentError, ValueError) as err:
+        message = str(err)
+        if data_file not in message:
+            message = "%s: %s" % (data_file, message)
+        return message
+    return None
+
+
+def _generate_suite_worker(task):
+    """
+    Process pool entry point for generate_suites().
+
+    :param task: (index, suite, out_dir, input_info) tuple
+    :return: (index, error message or None) tuple
+    """
+    index, suite, out_dir, input_info = task
+    return index, generate_suite(suite, out_dir, input_info,
+                                 _WORKER_INPUT_CACHE)
+
+
+def generate_suites(suites, out_dir, jobs=1, **input_info):
+    """
+    Generates C source code and intermediate data files for several
+    test suites in one go. The template, helpers and platform files are
+    read once per process and shared by all the suites.
+
+    With jobs > 1 the suites are generated concurrently by a pool of
+    worker processes, starting with the largest data files so that big
+    suites don't end up running last. Each suite only writes its own
+    output files, so the output does not depend on the scheduling.
+
+    :param suites: List of (functions file, data file) tuples
+    :param out_dir: Dir where generated code and data files are written
+    :param jobs: Number of worker processes. 0 means one per CPU.
+    :param input_info: Common generate_code() parameters: template_file,
+                       platform_file, helpers_file and suites_dir.
+    :return: List of error messages, in the order of the suites.
+    """
+    if jobs == 0:
+        jobs = multiprocessing.cpu_count()
+    errors = [None] * len(suites)
+    if jobs <= 1 or len(suites) <= 1:
+        input_cache = {}
+        for index, suite in enumerate(suites):
+            errors[index] = generate_suite(suite, out_dir, input_info,
+                                           input_cache)
+    else:
+        def data_size(index):
+            """Size of the data file of a suite, 0 if it doesn't exist."""
+            data_file = suites[index][1]
+            return os.path.getsize(data_file) \
+                if os.path.exists(data_file) else 0
+        order = sorted(range(len(suites)), key=data_size, reverse=True)
+        tasks = [(index, suites[index], out_dir, input_info)
+                 for index in order]
+        pool = multiprocessing.Pool(min(jobs, len(suites)))
+        try:
+            for index, error in pool.imap_unordered(_generate_suite_worker,
+                                                    tasks):
+                errors[index] = error
+        finally:
+            pool.close()
+            pool.join()
+    return [error for error in errors if error is not None]
+
+
+def get_argument_parser():
     """
     Command line parser.
 
-    :return:
+    :return: argparse.ArgumentParser
     """
     parser = argparse.ArgumentParser(
         description='Dynamically generate test suite code.')
@@ -1081,14 +3312,12 @@ def main():
     parser.add_argument("-f", "--functions-file",
                         dest="funcs_file",
                         help="Functions file",
-                        metavar="FUNCTIONS_FILE",
-                        required=True)
+                        metavar="FUNCTIONS_FILE")
 
     parser.add_argument("-d", "--data-file",
                         dest="data_file",
                         help="Data file",
-                        metavar="DATA_FILE",
-                        required=True)
+                        metavar="DATA_FILE")
 
     parser.add_argument("-t", "--template-file",
                         dest="template_file",
@@ -1120,25 +3349,242 @@ def main():
                         metavar="OUT_DIR",
                         required=True)
 
-    args = parser.parse_args()
+    parser.add_argument("--batch",
+                        dest="batch",
+                        action="store_true",
+                        help="Generate all the suites given by BATCH_DATA_FILE"
+                        " arguments and the manifest file in one process."
+                        " The functions file of each suite is derived"
+                        " from its data file name.")
+
+    parser.add_argument("--manifest",
+                        dest="manifest",
+                        help="File listing the suites to generate in batch"
+                        " mode, one '[FUNCTIONS_FILE] DATA_FILE' per line."
+                        " Implies --batch.",
+                        metavar="MANIFEST_FILE")
+
+    parser.add_argument("-j", "--jobs",
+                        dest="jobs",
+                        type=int,
+                        default=1,
+                        help="Number of suites to generate concurrently in"
+                        " batch mode. 0 means one per CPU. Default: 1.",
+                        metavar="JOBS")
+
+    parser.add_argument("--cache-dir",
+                        dest="cache_dir",
+                        help="Dir of the generation cache. Outputs are"
+                        " restored from it when all the inputs are"
+                        " unchanged.",
+                        metavar="CACHE_DIR")
+
+    parser.add_argument("--write-if-changed",
+                        dest="write_if_changed",
+                        action="store_true",
+                        help="Only replace output files whose contents"
+                        " change, so that unchanged outputs keep their"
+                        " timestamp and don't trigger a rebuild.")
+
+    parser.add_argument("--datax-format",
+                        dest="datax_format",
+                        choices=DATAX_FORMATS,
+                        default=DATAX_TEXT,
+                        help="Format of the intermediate data files. The"
+                        " binary format holds pre-converted test parameters"
+                        " and is only supported by host_test.function."
+                        " Default: %s." % DATAX_TEXT)
+
+    parser.add_argument("--check-code-format",
+                        dest="check_code_format",
+                        choices=CHECK_CODE_FORMATS,
+                        default=CHECK_CODE_SWITCH,
+                        help="Format of the generated dependency and"
+                        " expression check code: switch statements, or a"
+                        " dependency bitmap and an expression value table"
+                        " that compile faster. Default: %s." %
+                        CHECK_CODE_SWITCH)
+
+    parser.add_argument("--index",
+                        dest="write_index",
+                        action="store_true",
+                        help="Write a test case index next to each"
+                        " intermediate data file, so that the host test"
+                        " code can run selected test cases directly.")
+
+    parser.add_argument("--shards",
+                        dest="shards",
+                        type=int,
+                        default=0,
+                        help="Also split each intermediate data file into"
+                        " SHARDS files of balanced test cases, which the"
+                        " test suite can run concurrently.",
+                        metavar="SHARDS")
+
+    parser.add_argument("--duration-hints",
+                        dest="duration_hints_file",
+                        help="Balance shards by the test case durations"
+                        " in DURATION_HINTS_FILE, one"
+                        " 'SUITE;TEST CASE;SECONDS' per line, instead of"
+                        " by test case count.",
+                        metavar="DURATION_HINTS_FILE")
+
+    parser.add_argument("--shared-deps",
+                        dest="shared_deps_file",
+                        help="Check the dependencies of all test suites"
+                        " in the shared table of the C file"
+                        " SHARED_DEPS_FILE, compiled once and linked into"
+                        " every test suite, instead of in each generated"
+                        " C file. The table is declared in the header of"
+                        " the same name. In batch mode, the table is"
+                        " written or extended with the dependencies of the"
+                        " given suites that the --config file, by default"
+                        " include/mbedtls/config.h, decides, which"
+                        " requires Python 3. Otherwise it must exist.",
+                        metavar="SHARED_DEPS_FILE")
+
+    parser.add_argument("--shared-deps-only",
+                        dest="shared_deps_only",
+                        action="store_true",
+                        help="In batch mode, only write or extend the"
+                        " --shared-deps table, without generating the"
+                        " suites.")
+
+    parser.add_argument("--config",
+                        dest="config_file",
+                        help="Leave out the test cases that can't run with"
+                        " the configuration file CONFIG_FILE, e.g."
+                        " include/mbedtls/config.h, because one of their"
+                        " dependencies is statically false. The test"
+                        " suites must be built with this configuration."
+                        " Requires Python 3.",
+                        metavar="CONFIG_FILE")
+
+    parser.add_argument("--profile",
+                        dest="profile_file",
+                        help="Append the wall and CPU time of each"
+                        " generation phase of each suite, with the size of"
+                        " its inputs and outputs and its number of test"
+                        " cases, to PROFILE_FILE as one JSON object per"
+                        " line.",
+                        metavar="PROFILE_FILE")
+
+    parser.add_argument("batch_data_files",
+                        nargs="*",
+                        help="Data files to generate in batch mode",
+                        metavar="BATCH_DATA_FILE")
+    return parser
+
+
+def get_common_input_info(parser, args):
+    """
+    Gives the generate_code() parameters common to all the suites to
+    generate from the command line arguments.
 
-    data_file_name = os.path.basename(args.data_file)
-    data_name = os.path.splitext(data_file_name)[0]
+    :param parser: Command line parser, to report invalid arguments
+    :param args: Parsed command line arguments
+    :return: Dictionary of generate_code() parameters
+    """
+    common_input_info = dict(template_file=args.template_file,
+                             platform_file=args.platform_file,
+                             helpers_file=args.helpers_file,
+                             suites_dir=args.suites_dir)
+    if args.cache_dir:
+        common_input_info['cache_dir'] = args.cache_dir
+    if args.write_if_changed:
+        common_input_info['write_if_changed'] = True
+    if args.datax_format != DATAX_TEXT:
+        common_input_info['datax_format'] = args.datax_format
+    if args.check_code_format != CHECK_CODE_SWITCH:
+        common_input_info['check_code_format'] = args.check_code_format
+    if args.write_index:
+        common_input_info['write_index'] = True
+    if args.shards < 0:
+        parser.error("--shards must not be negative")
+    if args.shards:
+        common_input_info['shards'] = args.shards
+        if args.duration_hints_file:
+            common_input_info['duration_hints_file'] = \
+                args.duration_hints_file
+    elif args.duration_hints_file:
+        parser.error("--duration-hints requires --shards")
+    if args.config_file:
+        common_input_info['config_file'] = args.config_file
+    if args.profile_file:
+        common_input_info['profile_file'] = args.profile_file
+    return common_input_info
+
+
+def generate_batch(parser, args, common_input_info):
+    """
+    Generates the suites given by the command line arguments in batch
+    mode.
 
-    out_c_file = os.path.join(args.out_dir, data_name + '.c')
-    out_data_file = os.path.join(args.out_dir, data_name + '.datax')
+    :param parser: Command line parser, to report invalid arguments
+    :param args: Parsed command line arguments
+    :param common_input_info: generate_code() parameters common to all
+                              the suites. See get_common_input_info().
+    :return:
+    """
+    if args.funcs_file or args.data_file:
+        parser.error("-f/-d cannot be used in batch mode")
+    suites = [(get_functions_file(data_file, args.suites_dir), data_file)
+              for data_file in args.batch_data_files]
+    if args.manifest:
+        with open(args.manifest, 'r') as manifest_f:
+            suites += parse_batch_manifest(manifest_f, args.suites_dir)
+    if args.shared_deps_file:
+        common_input_info['shared_deps_file'] = args.shared_deps_file
+        common_input_info['shared_dependencies'] = tuple(
+            update_shared_dependencies(
+                args.shared_deps_file, suites,
+                load_config(args.config_file or DEFAULT_CONFIG_FILE),
+                args.write_if_changed))
+        if args.shared_deps_only:
+            return
+    elif args.shared_deps_only:
+        parser.error("--shared-deps-only requires --shared-deps")
+    errors = generate_suites(suites, args.out_dir, jobs=args.jobs,
+                             **common_input_info)
+    if errors:
+        raise GeneratorInputError(
+            "%d of %d suites failed:\n%s" %
+            (len(errors), len(suites), '\n'.join(errors)))
 
-    out_c_file_dir = os.path.dirname(out_c_file)
-    out_data_file_dir = os.path.dirname(out_data_file)
-    for directory in [out_c_file_dir, out_data_file_dir]:
-        if not os.path.exists(directory):
-            os.makedirs(directory)
 
+def main():
+    """
+    Command line parser.
+
+    :return:
+    """
+    parser = get_argument_parser()
+    args = parser.parse_args()
+    common_input_info = get_common_input_info(parser, args)
+    if args.batch or args.manifest:
+        generate_batch(parser, args, common_input_info)
+        return
+
+    if not args.funcs_file or not args.data_file:
+        parser.error("-f/--functions-file and -d/--data-file are required"
+                     " unless --batch is given")
+    if args.batch_data_files:
+        parser.error("data file arguments are only accepted with --batch")
+
+    if args.shared_deps_only:
+        parser.error("--shared-deps-only requires --batch")
+    if args.shared_deps_file:
+        if not os.path.exists(args.shared_deps_file):
+            raise GeneratorInputError(
+                "Shared dependency table %s not found. Generate it with"
+                " --batch." % args.shared_deps_file)
+        common_input_info['shared_deps_file'] = args.shared_deps_file
+        common_input_info['shared_dependencies'] = tuple(
+            read_shared_dependencies(args.shared_deps_file))
+    out_c_file, out_data_file = get_output_files(args.data_file, args.out_dir)
     generate_code(funcs_file=args.funcs_file, data_file=args.data_file,
-                  template_file=args.template_file,
-                  platform_file=args.platform_file,
-                  helpers_file=args.helpers_file, suites_dir=args.suites_dir,
-                  c_file=out_c_file, out_data_file=out_data_file)
+                  c_file=out_c_file, out_data_file=out_data_file,
+                  **common_input_info)
 
 
 if __name__ == "__main__":
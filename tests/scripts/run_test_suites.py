@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+
+"""Execute the test suites concurrently and print a summary of the results.
+
+This is a parallel alternative to run-test-suites.pl. Test suites are run
+longest first, according to the durations recorded by the previous run, so
+that the longest suites don't end up running alone at the end. The duration
+of each suite is recorded for the next run.
+
+If an outcome file is given, with --outcome-file or MBEDTLS_TEST_OUTCOME_FILE,
+each suite writes its outcomes to a file of its own, which is appended to the
+outcome file as soon as the suite finishes.
+"""
+
+# Copyright The Mbed TLS Contributors
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import concurrent.futures
+import glob
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+
+DEFAULT_DURATIONS_FILE = 'test-suite-durations.csv'
+
+class Job:
+    """A test suite, or a shard of a test suite, to run."""
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, suite, data_file=None):
+        self.suite = suite
+        self.data_file = data_file
+        if data_file is None:
+            self.name = suite
+        else:
+            self.name = re.sub(r'\.datax$', '', os.path.basename(data_file))
+
+    def command(self, verbose):
+        """Return the command line that runs this job."""
+        prefix = '' if os.name == 'nt' else './'
+        command = [prefix + self.suite]
+        if verbose:
+            command.append('-v')
+        if self.data_file is not None:
+            command.append(self.data_file)
+        return command
+
+class JobResult:
+    """The results of a job, parsed from the test suite output."""
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, job, status, output, duration):
+        self.job = job
+        self.status = status
+        self.output = output
+        self.duration = duration
+        self.passed = len(re.findall(r'\.\. PASS$', output, re.M))
+        self.failed = len(re.findall(r'\.\. FAILED$', output, re.M))
+        self.skipped = len(re.findall(r'\.\. ----$', output, re.M))
+        m = re.search(r'([0-9]+) / ([0-9]+) tests \(([0-9]+) skipped\)', output)
+        self.tests_run = int(m.group(2)) - int(m.group(3)) if m else 0
+
+    def summary(self):
+        """Return the job summary as a JSON-serializable dictionary."""
+        return {'name': self.job.name,
+                'status': 'PASS' if self.status == 0 else 'FAIL',
+                'exit_status': self.status,
+                'duration': round(self.duration, 3),
+                'tests_run': self.tests_run,
+                'passed': self.passed,
+                'failed': self.failed,
+                'skipped': self.skipped}
+
+def list_test_suites():
+    """List the test suite executables in the current directory."""
+    # Some of our test suites' base names contain a dot, so we can't just
+    # exclude names with a dot.
+    suites = [name for name in glob.glob('test_suite_*')
+              if os.access(name, os.X_OK) or name.endswith('.exe')]
+    return sorted(name for name in suites
+                  if os.path.isfile(name) and
+                  not re.search(r'\.(c|data|datax|index)$', name))
+
+def skip_regex(skip_patterns):
+    """Return a regex matching the test suites to skip.
+
+"foo" as a skip pattern skips "test_suite_foo" and "test_suite_foo.bar"
+but not "test_suite_foobar". Patterns may be separated by " ,;|".
+"""
+    alternatives = '|'.join(re.sub(r'[ ,;]', '|', pattern).replace('.', r'\.')
+                            for pattern in skip_patterns)
+    return re.compile(r'\Atest_suite_(' + alternatives + r')(\Z|\.)')
+
+def list_jobs(suites, use_shards):
+    """List the jobs that run the given test suites.
+
+With use_shards, the shards of the intermediate data file of a test suite,
+written by generate_test_code.py --shards, are run as separate jobs.
+"""
+    jobs = []
+    for suite in suites:
+        base_name = re.sub(r'\.exe$', '', suite)
+        shards = []
+        if use_shards:
+            shards = sorted(glob.glob(glob.escape(base_name) +
+                                      '.shard*.datax'),
+                            key=lambda name: int(re.search(r'\.shard([0-9]+)\.',
+                                                           name).group(1)))
+        if shards:
+            jobs += [Job(suite, shard) for shard in shards]
+        else:
+            jobs.append(Job(suite))
+    return jobs
+
+def read_durations(durations_file):
+    """Read the job durations recorded by a previous run.
+
+Each line of the file is "<job name>;<duration in seconds>".
+"""
+    durations = {}
+    if not os.path.exists(durations_file):
+        return durations
+    with open(durations_file, 'r', encoding='utf-8') as input_file:
+        for line in input_file:
+            line = line.rstrip('\r\n')
+            if not line or line.startswith('#'):
+                continue
+            try:
+                name, duration = line.rsplit(';', 1)
+                durations[name] = float(duration)
+            except ValueError:
+                # Durations are only hints, don't fail on a damaged file.
+                continue
+    return durations
+
+def write_durations(durations_file, durations):
+    """Write the job durations for the next run."""
+    tmp_file = durations_file + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as output_file:
+        for name in sorted(durations):
+            output_file.write('{};{:.3f}\n'.format(name, durations[name]))
+    os.replace(tmp_file, durations_file)
+
+def schedule_jobs(jobs, durations):
+    """Sort jobs longest first.
+
+Jobs without a recorded duration come first, since they may be long.
+"""
+    return sorted(jobs,
+                  key=lambda job: (job.name in durations,
+                                   -durations.get(job.name, 0), job.name))
+
+def run_job(job, verbose, outcome_dir):
+    """Run a job and return its JobResult."""
+    env = dict(os.environ)
+    # in case test suites are linked dynamically
+    env['LD_LIBRARY_PATH'] = '../library'
+    env['DYLD_LIBRARY_PATH'] = '../library'
+    if outcome_dir is not None:
+        env['MBEDTLS_TEST_OUTCOME_FILE'] = os.path.join(outcome_dir,
+                                                        job.name + '.csv')
+    else:
+        env.pop('MBEDTLS_TEST_OUTCOME_FILE', None)
+    start = time.monotonic()
+    process = subprocess.run(job.command(verbose), env=env,
+                             stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                             check=False)
+    duration = time.monotonic() - start
+    output = process.stdout.decode('utf-8', errors='replace')
+    return JobResult(job, process.returncode, output, duration)
+
+def append_outcomes(outcome_file, outcome_dir, job):
+    """Append the outcomes of a finished job to the outcome file."""
+    job_outcome_file = os.path.join(outcome_dir, job.name + '.csv')
+    if not os.path.exists(job_outcome_file):
+        return
+    with open(job_outcome_file, 'rb') as input_file, \
+         open(outcome_file, 'ab') as output_file:
+        output_file.write(input_file.read())
+    os.remove(job_outcome_file)
+
+def print_framed(title, text):
+    """Print the output of a job between begin and end lines."""
+    print(' Begin {} '.format(title).center(72, '-'))
+    print(text, end='')
+    print(' End {} '.format(title).center(72, '-'))
+
+def report_result(result, verbose):
+    """Print the result of a finished job."""
+    name = result.job.name
+    status = 'PASS' if result.status == 0 else 'FAIL'
+    print('{} {} {}'.format(name, '.' * (72 - len(name) - 2 - 4), status))
+    if (result.status != 0 and verbose) or verbose > 2:
+        print_framed(name, result.output)
+    if verbose > 1:
+        print('(test cases passed:{} failed:{} skipped:{} of total:{}) [{:.2f}s]'
+              .format(result.passed, result.failed, result.skipped,
+                      result.passed + result.failed + result.skipped,
+                      result.duration))
+    sys.stdout.flush()
+
+def run_jobs(jobs, options):
+    """Run jobs concurrently, longest first, and return their results."""
+    outcome_dir = None
+    if options.outcome_file:
+        outcome_dir = tempfile.mkdtemp(prefix='outcomes-')
+    results = []
+    try:
+        with concurrent.futures.ThreadPoolExecutor(options.jobs) as executor:
+            futures = [executor.submit(run_job, job, options.verbose,
+                                       outcome_dir)
+                       for job in jobs]
+            for future in concurrent.futures.as_completed(futures):
+                result = future.result()
+                if outcome_dir is not None:
+                    append_outcomes(options.outcome_file, outcome_dir,
+                                    result.job)
+                report_result(result, options.verbose)
+                results.append(result)
+    finally:
+        if outcome_dir is not None:
+            for name in os.listdir(outcome_dir):
+                os.remove(os.path.join(outcome_dir, name))
+            os.rmdir(outcome_dir)
+    return results
+
+def write_summary(summary_file, results, wall_time, skipped_suites):
+    """Write the results of a run as JSON."""
+    summary = {
+        'status': 'FAIL' if any(r.status != 0 for r in results) else 'PASS',
+        'wall_time': round(wall_time, 3),
+        'cpu_time': round(sum(r.duration for r in results), 3),
+        'tests_run': sum(r.tests_run for r in results),
+        'skipped_suites': skipped_suites,
+        'jobs': [r.summary() for r in sorted(results,
+                                             key=lambda r: r.job.name)],
+    }
+    with open(summary_file, 'w', encoding='utf-8') as output_file:
+        json.dump(summary, output_file, indent=2)
+        output_file.write('\n')
+
+def run_test_suites(options):
+    """Run the test suites and return the number of failed jobs."""
+    suites = list_test_suites()
+    if not suites:
+        sys.exit('{}: no test suite found'.format(sys.argv[0]))
+    skip_re = skip_regex(options.skip)
+    skipped_suites = [suite for suite in suites
+                      if options.skip and skip_re.match(suite)]
+    for suite in skipped_suites:
+        print('{} {} SKIP'.format(suite, '.' * (72 - len(suite) - 2 - 4)))
+    suites = [suite for suite in suites if suite not in skipped_suites]
+    durations = read_durations(options.durations)
+    jobs = schedule_jobs(list_jobs(suites, options.shards), durations)
+    start = time.monotonic()
+    results = run_jobs(jobs, options)
+    wall_time = time.monotonic() - start
+    failed = [result for result in results if result.status != 0]
+
+    print('-' * 72)
+    print('{} ({} suites, {} tests run{})'.format(
+        'FAILED' if failed else 'PASSED',
+        len(suites), sum(result.tests_run for result in results),
+        ', {} suites skipped'.format(len(skipped_suites))
+        if skipped_suites else ''))
+    print('  {} jobs on {} workers: {:.2f}s elapsed, {:.2f}s in test suites'
+          .format(len(jobs), options.jobs, wall_time,
+                  sum(result.duration for result in results)))
+    for result in sorted(failed, key=lambda r: r.job.name):
+        print('  failed: {}'.format(result.job.name))
+    if options.verbose > 1:
+        passed = sum(result.passed for result in results)
+        failed_cases = sum(result.failed for result in results)
+        skipped = sum(result.skipped for result in results)
+        print('  test cases passed :', passed)
+        print('             failed :', failed_cases)
+        print('            skipped :', skipped)
+        print('  of tests executed :', passed + failed_cases)
+        print(' of available tests :', passed + failed_cases + skipped)
+
+    for result in results:
+        durations[result.job.name] = result.duration
+    if options.durations:
+        write_durations(options.durations, durations)
+    if options.summary:
+        write_summary(options.summary, results, wall_time, skipped_suites)
+    return len(failed)
+
+def main():
+    """Run the test suites and return the exit status of the script."""
+    try:
+        parser = argparse.ArgumentParser(description=__doc__)
+        parser.add_argument('--durations', metavar='FILE',
+                            default=DEFAULT_DURATIONS_FILE,
+                            help='Job durations of the previous run, updated'
+                            ' with this run (default: {}). An empty name'
+                            ' disables it.'.format(DEFAULT_DURATIONS_FILE))
+        parser.add_argument('--jobs', '-j', type=int,
+                            default=os.cpu_count() or 1,
+                            help='Number of test suites to run concurrently'
+                            ' (default: number of CPUs)')
+        parser.add_argument('--outcome-file', metavar='FILE',
+                            default=os.environ.get('MBEDTLS_TEST_OUTCOME_FILE'),
+                            help='Append test case outcomes to FILE'
+                            ' (default: $MBEDTLS_TEST_OUTCOME_FILE)')
+        parser.add_argument('--shards', action='store_true',
+                            help='Run the .datax shards of test suites that'
+                            ' have them as separate jobs')
+        parser.add_argument('--skip', metavar='SUITE[,SUITE...]',
+                            action='append', default=[],
+                            help='Skip the specified SUITE(s). This option'
+                            ' can be used multiple times.')
+        parser.add_argument('--summary', metavar='FILE',
+                            help='Write a JSON summary of the run to FILE')
+        parser.add_argument('--verbose', '-v', type=int, nargs='?',
+                            const=1, default=0,
+                            help='1: print failed suite outputs;'
+                            ' 2: also print test case counts;'
+                            ' 3: print all suite outputs')
+        options = parser.parse_args()
+        if options.jobs < 1:
+            parser.error('--jobs must be at least 1')
+        if options.outcome_file:
+            options.outcome_file = os.path.abspath(options.outcome_file)
+        return 1 if run_test_suites(options) else 0
+    except Exception: # pylint: disable=broad-except
+        # Print the backtrace and exit explicitly with our chosen status.
+        traceback.print_exc()
+        return 120
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+# Unit test for analyze_outcomes.py
+#
+# Copyright The Mbed TLS Contributors
+# SPDX-License-Identifier: Apache-2.0
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for analyze_outcomes.py
+"""
+
+import os
+import shutil
+import tempfile
+from unittest import TestCase, main as unittest_main
+from unittest.mock import patch
+from analyze_outcomes import OutcomeTable, outcome_hit_counts
+from analyze_outcomes import read_outcome_file, read_outcome_table
+from analyze_outcomes import read_outcome_files, read_outcome_chunk
+from analyze_outcomes import outcome_file_chunks, convert_outcome_files
+from analyze_outcomes import compact_outcome_blocks, is_compact_outcome_file
+
+
+OUTCOMES = '''\
+Linux-x86_64;full;test_suite_aes;AES-128-ECB Encrypt;PASS;
+Linux-x86_64;full;test_suite_aes;AES-128-ECB Decrypt;FAIL;
+Linux-x86_64;full;test_suite_md;MD5 Hash;SKIP;MBEDTLS_MD5_C
+Linux-x86_64;default;test_suite_aes;AES-128-ECB Encrypt;PASS;
+Linux-x86_64;default;test_suite_aes;AES-128-ECB Decrypt;SKIP;-
+Linux-x86_64;default;test_suite_md;MD5 Hash;PASS;
+'''
+
+
+def table_rows(table):
+    """
+    Return the rows of an outcome table as strings, in order.
+
+    :param table: OutcomeTable.
+    :return: List of 'platform;config;suite;description;result' strings.
+    """
+    return [';'.join([table.platforms.strings[platform_id],
+                      table.configs.strings[config_id],
+                      table.key(key_id),
+                      table.results.strings[result_id]])
+            for platform_id, config_id, key_id, result_id
+            in zip(table.platform_column, table.config_column,
+                   table.key_column, table.result_column)]
+
+
+class TempDirTestCase(TestCase):
+    """
+    Base class of the tests that write files in a temporary directory.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_file(self, name, content):
+        """
+        Write a text file in the temporary directory.
+
+        :param name: File name, relative to the temporary directory.
+        :param content: File content.
+        :return: Path of the file.
+        """
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, 'w', encoding='utf-8') as output_file:
+            output_file.write(content)
+        return path
+
+
+class HitCounts(TestCase):
+    """
+    Test counting the runs of each test case.
+    """
+
+    def test_table(self):
+        """
+        Test the hit counts of an outcome table.
+        :return:
+        """
+        table = OutcomeTable()
+        table.add_lines(OUTCOMES.splitlines(True))
+        self.assertEqual(outcome_hit_counts(table),
+                         {'test_suite_aes;AES-128-ECB Encrypt': 2,
+                          'test_suite_aes;AES-128-ECB Decrypt': 1,
+                          'test_suite_md;MD5 Hash': 1})
+
+    def test_malformed_line(self):
+        """
+        Test that a line without all the fields of an outcome is rejected.
+        :return:
+        """
+        table = OutcomeTable()
+        with self.assertRaises(ValueError):
+            table.add_lines(['Linux-x86_64;full;test_suite_aes\n'])
+
+
+class SetupsNotRun(TestCase):
+    """
+    Test finding the setups that never ran a test case.
+    """
+
+    def test_setups_not_run(self):
+        """
+        Test the setups that never ran each test case. A failure counts as
+        a run, but a skip does not.
+        :return:
+        """
+        table = OutcomeTable()
+        table.add_lines(OUTCOMES.splitlines(True))
+        self.assertEqual(table.setups_not_run(),
+                         {'test_suite_aes;AES-128-ECB Decrypt':
+                          ['Linux-x86_64;default'],
+                          'test_suite_md;MD5 Hash': ['Linux-x86_64;full']})
+
+    def test_never_run(self):
+        """
+        Test that a test case that was skipped everywhere was not run on
+        any setup, and that a setup that only skipped test cases is left
+        out.
+        :return:
+        """
+        table = OutcomeTable()
+        table.add_lines(OUTCOMES.splitlines(True))
+        table.add_lines(['FreeBSD-amd64;full;test_suite_md;MD2 Hash;SKIP;-\n'])
+        setups_not_run = table.setups_not_run()
+        self.assertEqual(setups_not_run['test_suite_md;MD2 Hash'],
+                         ['Linux-x86_64;full', 'Linux-x86_64;default'])
+        self.assertNotIn('test_suite_aes;AES-128-ECB Encrypt', setups_not_run)
+
+    def test_outcome_collection(self):
+        """
+        Test the witnesses of the outcome collection of a table.
+        :return:
+        """
+        table = OutcomeTable()
+        table.add_lines(OUTCOMES.splitlines(True))
+        outcomes = table.to_outcomes()
+        decrypt = outcomes['test_suite_aes;AES-128-ECB Decrypt']
+        self.assertEqual((decrypt.success_count, decrypt.failure_count),
+                         (0, 1))
+        self.assertEqual(table.setups(decrypt.run_setups()),
+                         ['Linux-x86_64;full'])
+        self.assertEqual(table.setups(table.all_setups()),
+                         ['Linux-x86_64;full', 'Linux-x86_64;default'])
+
+
+class ReadOutcomeFiles(TempDirTestCase):
+    """
+    Test reading outcome files.
+    """
+
+    def test_outcome_collection(self):
+        """
+        Test that the outcome collection returned by read_outcome_file()
+        has the same hit counts as the outcome table of the same file.
+        :return:
+        """
+        outcome_file = self.write_file('outcomes.csv', OUTCOMES)
+        self.assertEqual(outcome_hit_counts(read_outcome_file(outcome_file)),
+                         read_outcome_table(outcome_file).hit_counts())
+
+    def test_several_files(self):
+        """
+        Test the setups that never ran a test case across outcome files,
+        e.g. from different CI nodes.
+        :return:
+        """
+        lines = OUTCOMES.splitlines(True)
+        outcome_files = [self.write_file('outcomes1.csv', ''.join(lines[:3])),
+                         self.write_file('outcomes2.csv', ''.join(lines[3:]))]
+        table = read_outcome_files(outcome_files)
+        self.assertEqual(table.setups_not_run(),
+                         {'test_suite_aes;AES-128-ECB Decrypt':
+                          ['Linux-x86_64;default'],
+                          'test_suite_md;MD5 Hash': ['Linux-x86_64;full']})
+
+    def test_no_final_newline(self):
+        """
+        Test that the last line of a file is read even without a newline.
+        :return:
+        """
+        outcome_file = self.write_file('outcomes.csv', OUTCOMES.rstrip('\n'))
+        self.assertEqual(table_rows(read_outcome_table(outcome_file)),
+                         [line.rsplit(';', 1)[0]
+                          for line in OUTCOMES.splitlines()])
+
+    def test_chunk_boundaries(self):
+        """
+        Test that the chunks of a file are made of whole lines and cover the
+        whole file, including when a chunk would end exactly on a newline
+        or in the last line, which has no newline.
+        :return:
+        """
+        content = OUTCOMES.rstrip('\n')
+        outcome_file = self.write_file('outcomes.csv', content)
+        expected = table_rows(read_outcome_table(outcome_file))
+        # Offsets just after each newline: a chunk of line_ends[0] - 1 bytes
+        # ends exactly on the first newline.
+        line_ends = [i + 1 for i, c in enumerate(content) if c == '\n']
+        for chunk_size in [1, line_ends[0] - 1, line_ends[0],
+                           line_ends[1] - line_ends[0], len(content) - 1,
+                           len(content), len(content) + 1]:
+            chunks = outcome_file_chunks(outcome_file, chunk_size)
+            starts = [start for _, start, _ in chunks]
+            ends = [end for _, _, end in chunks]
+            self.assertEqual(starts, [0] + ends[:-1])
+            self.assertEqual(ends[-1], len(content))
+            for end in ends[:-1]:
+                self.assertIn(end, line_ends)
+            table = OutcomeTable()
+            for chunk in chunks:
+                table.extend(read_outcome_chunk(chunk))
+            self.assertEqual(table_rows(table), expected)
+
+    def test_jobs(self):
+        """
+        Test that reading files concurrently gives the same outcomes as
+        reading them in order. The strings appear in a different order in
+        each file, so merging the tables of the files remaps identifiers.
+        :return:
+        """
+        lines = OUTCOMES.splitlines(True)
+        outcome_files = [self.write_file('outcomes1.csv', ''.join(lines[3:])),
+                         self.write_file('outcomes2.csv', ''.join(lines[:3])),
+                         self.write_file('outcomes3.csv',
+                                         ''.join(reversed(lines)))]
+        compact_file = os.path.join(self.tmp_dir, 'outcomes4.gz')
+        convert_outcome_files(outcome_files[:2], compact_file)
+        outcome_files.append(compact_file)
+        expected = table_rows(read_outcome_files(outcome_files, 1))
+        self.assertEqual(len(expected), 3 * len(lines))
+        self.assertEqual(table_rows(read_outcome_files(outcome_files, 3)),
+                         expected)
+
+    def test_extend(self):
+        """
+        Test that extending a table remaps the identifiers of the other
+        table.
+        :return:
+        """
+        lines = OUTCOMES.splitlines(True)
+        table = OutcomeTable()
+        table.add_lines(lines[3:])
+        other = OutcomeTable()
+        other.add_lines(lines[:3])
+        table.extend(other)
+        self.assertEqual(table_rows(table),
+                         [line.rsplit(';', 1)[0]
+                          for line in lines[3:] + lines[:3]])
+        self.assertEqual(len(table.keys()), 3)
+
+
+class CompactOutcomeFiles(TempDirTestCase):
+    """
+    Test the compact outcome file format.
+    """
+
+    def test_round_trip(self):
+        """
+        Test converting a CSV outcome file to the compact format and back,
+        with blocks of 2 rows so that strings are shared across blocks.
+        :return:
+        """
+        csv_file = self.write_file('outcomes.csv', OUTCOMES)
+        compact_file = os.path.join(self.tmp_dir, 'outcomes.gz')
+        round_trip_file = os.path.join(self.tmp_dir, 'round_trip.csv')
+        with patch('analyze_outcomes.COMPACT_BLOCK_ROWS', 2):
+            convert_outcome_files([csv_file], compact_file)
+        self.assertTrue(is_compact_outcome_file(compact_file))
+        self.assertFalse(is_compact_outcome_file(csv_file))
+        blocks = list(compact_outcome_blocks(compact_file))
+        self.assertEqual([len(columns[0]) for _, columns in blocks],
+                         [2, 2, 2])
+        # The platform is only stored in the first block
+        self.assertEqual([new_strings[0] for new_strings, _ in blocks],
+                         [['Linux-x86_64'], [], []])
+        convert_outcome_files([compact_file], round_trip_file)
+        with open(round_trip_file, encoding='utf-8') as input_file:
+            self.assertEqual(input_file.read(), OUTCOMES)
+        self.assertEqual(table_rows(read_outcome_table(compact_file)),
+                         table_rows(read_outcome_table(csv_file)))
+
+    def test_no_final_newline(self):
+        """
+        Test converting a CSV outcome file whose last line has no newline.
+        :return:
+        """
+        csv_file = self.write_file('outcomes.csv', OUTCOMES.rstrip('\n'))
+        compact_file = os.path.join(self.tmp_dir, 'outcomes.gz')
+        round_trip_file = os.path.join(self.tmp_dir, 'round_trip.csv')
+        convert_outcome_files([csv_file], compact_file)
+        convert_outcome_files([compact_file], round_trip_file)
+        with open(round_trip_file, encoding='utf-8') as input_file:
+            self.assertEqual(input_file.read(), OUTCOMES)
+
+
+if __name__ == '__main__':
+    unittest_main()
@@ -20,7 +20,15 @@
 Unit tests for generate_test_code.py
 """
 
+# pylint: disable=too-many-lines
 # pylint: disable=wrong-import-order
+import io
+import os
+import json
+import shutil
+import struct
+import tempfile
+from io import BytesIO
 try:
     # Python 2
     from StringIO import StringIO
@@ -38,6 +46,12 @@ except ImportError:
 from generate_test_code import gen_dependencies, gen_dependencies_one_line
 from generate_test_code import gen_function_wrapper, gen_dispatch
 from generate_test_code import parse_until_pattern, GeneratorInputError
+from generate_test_code import classify_function_line, tokenize_function_file
+from generate_test_code import LINE_BEGIN_HEADER, LINE_END_HEADER
+from generate_test_code import LINE_BEGIN_SUITE_HELPERS
+from generate_test_code import LINE_END_SUITE_HELPERS
+from generate_test_code import LINE_BEGIN_DEPENDENCIES, LINE_END_DEPENDENCIES
+from generate_test_code import LINE_BEGIN_CASE, LINE_END_CASE, LINE_CODE
 from generate_test_code import parse_suite_dependencies
 from generate_test_code import parse_function_dependencies
 from generate_test_code import parse_function_arguments, parse_function_code
@@ -45,8 +59,39 @@ from generate_test_code import parse_functions, END_HEADER_REGEX
 from generate_test_code import END_SUITE_HELPERS_REGEX, escaped_split
 from generate_test_code import parse_test_data, gen_dep_check
 from generate_test_code import gen_expression_check, write_dependencies
+from generate_test_code import InternTable
 from generate_test_code import write_parameters, gen_suite_dep_checks
 from generate_test_code import gen_from_test_data
+from generate_test_code import get_functions_file, parse_batch_manifest
+from generate_test_code import generate_suites
+from generate_test_code import get_cache_key, copy_to_cache
+from generate_test_code import copy_from_cache, open_output_file
+from generate_test_code import write_test_source_file, FileWrapper
+from generate_test_code import encode_binary_parameter, write_binary_record
+from generate_test_code import write_test_data, DATAX_BINARY
+from generate_test_code import BinaryDataWriter, DATAX_BINARY_MAGIC
+from generate_test_code import generate_intermediate_data_file
+from generate_test_code import OffsetTrackingWriter
+from generate_test_code import partition_test_cases, get_test_case_weights
+from generate_test_code import read_duration_hints, get_shard_file
+from generate_test_code import get_cached_outputs
+from generate_test_code import gen_dep_condition, read_shared_dependencies
+from generate_test_code import gen_shared_dependencies_header
+from generate_test_code import gen_shared_dependencies_table
+from generate_test_code import get_shared_deps_header
+from generate_test_code import update_shared_dependencies
+from generate_test_code import load_config, evaluate_dependency
+from generate_test_code import collect_function_dependencies
+from generate_test_code import get_unreachable_check
+from generate_test_code import gen_dep_bitmap_entry, gen_dep_bitmap_guards
+from generate_test_code import gen_expression_table_entry, CHECK_CODE_TABLE
+from generate_test_code import GenerationProfile, generate_code
+from generate_test_code import PROFILE_PHASES
+from generate_test_code import compile_template, render_template
+from generate_test_code import get_data_cache_key, store_data_in_cache
+from generate_test_code import restore_data_from_cache
+from generate_test_code import get_cached_data_outputs
+from generate_test_code import DataOptions, DataCallbacks, FunctionFileInfo
 
 
 class GenDep(TestCase):
@@ -342,6 +387,58 @@ class StringIOWrapper(StringIO):
         return line
 
 
+class ClassifyFunctionLine(TestCase):
+    """
+    Test suite for classify_function_line() and tokenize_function_file()
+    """
+
+    def test_line_types(self):
+        """
+        Test that each kind of line is classified correctly.
+        :return:
+        """
+        lines = [('/* BEGIN_HEADER */\n', LINE_BEGIN_HEADER),
+                 ('/*END_HEADER*/\n', LINE_END_HEADER),
+                 ('/* BEGIN_SUITE_HELPERS */\n', LINE_BEGIN_SUITE_HELPERS),
+                 ('/* END_SUITE_HELPERS */\n', LINE_END_SUITE_HELPERS),
+                 ('/* BEGIN_DEPENDENCIES\n', LINE_BEGIN_DEPENDENCIES),
+                 (' * END_DEPENDENCIES\n', LINE_END_DEPENDENCIES),
+                 ('/* BEGIN_CASE */\n', LINE_BEGIN_CASE),
+                 ('/* END_CASE */\n', LINE_END_CASE),
+                 ('void func( int x )\n', LINE_CODE),
+                 ('#define BEGIN_X 1\n', LINE_CODE),
+                 ('\n', LINE_CODE)]
+        for line, expected in lines:
+            self.assertEqual(classify_function_line(line)[0], expected, line)
+
+    def test_begin_case_match(self):
+        """
+        Test that the match of a BEGIN_CASE line gives the dependencies.
+        :return:
+        """
+        line_type, match = classify_function_line(
+            '/* BEGIN_CASE depends_on:MBEDTLS_FS_IO */\n')
+        self.assertEqual(line_type, LINE_BEGIN_CASE)
+        self.assertEqual(match.group('depends_on'), 'depends_on:MBEDTLS_FS_IO')
+
+    def test_tokenize(self):
+        """
+        Test that the file is read lazily, leaving lines for the caller.
+        :return:
+        """
+        data = '''/* BEGIN_HEADER */
+#include "mbedtls/ecp.h"
+/* END_HEADER */
+'''
+        stream = StringIOWrapper('test_suite_ut.function', data)
+        tokens = tokenize_function_file(stream)
+        self.assertEqual(next(tokens),
+                         (LINE_BEGIN_HEADER, '/* BEGIN_HEADER */\n'))
+        self.assertEqual(stream.readline(), '#include "mbedtls/ecp.h"\n')
+        self.assertEqual(list(tokens),
+                         [(LINE_END_HEADER, '/* END_HEADER */\n')])
+
+
 class ParseUntilPattern(TestCase):
     """
     Test Suite for testing parse_until_pattern().
@@ -1316,6 +1413,55 @@ class GenExpCheck(TestCase):
                           -1, 'YAHOO')
 
 
+class InternTableTest(TestCase):
+    """
+    Test suite for InternTable.
+    """
+
+    def test_ids_in_insertion_order(self):
+        """
+        Test that values get consecutive ids in order of first insertion.
+        :return:
+        """
+        table = InternTable()
+        self.assertEqual(table.add('B'), (0, True))
+        self.assertEqual(table.add('A'), (1, True))
+        self.assertEqual(table.add('B'), (0, False))
+        self.assertEqual(table.add('C'), (2, True))
+        self.assertEqual(table.add('A'), (1, False))
+        self.assertEqual(len(table), 3)
+        self.assertEqual(table, ['B', 'A', 'C'])
+        self.assertEqual(table[1], 'A')
+        self.assertIn('C', table)
+        self.assertNotIn('D', table)
+
+    def test_initial_values(self):
+        """
+        Test that initial values are interned in order without duplicates.
+        :return:
+        """
+        table = InternTable(['X', 'Y', 'X'])
+        self.assertEqual(list(table), ['X', 'Y'])
+        self.assertEqual(table, InternTable(['X', 'Y']))
+        self.assertNotEqual(table, ['Y', 'X'])
+
+    def test_scaling(self):
+        """
+        Test interning a large number of distinct values.
+
+        With a list based table this takes quadratic time, far longer
+        than the rest of this test suite.
+        :return:
+        """
+        count = 100000
+        table = InternTable()
+        for i in range(count):
+            self.assertEqual(table.add('MACRO%d' % i), (i, True))
+        for i in range(count - 1, -1, -1):
+            self.assertEqual(table.add('MACRO%d' % i), (i, False))
+        self.assertEqual(len(table), count)
+
+
 class WriteDependencies(TestCase):
     """
     Test suite for testing write_dependencies.
@@ -1327,7 +1473,7 @@ class WriteDependencies(TestCase):
         :return:
         """
         stream = StringIOWrapper('test_suite_ut.data', '')
-        unique_dependencies = []
+        unique_dependencies = InternTable()
         dep_check_code = write_dependencies(stream, [], unique_dependencies)
         self.assertEqual(dep_check_code, '')
         self.assertEqual(len(unique_dependencies), 0)
@@ -1339,7 +1485,7 @@ class WriteDependencies(TestCase):
         :return:
         """
         stream = StringIOWrapper('test_suite_ut.data', '')
-        unique_dependencies = []
+        unique_dependencies = InternTable()
         dep_check_code = write_dependencies(stream, ['DEP3', 'DEP2', 'DEP1'],
                                             unique_dependencies)
         expect_dep_check_code = '''
@@ -1380,7 +1526,7 @@ class WriteDependencies(TestCase):
         :return:
         """
         stream = StringIOWrapper('test_suite_ut.data', '')
-        unique_dependencies = []
+        unique_dependencies = InternTable()
         dep_check_code = ''
         dep_check_code += write_dependencies(stream, ['DEP3', 'DEP2'],
                                              unique_dependencies)
@@ -1433,7 +1579,7 @@ class WriteParams(TestCase):
         :return:
         """
         stream = StringIOWrapper('test_suite_ut.data', '')
-        unique_expressions = []
+        unique_expressions = InternTable()
         expression_code = write_parameters(stream, [], [], unique_expressions)
         self.assertEqual(len(unique_expressions), 0)
         self.assertEqual(expression_code, '')
@@ -1445,7 +1591,7 @@ class WriteParams(TestCase):
         :return:
         """
         stream = StringIOWrapper('test_suite_ut.data', '')
-        unique_expressions = []
+        unique_expressions = InternTable()
         expression_code = write_parameters(stream, ['"Yahoo"', '"abcdef00"',
                                                     '0'],
                                            ['char*', 'hex', 'int'],
@@ -1461,7 +1607,7 @@ class WriteParams(TestCase):
         :return:
         """
         stream = StringIOWrapper('test_suite_ut.data', '')
-        unique_expressions = []
+        unique_expressions = InternTable()
         expression_code = write_parameters(stream,
                                            ['"Yahoo"', '"abcdef00"', '0xAA'],
                                            ['char*', 'hex', 'int'],
@@ -1477,7 +1623,7 @@ class WriteParams(TestCase):
         :return:
         """
         stream = StringIOWrapper('test_suite_ut.data', '')
-        unique_expressions = []
+        unique_expressions = InternTable()
         expression_code = write_parameters(stream,
                                            ['"Yahoo"', '"abcdef00"', '0',
                                             'MACRO1', 'MACRO2', 'MACRO3'],
@@ -1513,7 +1659,7 @@ class WriteParams(TestCase):
         :return:
         """
         stream = StringIOWrapper('test_suite_ut.data', '')
-        unique_expressions = []
+        unique_expressions = InternTable()
         expression_code = ''
         expression_code += write_parameters(stream,
                                             ['"Yahoo"', 'MACRO1', 'MACRO2'],
@@ -1630,9 +1776,11 @@ func1:0
         func_mock1.side_effect = gen_suite_dep_checks
         gen_from_test_data(data_f, out_data_f, func_info, suite_dependencies)
         write_dependencies_mock.assert_called_with(out_data_f,
-                                                   ['DEP1'], ['DEP1'])
+                                                   ['DEP1'], ['DEP1'],
+                                                   gen_dep_check)
         write_parameters_mock.assert_called_with(out_data_f, ['0'],
-                                                 ('int',), [])
+                                                 ('int',), [],
+                                                 gen_expression_check)
         expected_dep_check_code = '''
         case 0:
             {
@@ -1747,5 +1895,1483 @@ depends_on:0:1
         self.assertEqual(expression_code, expected_expression_code)
 
 
+class GetFunctionsFile(TestCase):
+    """
+    Test suite for get_functions_file()
+    """
+
+    def test_data_file_without_sub_module(self):
+        """
+        Test that the functions file has the data file base name.
+        :return:
+        """
+        self.assertEqual(get_functions_file('suites/test_suite_ut.data',
+                                            'suites'),
+                         'suites/test_suite_ut.function')
+
+    def test_data_file_with_sub_module(self):
+        """
+        Test that the sub module name is stripped from the data file name.
+        :return:
+        """
+        self.assertEqual(get_functions_file('test_suite_ut.sub.data',
+                                            'suites'),
+                         'suites/test_suite_ut.function')
+
+
+class ParseBatchManifest(TestCase):
+    """
+    Test suite for parse_batch_manifest()
+    """
+
+    def test_manifest(self):
+        """
+        Test that suites are read with and without functions file.
+        :return:
+        """
+        data = '''# Comment
+
+test_suite_ut.sub.data
+  suites/test_suite_ut.function   suites/test_suite_ut2.data
+'''
+        stream = StringIOWrapper('manifest.txt', data)
+        suites = parse_batch_manifest(stream, 'suites')
+        self.assertEqual(suites,
+                         [('suites/test_suite_ut.function',
+                           'test_suite_ut.sub.data'),
+                          ('suites/test_suite_ut.function',
+                           'suites/test_suite_ut2.data')])
+
+    def test_invalid_line(self):
+        """
+        Test that GeneratorInputError is raised on a line with too many
+        file names.
+        :return:
+        """
+        data = '''test_suite_ut.function test_suite_ut.data extra
+'''
+        stream = StringIOWrapper('manifest.txt', data)
+        self.assertRaises(GeneratorInputError, parse_batch_manifest,
+                          stream, 'suites')
+
+
+class GenerateSuites(TestCase):
+    """
+    Test suite for generate_suites()
+    """
+
+    @patch("generate_test_code.get_output_files")
+    @patch("generate_test_code.generate_code")
+    def test_errors_reported_per_suite(self, generate_code_mock,
+                                       get_output_files_mock):
+        """
+        Test that an input error in one suite doesn't stop the generation
+        of the other suites and is reported with the suite data file.
+        :return:
+        """
+        def generate(**input_info):
+            """Fail on the second suite."""
+            if input_info['data_file'] == 'test_suite_b.data':
+                raise GeneratorInputError('Function test_f not found!')
+        generate_code_mock.side_effect = generate
+        get_output_files_mock.return_value = ('out.c', 'out.datax')
+        suites = [('test_suite_a.function', 'test_suite_a.data'),
+                  ('test_suite_b.function', 'test_suite_b.data'),
+                  ('test_suite_c.function', 'test_suite_c.data')]
+        errors = generate_suites(suites, '.', template_file='main.function')
+        self.assertEqual(generate_code_mock.call_count, 3)
+        self.assertEqual(errors, ['test_suite_b.data: '
+                                  'Function test_f not found!'])
+        _, kwargs = generate_code_mock.call_args
+        self.assertEqual(kwargs['template_file'], 'main.function')
+        self.assertEqual(kwargs['data_file'], 'test_suite_c.data')
+
+
+class TempDirTestCase(TestCase):
+    """
+    Base of the test suites working on files in a temporary directory.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_file(self, name, content):
+        """
+        Write a file in the temporary directory.
+
+        :param name: File name
+        :param content: File content, as bytes or as text encoded in
+                        UTF-8
+        :return: File path
+        """
+        path = os.path.join(self.tmp_dir, name)
+        if isinstance(content, bytes):
+            with open(path, 'wb') as out_f:
+                out_f.write(content)
+        else:
+            with io.open(path, 'w', encoding='utf-8') as out_f:
+                out_f.write(content)
+        return path
+
+    def write_suite(self, funcs_content, data_content):
+        """
+        Write the input files of a test suite, with a template of the
+        functions and check code.
+
+        :param funcs_content: Functions file content
+        :param data_content: Data file content
+        :return: generate_code() parameters
+        """
+        return {
+            'funcs_file': self.write_file('test_suite_ut.function',
+                                          funcs_content),
+            'data_file': self.write_file('test_suite_ut.data', data_content),
+            'template_file': self.write_file('template',
+                                             '$functions_code\n'
+                                             '$dep_check_code\n'
+                                             '$expression_code\n'),
+            'platform_file': self.write_file('platform', ''),
+            'helpers_file': self.write_file('helpers', ''),
+            'suites_dir': self.tmp_dir,
+            'c_file': os.path.join(self.tmp_dir, 'test_suite_ut.c'),
+            'out_data_file': os.path.join(self.tmp_dir,
+                                          'test_suite_ut.datax')}
+
+
+class GenerationCache(TempDirTestCase):
+    """
+    Test suite for get_cache_key(), copy_to_cache(),
+    copy_from_cache() and their intermediate data counterparts
+    """
+
+    FUNC_INFO = {'test_func1': (0, ('int',)),
+                 'test_func2': (1, ('char*', 'data_t*'))}
+
+    # Functions file of a test suite, formatted with the parameter name
+    FUNCTIONS_FILE = '''/* BEGIN_HEADER */
+/* END_HEADER */
+
+/* BEGIN_CASE */
+void func1( int %s )
+{
+}
+/* END_CASE */
+'''
+
+    def setUp(self):
+        super(GenerationCache, self).setUp()
+        self.input_info = {}
+        for name in ('funcs_file', 'data_file', 'template_file',
+                     'platform_file', 'helpers_file'):
+            self.input_info[name] = self.write_file(name, name + ' content\n')
+        self.input_info['c_file'] = os.path.join(self.tmp_dir, 'out.c')
+        self.input_info['out_data_file'] = os.path.join(self.tmp_dir,
+                                                        'out.datax')
+
+    def test_key_is_stable(self):
+        """
+        Test that the key only depends on the inputs.
+        :return:
+        """
+        self.assertEqual(get_cache_key(**self.input_info),
+                         get_cache_key(input_cache={}, cache_dir='cache',
+                                       **self.input_info))
+
+    def test_key_depends_on_input_contents(self):
+        """
+        Test that the key changes when an input file changes.
+        :return:
+        """
+        key = get_cache_key(**self.input_info)
+        self.write_file('data_file', 'data_file changed content\n')
+        self.assertNotEqual(get_cache_key(**self.input_info), key)
+
+    def test_key_depends_on_output_names(self):
+        """
+        Test that the key changes with the output file names, since the
+        generated code refers to them.
+        :return:
+        """
+        key = get_cache_key(**self.input_info)
+        self.input_info['out_data_file'] = 'other.datax'
+        self.assertNotEqual(get_cache_key(**self.input_info), key)
+
+    def test_store_and_restore(self):
+        """
+        Test that stored outputs are restored.
+        :return:
+        """
+        cache_dir = os.path.join(self.tmp_dir, 'cache')
+        c_file = self.write_file('out.c', 'C code\n')
+        data_file = self.write_file('out.datax', 'test data\n')
+        outputs = get_cached_outputs(c_file, data_file)
+        self.assertFalse(copy_from_cache(cache_dir, 'key', outputs))
+        copy_to_cache(cache_dir, 'key', outputs)
+        os.remove(c_file)
+        os.remove(data_file)
+        self.assertTrue(copy_from_cache(cache_dir, 'key', outputs))
+        with open(c_file) as c_f, open(data_file) as data_f:
+            self.assertEqual(c_f.read(), 'C code\n')
+            self.assertEqual(data_f.read(), 'test data\n')
+
+    def test_restore_binary_data(self):
+        """
+        Test that a binary intermediate data file, which is not valid
+        UTF-8, is restored byte for byte, whether or not outputs are
+        only written if changed.
+        :return:
+        """
+        cache_dir = os.path.join(self.tmp_dir, 'cache')
+        c_file = self.write_file('out.c', 'C code\n')
+        data_file = os.path.join(self.tmp_dir, 'out.datax')
+        datax = DATAX_BINARY_MAGIC + b'\xf9\x00\x00\x00\xff\n\r\n'
+        with open(data_file, 'wb') as data_f:
+            data_f.write(datax)
+        outputs = get_cached_outputs(c_file, data_file)
+        copy_to_cache(cache_dir, 'key', outputs)
+        os.remove(data_file)
+        # Restore to a missing file, to an identical file and to a
+        # different file
+        for write_if_changed, existing in [(False, None), (True, datax),
+                                           (True, b'\xfe')]:
+            if existing is not None:
+                with open(data_file, 'wb') as data_f:
+                    data_f.write(existing)
+            self.assertTrue(copy_from_cache(cache_dir, 'key', outputs,
+                                            write_if_changed))
+            with open(data_file, 'rb') as data_f:
+                self.assertEqual(data_f.read(), datax)
+
+    def test_key_ignores_function_bodies(self):
+        """
+        Test that the key doesn't change with the functions file, as
+        long as the test function fingerprints don't.
+        :return:
+        """
+        key = get_data_cache_key([], self.FUNC_INFO, **self.input_info)
+        self.write_file('funcs_file', 'funcs_file changed content\n')
+        self.input_info['c_file'] = 'other.c'
+        self.assertEqual(get_data_cache_key([], self.FUNC_INFO,
+                                            **self.input_info), key)
+
+    def test_key_depends_on_fingerprints(self):
+        """
+        Test that the key changes with the test function identifiers,
+        arguments and dependencies, and with the suite dependencies.
+        :return:
+        """
+        key = get_data_cache_key([], self.FUNC_INFO, **self.input_info)
+        func_info = dict(self.FUNC_INFO, test_func1=(0, ('hex',)))
+        self.assertNotEqual(get_data_cache_key([], func_info,
+                                               **self.input_info), key)
+        func_info = dict(self.FUNC_INFO, test_func1=(2, ('int',)))
+        self.assertNotEqual(get_data_cache_key([], func_info,
+                                               **self.input_info), key)
+        self.assertNotEqual(get_data_cache_key(['DEP'], self.FUNC_INFO,
+                                               **self.input_info), key)
+        key = get_data_cache_key([], self.FUNC_INFO, {'test_func1': []},
+                                 **self.input_info)
+        self.assertNotEqual(get_data_cache_key([], self.FUNC_INFO,
+                                               {'test_func1': ['DEP']},
+                                               **self.input_info), key)
+
+    def test_key_depends_on_data_file(self):
+        """
+        Test that the key changes with the data file contents.
+        :return:
+        """
+        key = get_data_cache_key([], self.FUNC_INFO, **self.input_info)
+        self.write_file('data_file', 'data_file changed content\n')
+        self.assertNotEqual(get_data_cache_key([], self.FUNC_INFO,
+                                               **self.input_info), key)
+
+    def test_store_and_restore_data(self):
+        """
+        Test that stored intermediate data outputs and check code
+        snippets are restored.
+        :return:
+        """
+        cache_dir = os.path.join(self.tmp_dir, 'cache')
+        data_file = self.write_file('out.datax', 'test data\n')
+        outputs = get_cached_data_outputs(data_file)
+        snippets = {}
+        self.assertIsNone(restore_data_from_cache(cache_dir, 'data-key',
+                                                  outputs, snippets))
+        spool = tempfile.SpooledTemporaryFile(mode='w+')
+        try:
+            spool.write('case 0: break;\n')
+            store_data_in_cache(cache_dir, 'data-key', outputs,
+                                {'dep_check_table': spool,
+                                 'functions_code': 'code'}, (5, 2))
+        finally:
+            spool.close()
+        os.remove(data_file)
+        try:
+            self.assertEqual(restore_data_from_cache(cache_dir, 'data-key',
+                                                     outputs, snippets),
+                             (5, 2))
+            self.assertEqual(sorted(snippets), ['dep_check_table'])
+            self.assertEqual(snippets['dep_check_table'].read(),
+                             'case 0: break;\n')
+        finally:
+            for snippet in snippets.values():
+                snippet.close()
+        with open(data_file) as data_f:
+            self.assertEqual(data_f.read(), 'test data\n')
+
+    def test_generate_code_reuses_data(self):
+        """
+        Test that generate_code() restores the intermediate data outputs
+        and check code from the cache when only the body of a test
+        function changes.
+        :return:
+        """
+        input_info = self.write_suite(self.FUNCTIONS_FILE % 'x',
+                                      'Test 1\nfunc1:MACRO1\n')
+        input_info['cache_dir'] = os.path.join(self.tmp_dir, 'cache')
+        input_info['profile_file'] = os.path.join(self.tmp_dir, 'profile')
+        generate_code(**input_info)
+        with open(input_info['out_data_file']) as data_f:
+            datax = data_f.read()
+        self.write_file('test_suite_ut.function', self.FUNCTIONS_FILE % 'y')
+        os.remove(input_info['out_data_file'])
+        generate_code(**input_info)
+        with open(input_info['out_data_file']) as data_f:
+            self.assertEqual(data_f.read(), datax)
+        with open(input_info['c_file']) as c_f:
+            c_code = c_f.read()
+        self.assertIn('void test_func1( int y )', c_code)
+        self.assertIn('MACRO1', c_code)
+        with open(input_info['profile_file']) as profile_f:
+            phases = [json.loads(line)['phases'] for line in profile_f]
+        self.assertIn('generate_intermediate_data_file', phases[0])
+        self.assertNotIn('generate_intermediate_data_file', phases[1])
+
+
+class OpenOutputFile(TempDirTestCase):
+    """
+    Test suite for open_output_file()
+    """
+
+    def setUp(self):
+        super(OpenOutputFile, self).setUp()
+        self.file_name = os.path.join(self.tmp_dir, 'out.c')
+
+    def write(self, content, write_if_changed=True):
+        """
+        Write the output file with open_output_file().
+
+        :param content: File content
+        :param write_if_changed: write-if-changed mode
+        :return:
+        """
+        with open_output_file(self.file_name, write_if_changed) as out_f:
+            out_f.write(content)
+
+    def read(self):
+        """
+        Read the output file.
+
+        :return: File content
+        """
+        with open(self.file_name) as in_f:
+            return in_f.read()
+
+    def test_new_file(self):
+        """
+        Test that a new file is created without leaving temporary files.
+        :return:
+        """
+        self.write('code\n')
+        self.assertEqual(self.read(), 'code\n')
+        self.assertEqual(os.listdir(self.tmp_dir), ['out.c'])
+
+    def test_unchanged_file(self):
+        """
+        Test that an unchanged file keeps its timestamp.
+        :return:
+        """
+        self.write('code\n')
+        os.utime(self.file_name, (1000000000, 1000000000))
+        self.write('code\n')
+        self.assertEqual(os.path.getmtime(self.file_name), 1000000000)
+        self.assertEqual(os.listdir(self.tmp_dir), ['out.c'])
+
+    def test_changed_file(self):
+        """
+        Test that a changed file is replaced.
+        :return:
+        """
+        self.write('code\n')
+        os.utime(self.file_name, (1000000000, 1000000000))
+        self.write('new code\n')
+        self.assertEqual(self.read(), 'new code\n')
+        self.assertNotEqual(os.path.getmtime(self.file_name), 1000000000)
+
+    def test_error(self):
+        """
+        Test that an error while writing leaves the file untouched.
+        :return:
+        """
+        self.write('code\n')
+        def fail():
+            """Write partial output and fail."""
+            with open_output_file(self.file_name, True) as out_f:
+                out_f.write('partial')
+                raise GeneratorInputError('error')
+        self.assertRaises(GeneratorInputError, fail)
+        self.assertEqual(self.read(), 'code\n')
+        self.assertEqual(os.listdir(self.tmp_dir), ['out.c'])
+
+    def test_always_write(self):
+        """
+        Test that the file is rewritten when write-if-changed is disabled.
+        :return:
+        """
+        self.write('code\n')
+        os.utime(self.file_name, (1000000000, 1000000000))
+        self.write('code\n', write_if_changed=False)
+        self.assertNotEqual(os.path.getmtime(self.file_name), 1000000000)
+
+
+class StreamedGeneration(TempDirTestCase):
+    """
+    Test suite for generate_intermediate_data_file() and
+    write_test_source_file() with spooled code snippets.
+    """
+
+    def test_template_with_spool(self):
+        """
+        Test that file snippets are copied on lines of their own.
+        :return:
+        """
+        template_file = self.write_file('template.function',
+                                        '$spooled\n#line $line_no\n'
+                                        'x $text\n')
+        c_file = os.path.join(self.tmp_dir, 'out.c')
+        spool = tempfile.TemporaryFile('w+')
+        spool.write('streamed\ncode')
+        snippets = {'spooled': spool, 'text': 'inline'}
+        try:
+            write_test_source_file(template_file, c_file, snippets)
+        finally:
+            spool.close()
+        with open(c_file) as c_f:
+            self.assertEqual(c_f.read(),
+                             'streamed\ncode\n#line 3\nx inline\n')
+
+    @patch("generate_test_code.CODE_SPOOL_MAX_SIZE", 16)
+    def test_intermediate_data_file(self):
+        """
+        Test that spooled code matches gen_from_test_data() output,
+        including when the spools roll over to disk.
+        :return:
+        """
+        data = '''
+Test 1
+depends_on:DEP1:DEP2
+func1:MACRO1:"abc"
+
+Test 2
+depends_on:DEP2:DEP3
+func1:MACRO2:"def"
+'''
+        data_file = self.write_file('test_suite_ut.data', data)
+        out_data_file = os.path.join(self.tmp_dir, 'test_suite_ut.datax')
+        func_info = {'test_func1': (0, ('int', 'char*'))}
+        suite_dependencies = ['SUITE_DEP']
+        snippets = {}
+        generate_intermediate_data_file(
+            data_file, out_data_file,
+            FunctionFileInfo(suite_dependencies, func_info), snippets)
+        out_data_f = StringIOWrapper('test_suite_ut.datax', '')
+        expected = gen_from_test_data(StringIOWrapper(data_file, data),
+                                      out_data_f, func_info,
+                                      suite_dependencies)
+        try:
+            spooled = []
+            for name in ('dep_check_code', 'expression_code'):
+                snippets[name].seek(0)
+                spooled.append(snippets[name].read())
+        finally:
+            for snippet in snippets.values():
+                snippet.close()
+        self.assertEqual(tuple(spooled), expected)
+        with open(out_data_file) as datax_f:
+            self.assertEqual(datax_f.read(), out_data_f.getvalue())
+
+
+class FileWrapperTest(TempDirTestCase):
+    """
+    Test suite for FileWrapper
+    """
+
+    def read_lines(self, content, buffer_size=4):
+        """
+        Write content to a file and read it back with FileWrapper.
+
+        :param content: File content in bytes
+        :param buffer_size: Read buffer size
+        :return: List of lines and line numbers
+        """
+        file_name = self.write_file('test_suite_ut.data', content)
+        lines = []
+        with FileWrapper(file_name, buffer_size) as in_f:
+            self.assertEqual(in_f.name, file_name)
+            for line in in_f:
+                lines.append((in_f.line_no, line))
+        return lines
+
+    def test_line_numbers(self):
+        """
+        Test that lines are counted across buffer boundaries.
+        :return:
+        """
+        self.assertEqual(self.read_lines(b'first line\n\nthird line'),
+                         [(1, 'first line\n'), (2, '\n'),
+                          (3, 'third line\n')])
+
+    def test_whitespace(self):
+        """
+        Test that trailing whitespace is stripped and lines are split
+        on line feeds only.
+        :return:
+        """
+        self.assertEqual(self.read_lines(b'a \t\r\nb\rc  \n'),
+                         [(1, 'a\n'), (2, 'b\rc\n')])
+
+    def test_utf8(self):
+        """
+        Test that the file is decoded as UTF-8.
+        :return:
+        """
+        self.assertEqual(self.read_lines(b'caf\xc3\xa9\n'),
+                         [(1, u'caf\xe9\n')])
+
+
+class TemplateRendering(TestCase):
+    """
+    Test suite for the compiled templates.
+    """
+
+    def test_compile(self):
+        """
+        Test that literals are merged and line numbers are resolved.
+        :return:
+        """
+        template = ('/* $$1 */\n'
+                    '$functions_code\n'
+                    '#line $line_no "main.function"\n'
+                    'int x = ${value};\n')
+        self.assertEqual(compile_template(template),
+                         ['/* $1 */\n', ('functions_code',),
+                          '\n#line 4 "main.function"\nint x = ',
+                          ('value',), ';\n'])
+
+    def test_invalid_placeholder(self):
+        """
+        Test that an invalid placeholder is reported with its line.
+        :return:
+        """
+        with self.assertRaises(ValueError) as context:
+            compile_template('ok\nint $1;\n')
+        self.assertIn('line 2', str(context.exception))
+
+    def test_render(self):
+        """
+        Test that rendering matches string.Template substitution.
+        :return:
+        """
+        template = ('$code\n#line $line_no "main.function"\n'
+                    'int x = $value;\n')
+        snippets = {'code': 'int y = 0;', 'value': 5}
+        out_f = StringIOWrapper('test_suite_ut.c', '')
+        render_template(compile_template(template), snippets, out_f)
+        self.assertEqual(out_f.getvalue(),
+                         'int y = 0;\n#line 3 "main.function"\n'
+                         'int x = 5;\n')
+
+    def test_render_spool(self):
+        """
+        Test that file snippets are copied to the output.
+        :return:
+        """
+        spool = tempfile.SpooledTemporaryFile(mode='w+')
+        try:
+            spool.write('case 0: break;\n')
+            out_f = StringIOWrapper('test_suite_ut.c', '')
+            render_template(compile_template('{\n$cases}\n'),
+                            {'cases': spool}, out_f)
+        finally:
+            spool.close()
+        self.assertEqual(out_f.getvalue(), '{\ncase 0: break;\n}\n')
+
+    def test_missing_snippet(self):
+        """
+        Test that a missing snippet is reported.
+        :return:
+        """
+        self.assertRaises(KeyError, render_template,
+                          compile_template('$code\n'), {},
+                          StringIOWrapper('test_suite_ut.c', ''))
+
+
+class BinaryDataFormat(TestCase):
+    """
+    Test suite for the binary intermediate data file format.
+    """
+
+    def test_int_parameter(self):
+        """
+        Test that int parameters are converted like strtol() does.
+        :return:
+        """
+        self.assertEqual(encode_binary_parameter('int', '10'),
+                         b'i\x0a\x00\x00\x00')
+        self.assertEqual(encode_binary_parameter('int', '010'),
+                         b'i\x0a\x00\x00\x00')
+        self.assertEqual(encode_binary_parameter('int', '0x10'),
+                         b'i\x10\x00\x00\x00')
+        self.assertEqual(encode_binary_parameter('int', '0XFFFFFFFF'),
+                         b'i\xff\xff\xff\xff')
+
+    def test_exp_parameter(self):
+        """
+        Test that expression ids are encoded.
+        :return:
+        """
+        self.assertEqual(encode_binary_parameter('exp', 258),
+                         b'e\x02\x01\x00\x00')
+
+    def test_string_parameter(self):
+        """
+        Test that string parameters are unescaped and unquoted.
+        :return:
+        """
+        self.assertEqual(encode_binary_parameter('char*', r'"a\:b\n\?\x"'),
+                         b's\x08\x00\x00\x00a:b\n?\\x\x00')
+        self.assertRaises(GeneratorInputError, encode_binary_parameter,
+                          'char*', 'abc')
+
+    def test_hex_parameter(self):
+        """
+        Test that hex parameters are decoded.
+        :return:
+        """
+        self.assertEqual(encode_binary_parameter('hex', '"00ff"'),
+                         b'h\x02\x00\x00\x00\x00\xff')
+        self.assertRaises(GeneratorInputError, encode_binary_parameter,
+                          'hex', '"0g"')
+
+    def test_record(self):
+        """
+        Test the layout of a test case record.
+        :return:
+        """
+        out_data_f = BytesIO()
+        write_binary_record(out_data_f, 'Test', [1, 2], 3,
+                            [('exp', 0), ('int', '7')])
+        record = (b'\x05\x00\x00\x00Test\x00' +
+                  b'\x02\x00\x00\x00\x01\x00\x00\x00\x02\x00\x00\x00' +
+                  b'\x03\x00\x00\x00\x02\x00\x00\x00' +
+                  b'e\x00\x00\x00\x00i\x07\x00\x00\x00')
+        self.assertEqual(out_data_f.getvalue(),
+                         struct.pack('<I', len(record)) + record)
+
+    @patch("generate_test_code.RECORD_SPOOL_MAX_SIZE", 16)
+    def test_index(self):
+        """
+        Test that the records are written after the magic number and the
+        record index, including when the records are spooled to disk.
+        :return:
+        """
+        records = [b'\x01\x00\x00\x00A', b'\x03\x00\x00\x00BCD',
+                   b'\x0c\x00\x00\x00' + b'E' * 12]
+        out_data_f = BytesIO()
+        with BinaryDataWriter() as writer:
+            for record in records:
+                writer.write(record)
+            writer.write_data_file(out_data_f)
+        header_size = len(DATAX_BINARY_MAGIC) + 4 * 4
+        self.assertEqual(out_data_f.getvalue(),
+                         DATAX_BINARY_MAGIC +
+                         struct.pack('<4I', 3, header_size,
+                                     header_size + 5, header_size + 12) +
+                         b''.join(records))
+
+    @patch("generate_test_code.DATAX_RECORD_MAX_SIZE", 16)
+    def test_record_too_large(self):
+        """
+        Test that records larger than the test code buffer are rejected.
+        :return:
+        """
+        self.assertRaises(GeneratorInputError, write_binary_record,
+                          BytesIO(), 'Test with a long name', [], 0, [])
+
+    def test_write_test_data(self):
+        """
+        Test that binary and text formats share identifiers and code.
+        :return:
+        """
+        data = '''
+Test 1
+depends_on:DEP1
+func1:MACRO1:"00"
+
+Test 2
+depends_on:DEP2:DEP1
+func1:MACRO1:"01"
+'''
+        func_info = {'test_func1': (0, ('int', 'hex'))}
+        out_data_f = BytesIO()
+        code = []
+        write_test_data(StringIOWrapper('test_suite_ut.data', data),
+                        out_data_f, func_info,
+                        DataCallbacks(code.append, code.append),
+                        DataOptions(datax_format=DATAX_BINARY))
+        expected = BytesIO()
+        write_binary_record(expected, 'Test 1', [0], 0,
+                            [('exp', 0), ('hex', '"00"')])
+        write_binary_record(expected, 'Test 2', [1, 0], 0,
+                            [('exp', 0), ('hex', '"01"')])
+        self.assertEqual(out_data_f.getvalue(), expected.getvalue())
+        text_code = []
+        write_test_data(StringIOWrapper('test_suite_ut.data', data),
+                        StringIOWrapper('test_suite_ut.datax', ''),
+                        func_info,
+                        DataCallbacks(text_code.append, text_code.append))
+        self.assertEqual(code, text_code)
+
+
+class TestCaseIndex(TempDirTestCase):
+    """
+    Test suite for the test case index written next to the intermediate
+    data file.
+    """
+    data = '''
+Test 1
+depends_on:DEP1
+func1:MACRO1:"00"
+
+Test 2 \u00e9
+func1:MACRO2:"01"
+'''
+
+    def setUp(self):
+        super(TestCaseIndex, self).setUp()
+        self.data_file = self.write_file('test_suite_ut.data', self.data)
+        self.out_data_file = os.path.join(self.tmp_dir,
+                                          'test_suite_ut.datax')
+        self.index_file = self.out_data_file + '.index'
+
+    def generate(self, datax_format):
+        """
+        Generate the intermediate data file and its index.
+
+        :param datax_format: Format of the intermediate data file
+        :return: List of (offset, function id, name) index entries
+        """
+        snippets = {}
+        try:
+            generate_intermediate_data_file(
+                self.data_file, self.out_data_file,
+                FunctionFileInfo([], {'test_func1': (3, ('int', 'hex'))}),
+                snippets, DataOptions(datax_format=datax_format,
+                                      index_file=self.index_file))
+        finally:
+            for snippet in snippets.values():
+                snippet.close()
+        entries = []
+        with io.open(self.index_file, encoding='utf-8') as index_f:
+            for line in index_f:
+                offset, func_id, name = line.rstrip('\n').split(' ', 2)
+                entries.append((int(offset), int(func_id), name))
+        return entries
+
+    def test_text_index(self):
+        """
+        Test that text index offsets point to the test case names.
+        :return:
+        """
+        entries = self.generate('text')
+        with open(self.out_data_file, 'rb') as datax_f:
+            datax = datax_f.read()
+        self.assertEqual([entry[1:] for entry in entries],
+                         [(3, 'Test 1'), (3, u'Test 2 \u00e9')])
+        for offset, _, name in entries:
+            self.assertTrue(datax[offset:].startswith(
+                name.encode('utf-8') + b'\n'))
+
+    def test_binary_index(self):
+        """
+        Test that binary index offsets match the record index.
+        :return:
+        """
+        entries = self.generate(DATAX_BINARY)
+        with open(self.out_data_file, 'rb') as datax_f:
+            datax = datax_f.read()
+        header = struct.unpack_from('<3I', datax, len(DATAX_BINARY_MAGIC))
+        self.assertEqual(header[0], 2)
+        self.assertEqual([entry[0] for entry in entries], list(header[1:]))
+        for offset, _, name in entries:
+            encoded = name.encode('utf-8') + b'\0'
+            self.assertEqual(struct.unpack_from('<I', datax, offset + 4),
+                             (len(encoded),))
+            self.assertEqual(datax[offset + 8:offset + 8 + len(encoded)],
+                             encoded)
+
+    def test_offset_tracking_writer(self):
+        """
+        Test that OffsetTrackingWriter counts encoded bytes.
+        :return:
+        """
+        out_f = StringIO()
+        writer = OffsetTrackingWriter(out_f)
+        writer.write(u'ab\n')
+        writer.write(u'\u00e9')
+        self.assertEqual(out_f.getvalue(), u'ab\n\u00e9')
+        self.assertEqual(writer.tell(),
+                         5 + OffsetTrackingWriter.NEWLINE_EXTRA_SIZE)
+
+
+class DataShards(TempDirTestCase):
+    """
+    Test suite for splitting intermediate data files into shards.
+    """
+    data = '''
+Test 1
+depends_on:DEP1
+func1:MACRO1:"00"
+
+Test 2
+func1:MACRO2:"0102"
+
+Test 3
+func1:MACRO1:"03"
+
+Test 4
+depends_on:DEP2
+func1:MACRO2:"04"
+'''
+
+    def setUp(self):
+        super(DataShards, self).setUp()
+        self.data_file = self.write_file('test_suite_ut.data', self.data)
+        self.out_data_file = os.path.join(self.tmp_dir,
+                                          'test_suite_ut.datax')
+
+    def test_partition_by_count(self):
+        """
+        Test that equal weights are spread evenly in a stable way.
+        :return:
+        """
+        self.assertEqual(partition_test_cases([1.0] * 5, 2),
+                         [0, 1, 0, 1, 0])
+        self.assertEqual(partition_test_cases([1.0] * 2, 3), [0, 1])
+        self.assertEqual(partition_test_cases([], 3), [])
+
+    def test_partition_by_weight(self):
+        """
+        Test that heavy test cases get shards of their own.
+        :return:
+        """
+        self.assertEqual(partition_test_cases([1.0, 10.0, 1.0, 1.0, 5.0,
+                                               4.0], 2),
+                         [1, 0, 0, 1, 1, 1])
+
+    def test_weights(self):
+        """
+        Test that unknown durations default to the mean known duration.
+        :return:
+        """
+        self.assertEqual(get_test_case_weights(['a', 'b']), [1.0, 1.0])
+        self.assertEqual(get_test_case_weights(['a', 'b', 'c'],
+                                               {'a': 1.0, 'c': 3.0}),
+                         [1.0, 2.0, 3.0])
+        self.assertEqual(get_test_case_weights(['a'], {'b': 3.0}), [1.0])
+
+    def test_read_duration_hints(self):
+        """
+        Test that hints are read for the given suite only.
+        :return:
+        """
+        hints_file = os.path.join(self.tmp_dir, 'hints.csv')
+        with open(hints_file, 'w') as hints_f:
+            hints_f.write('# suite;test case;seconds\n'
+                          'test_suite_ut;Test 1;0.5\n'
+                          '\n'
+                          'test_suite_ut;Test;with;separators;2\n'
+                          'test_suite_other;Test 1;7\n')
+        self.assertEqual(read_duration_hints(hints_file, 'test_suite_ut'),
+                         {'Test 1': 0.5, 'Test;with;separators': 2.0})
+
+    def test_invalid_duration_hint(self):
+        """
+        Test that malformed hints are reported with their line number.
+        :return:
+        """
+        hints_file = os.path.join(self.tmp_dir, 'hints.csv')
+        with open(hints_file, 'w') as hints_f:
+            hints_f.write('test_suite_ut;Test 1;0.5\ntest_suite_ut;Test 2\n')
+        with self.assertRaises(GeneratorInputError) as context:
+            read_duration_hints(hints_file, 'test_suite_ut')
+        self.assertIn('hints.csv:2:', str(context.exception))
+
+    def generate_shards(self, datax_format, duration_hints=None):
+        """
+        Generate the intermediate data file and two shards with indexes.
+
+        :param datax_format: Format of the intermediate data file
+        :param duration_hints: Optional durations of the test cases
+        :return: Contents of the intermediate data file and of the
+                 shards, and the shard indexes
+        """
+        snippets = {}
+        try:
+            generate_intermediate_data_file(
+                self.data_file, self.out_data_file,
+                FunctionFileInfo([], {'test_func1': (0, ('int', 'hex'))}),
+                snippets,
+                DataOptions(datax_format=datax_format,
+                            index_file=self.out_data_file + '.index',
+                            shards=2, duration_hints=duration_hints))
+        finally:
+            for snippet in snippets.values():
+                snippet.close()
+        contents = []
+        indexes = []
+        for data_file in [self.out_data_file,
+                          get_shard_file(self.out_data_file, 0),
+                          get_shard_file(self.out_data_file, 1)]:
+            with open(data_file, 'rb') as datax_f:
+                contents.append(datax_f.read())
+            with open(data_file + '.index') as index_f:
+                indexes.append(index_f.read().splitlines())
+        return contents, indexes
+
+    def test_text_shards(self):
+        """
+        Test that text shards hold the test cases of each shard in order.
+        :return:
+        """
+        contents, indexes = self.generate_shards('text')
+        cases = contents[0].split(b'\n\n')
+        self.assertEqual(len(cases), 5)
+        self.assertEqual(contents[1], cases[0] + b'\n\n' + cases[2] + b'\n\n')
+        self.assertEqual(contents[2], cases[1] + b'\n\n' + cases[3] + b'\n\n')
+        self.assertEqual(indexes[1], ['0 0 Test 1', '%d 0 Test 3' %
+                                      (len(cases[0]) + 2)])
+        self.assertEqual([line.split(' ', 2)[2] for line in indexes[2]],
+                         ['Test 2', 'Test 4'])
+
+    def test_binary_shards(self):
+        """
+        Test that binary shards are complete binary data files.
+        :return:
+        """
+        contents, indexes = self.generate_shards(DATAX_BINARY,
+                                                 {'Test 1': 9.0,
+                                                  'Test 2': 1.0,
+                                                  'Test 3': 1.0,
+                                                  'Test 4': 1.0})
+        header_size = len(DATAX_BINARY_MAGIC) + 4 * 4
+        self.assertEqual(struct.unpack_from('<I', contents[0],
+                                            len(DATAX_BINARY_MAGIC)), (4,))
+        offsets = [int(line.split(' ', 1)[0]) for line in indexes[0]]
+        records = [contents[0][start:end] for start, end in
+                   zip(offsets, offsets[1:] + [len(contents[0])])]
+        # Test 1 outweighs all the other test cases together
+        self.assertEqual([line.split(' ', 2)[2] for line in indexes[1]],
+                         ['Test 1'])
+        self.assertEqual(contents[1][len(DATAX_BINARY_MAGIC):],
+                         struct.pack('<2I', 1, len(DATAX_BINARY_MAGIC) + 8) +
+                         records[0])
+        self.assertEqual(contents[2][len(DATAX_BINARY_MAGIC):header_size],
+                         struct.pack('<4I', 3, header_size,
+                                     header_size + len(records[1]),
+                                     header_size + len(records[1]) +
+                                     len(records[2])))
+        self.assertEqual(contents[2][header_size:], b''.join(records[1:]))
+        self.assertEqual([int(line.split(' ', 1)[0]) for line in indexes[2]],
+                         [header_size, header_size + len(records[1]),
+                          header_size + len(records[1]) + len(records[2])])
+
+    def test_cached_outputs(self):
+        """
+        Test that shards and their indexes are cached.
+        :return:
+        """
+        self.assertEqual(
+            get_cached_outputs('a.c', 'a.datax', 'a.datax.index', 2),
+            [('c', 'a.c'), ('datax', 'a.datax'),
+             ('index', 'a.datax.index'),
+             ('shard0', 'a.shard0.datax'),
+             ('shard0.index', 'a.shard0.datax.index'),
+             ('shard1', 'a.shard1.datax'),
+             ('shard1.index', 'a.shard1.datax.index')])
+
+
+class SharedDependencies(TempDirTestCase):
+    """
+    Test suite for the dependency table shared by all test suites.
+    """
+
+    def setUp(self):
+        super(SharedDependencies, self).setUp()
+        self.table_file = os.path.join(self.tmp_dir, 'shared_deps.c')
+        self.config = load_config(self.write_file('config.h',
+                                                  '#define A\n'
+                                                  '//#define AA\n'
+                                                  '#define B\n'
+                                                  '//#define C\n'
+                                                  '#define LEVEL 4\n'
+                                                  '//#define MAX_SIZE 1024\n'
+                                                  ))
+
+    def write_data_file(self, name, dependencies):
+        """
+        Write a data file with one test case per dependency list.
+
+        :param name: Data file name
+        :param dependencies: List of dependency lists
+        :return: Data file path
+        """
+        return self.write_file(name, ''.join(
+            'Test %d\ndepends_on:%s\nfunc1:0\n\n' %
+            (index, ':'.join(test_dependencies))
+            for index, test_dependencies in enumerate(dependencies)))
+
+    def test_dep_condition(self):
+        """
+        Test preprocessor conditions of dependencies.
+        :return:
+        """
+        self.assertEqual(gen_dep_condition('YAHOO'), 'defined(YAHOO)')
+        self.assertEqual(gen_dep_condition('!YAHOO'), '!defined(YAHOO)')
+        self.assertEqual(gen_dep_condition('YAHOO>=2'), '(YAHOO>=2)')
+        self.assertRaises(GeneratorInputError, gen_dep_condition, '!')
+
+    def test_table(self):
+        """
+        Test that the table entries can be read back, and that the
+        header only declares the table.
+        :return:
+        """
+        table = gen_shared_dependencies_table(['YAHOO', '!GOOGLE'],
+                                              'shared_deps.h')
+        self.assertIn('#include "shared_deps.h"\n', table)
+        self.assertIn('const size_t mbedtls_test_shared_dependency_count'
+                      ' = 2;\n', table)
+        self.assertIn('    /* 1: !GOOGLE */\n#if !defined(GOOGLE)\n'
+                      '    1,\n#else\n    0,\n#endif\n', table)
+        with open(self.table_file, 'w') as table_f:
+            table_f.write(table)
+        self.assertEqual(read_shared_dependencies(self.table_file),
+                         ['YAHOO', '!GOOGLE'])
+        header = gen_shared_dependencies_header()
+        self.assertIn('extern const unsigned char'
+                      ' mbedtls_test_shared_dependencies[];\n', header)
+        self.assertIn('extern const size_t'
+                      ' mbedtls_test_shared_dependency_count;\n', header)
+        self.assertNotIn('#if', header.replace('#ifndef', ''))
+
+    def test_update_keeps_identifiers(self):
+        """
+        Test that new dependencies are appended to the table, and that
+        the header is written next to it.
+        :return:
+        """
+        funcs_file = self.write_file('test_suite_a.function', '')
+        data_file1 = self.write_data_file('test_suite_a.data',
+                                          [['B', 'A'], ['B']])
+        data_file2 = self.write_data_file('test_suite_b.data',
+                                          [['C', 'AA'], ['A']])
+        self.assertEqual(update_shared_dependencies(
+            self.table_file, [(funcs_file, data_file1)], self.config),
+                         ['A', 'B'])
+        self.assertEqual(update_shared_dependencies(
+            self.table_file, [(funcs_file, data_file2)], self.config),
+                         ['A', 'B', 'AA', 'C'])
+        self.assertEqual(read_shared_dependencies(self.table_file),
+                         ['A', 'B', 'AA', 'C'])
+        self.assertEqual(get_shared_deps_header(self.table_file),
+                         os.path.join(self.tmp_dir, 'shared_deps.h'))
+        with open(get_shared_deps_header(self.table_file)) as header_f:
+            self.assertEqual(header_f.read(),
+                             gen_shared_dependencies_header())
+
+    def test_update_skips_suite_macros(self):
+        """
+        Test that dependencies on macros defined by a functions file are
+        left to the dep_check() switch of the suites, since the table
+        doesn't see their definitions.
+        :return:
+        """
+        funcs_file = self.write_file(
+            'test_suite_a.function',
+            '/* BEGIN_HEADER */\n#define RAM_128K\n'
+            '#  define NONCE_LEN 0\n/* END_HEADER */\n')
+        data_file = self.write_data_file(
+            'test_suite_a.data',
+            [['RAM_128K', 'A'], ['NONCE_LEN==0'], ['!NONCE_LEN!=0']])
+        self.assertEqual(update_shared_dependencies(
+            self.table_file, [(funcs_file, data_file)], self.config), ['A'])
+
+    def test_update_skips_undecided_deps(self):
+        """
+        Test that dependencies that the configuration doesn't decide, e.g.
+        on macros defined by library headers such as MBEDTLS_HAVE_INT64 in
+        bignum.h, are left to the dep_check() switch of the suites, since
+        the table doesn't see these headers.
+        :return:
+        """
+        funcs_file = self.write_file('test_suite_a.function', '')
+        data_file = self.write_data_file(
+            'test_suite_a.data',
+            [['MBEDTLS_HAVE_INT64', 'A'], ['!MBEDTLS_HAVE_INT64'],
+             ['LEVEL>=2', 'MAX_SIZE>=1024'], ['!C', 'MAX_SIZE']])
+        self.assertEqual(update_shared_dependencies(
+            self.table_file, [(funcs_file, data_file)], self.config),
+                         ['!C', 'A', 'LEVEL>=2'])
+
+    def test_update_rewrites_undecided(self):
+        """
+        Test that a table with dependencies that the configuration doesn't
+        decide is written from scratch.
+        :return:
+        """
+        with open(self.table_file, 'w') as table_f:
+            table_f.write(gen_shared_dependencies_table(
+                ['MBEDTLS_HAVE_INT64', 'B'], 'shared_deps.h'))
+        funcs_file = self.write_file('test_suite_a.function', '')
+        data_file = self.write_data_file('test_suite_a.data',
+                                         [['MBEDTLS_HAVE_INT64', 'B', 'A']])
+        self.assertEqual(update_shared_dependencies(
+            self.table_file, [(funcs_file, data_file)], self.config),
+                         ['A', 'B'])
+        self.assertEqual(read_shared_dependencies(self.table_file),
+                         ['A', 'B'])
+
+    def test_write_test_data(self):
+        """
+        Test that only dependencies missing from the table get check code.
+        :return:
+        """
+        data = '''
+Test 1
+depends_on:DEP2:DEP3
+func1:0
+'''
+        out_data_f = StringIOWrapper('test_suite_ut.datax', '')
+        dep_check_code = []
+        write_test_data(StringIOWrapper('test_suite_ut.data', data),
+                        out_data_f, {'test_func1': (0, ('int',))},
+                        DataCallbacks(dep_check_code.append,
+                                      lambda code: None),
+                        DataOptions(shared_dependencies=('DEP1', 'DEP2')))
+        self.assertEqual(out_data_f.getvalue(),
+                         'Test 1\ndepends_on:1:2\n0:int:0\n\n')
+        self.assertEqual(dep_check_code, [gen_dep_check(2, 'DEP3')])
+
+
+class UnreachableTestCases(TempDirTestCase):
+    """
+    Test suite for leaving out test cases that can't run in a given
+    configuration.
+    """
+
+    def setUp(self):
+        super(UnreachableTestCases, self).setUp()
+        self.config_file = self.write_file('config.h',
+                                           '#define YAHOO\n'
+                                           '//#define GOOGLE\n'
+                                           '#define LEVEL 4\n'
+                                           '#define SIZE (1 << 10)\n'
+                                           '//#define MAX_SIZE 1024\n')
+
+    def test_evaluate_dependency(self):
+        """
+        Test that only the settings of the configuration file decide
+        dependencies.
+        :return:
+        """
+        config = load_config(self.config_file)
+        for dep, result in [('YAHOO', True), ('!YAHOO', False),
+                            ('GOOGLE', False), ('!GOOGLE', True),
+                            ('MSN', None), ('!MSN', None),
+                            ('LEVEL>=2', True), ('LEVEL==0x4', True),
+                            ('LEVEL<4', False), ('!LEVEL!=4', True),
+                            ('SIZE>0', None), ('GOOGLE>0', None),
+                            ('MAX_SIZE', None), ('MAX_SIZE>=1024', None)]:
+            self.assertEqual(evaluate_dependency(dep, config), result, dep)
+
+    def test_function_dependencies(self):
+        """
+        Test that function dependencies are collected by function name.
+        :return:
+        """
+        funcs_file = os.path.join(self.tmp_dir, 'test_suite_ut.function')
+        with open(funcs_file, 'w') as funcs_f:
+            funcs_f.write('/* BEGIN_CASE depends_on:GOOGLE:!YAHOO */\n'
+                          'void func1( int x )\n{\n}\n/* END_CASE */\n\n'
+                          '/* BEGIN_CASE */\n'
+                          'void func2( int x )\n{\n}\n/* END_CASE */\n')
+        self.assertEqual(collect_function_dependencies(funcs_file),
+                         {'test_func1': ['GOOGLE', '!YAHOO'],
+                          'test_func2': []})
+
+    def test_write_test_data(self):
+        """
+        Test that unreachable test cases are left out with their
+        dependency checks.
+        :return:
+        """
+        data = '''
+Test 1
+depends_on:YAHOO:MSN
+func1:0
+
+Test 2
+depends_on:GOOGLE
+func1:1
+
+Test 3
+func2:2
+'''
+        is_unreachable = get_unreachable_check(
+            load_config(self.config_file), [], {'test_func2': ['!YAHOO']})
+        out_data_f = StringIOWrapper('test_suite_ut.datax', '')
+        dep_check_code = []
+        counts = write_test_data(StringIOWrapper('test_suite_ut.data', data),
+                                 out_data_f,
+                                 {'test_func1': (0, ('int',)),
+                                  'test_func2': (1, ('int',))},
+                                 DataCallbacks(dep_check_code.append,
+                                               lambda code: None),
+                                 DataOptions(is_unreachable=is_unreachable))
+        self.assertEqual(counts, (3, 2))
+        self.assertEqual(out_data_f.getvalue(),
+                         'Test 1\ndepends_on:0:1\n0:int:0\n\n')
+        self.assertEqual(dep_check_code, [gen_dep_check(0, 'YAHOO') +
+                                          gen_dep_check(1, 'MSN')])
+
+    def test_suite_dependencies(self):
+        """
+        Test that all test cases are unreachable without the test suite
+        dependencies.
+        :return:
+        """
+        config = load_config(self.config_file)
+        self.assertTrue(get_unreachable_check(config, ['YAHOO', 'GOOGLE'],
+                                              {})('test_func1', []))
+        self.assertFalse(get_unreachable_check(config, ['YAHOO', 'MSN'],
+                                               {})('test_func1', []))
+
+
+class CheckCodeTables(TestCase):
+    """
+    Test suite for the table check code format.
+    """
+
+    def test_dep_bitmap_entry(self):
+        """
+        Test that a dependency sets its bit in the bitmap and that a
+        byte starts every 8 dependencies.
+        :return:
+        """
+        self.assertEqual(gen_dep_bitmap_entry(3, '!YAHOO'),
+                         '    /* 3: !YAHOO */\n'
+                         '#if !defined(YAHOO)\n'
+                         '    | 0x08\n'
+                         '#endif\n')
+        self.assertEqual(gen_dep_bitmap_entry(8, 'YAHOO'),
+                         '    , 0\n'
+                         '    /* 8: YAHOO */\n'
+                         '#if defined(YAHOO)\n'
+                         '    | 0x01\n'
+                         '#endif\n')
+        self.assertRaises(GeneratorInputError, gen_dep_bitmap_entry,
+                          -1, 'YAHOO')
+
+    def test_dep_bitmap_guards(self):
+        """
+        Test that identifiers of the shared dependency table keep their
+        place in the bitmap.
+        :return:
+        """
+        for first_dep_id, byte_count in [(0, 1), (1, 1), (8, 1), (9, 2),
+                                         (16, 2), (17, 3)]:
+            start, end = gen_dep_bitmap_guards(first_dep_id)
+            self.assertEqual(start.count('    0\n') +
+                             start.count('    , 0\n'), byte_count,
+                             first_dep_id)
+            self.assertEqual(end, '};\n')
+
+    def test_expression_table_entry(self):
+        """
+        Test the expression table entry.
+        :return:
+        """
+        self.assertEqual(gen_expression_table_entry(2, 'LEVEL * 2'),
+                         '    /* 2 */ ( LEVEL * 2 ),\n')
+        self.assertEqual(gen_expression_table_entry(3, 'LEVEL + 1;'),
+                         '    /* 3 */ ( LEVEL + 1 ),\n')
+        self.assertRaises(GeneratorInputError, gen_expression_table_entry,
+                          -1, 'LEVEL')
+        self.assertRaises(GeneratorInputError, gen_expression_table_entry,
+                          0, '')
+
+    def test_intermediate_data_file(self):
+        """
+        Test that the table check code replaces the switch cases, with
+        the same identifiers in the intermediate data file.
+        :return:
+        """
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            data_file = os.path.join(tmp_dir, 'test_suite_ut.data')
+            out_data_file = os.path.join(tmp_dir, 'test_suite_ut.datax')
+            with open(data_file, 'w') as data_f:
+                data_f.write('Test 1\ndepends_on:YAHOO:!GOOGLE\n'
+                             'func1:LEVEL:0\n\n'
+                             'Test 2\ndepends_on:GOOGLE\n'
+                             'func1:LEVEL * 2:1\n')
+            snippets = {}
+            try:
+                generate_intermediate_data_file(
+                    data_file, out_data_file,
+                    FunctionFileInfo(['MSN'],
+                                     {'test_func1': (0, ('int', 'int'))}),
+                    snippets, DataOptions(check_code_format=CHECK_CODE_TABLE))
+                self.assertEqual(sorted(snippets),
+                                 ['dep_check_table', 'expression_table'])
+                tables = {}
+                for name in ('dep_check_table', 'expression_table'):
+                    snippets[name].seek(0)
+                    tables[name] = snippets[name].read()
+            finally:
+                for snippet in snippets.values():
+                    snippet.close()
+            dep_table = tables['dep_check_table']
+            expression_table = tables['expression_table']
+            self.assertTrue(dep_table.startswith('\n#if defined(MSN)\n'))
+            self.assertIn('test_dependency_bitmap[]', dep_table)
+            self.assertIn(gen_dep_bitmap_entry(0, 'YAHOO') +
+                          gen_dep_bitmap_entry(1, '!GOOGLE') +
+                          gen_dep_bitmap_entry(2, 'GOOGLE') + '};\n',
+                          dep_table)
+            self.assertIn(gen_expression_table_entry(0, 'LEVEL') +
+                          gen_expression_table_entry(1, 'LEVEL * 2'),
+                          expression_table)
+            self.assertTrue(expression_table.endswith('#endif\n'))
+            with open(out_data_file) as datax_f:
+                self.assertEqual(datax_f.read(),
+                                 'Test 1\ndepends_on:0:1\n'
+                                 '0:exp:0:int:0\n\n'
+                                 'Test 2\ndepends_on:2\n'
+                                 '0:exp:1:int:1\n\n')
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
+class GenerationProfileTest(TestCase):
+    """
+    Test suite for the generation profile.
+    """
+
+    def test_phases(self):
+        """
+        Test that the times of a phase add up.
+        :return:
+        """
+        profile = GenerationProfile('test_suite_ut')
+        for _ in range(2):
+            with profile.phase('parse_function_file'):
+                pass
+        self.assertEqual(list(profile.phases), ['parse_function_file'])
+        times = profile.phases['parse_function_file']
+        self.assertEqual(sorted(times), ['cpu', 'wall'])
+        self.assertTrue(times['wall'] >= 0 and times['cpu'] >= 0)
+
+    def test_phase_error(self):
+        """
+        Test that a phase raising an exception is timed.
+        :return:
+        """
+        profile = GenerationProfile('test_suite_ut')
+        with self.assertRaises(GeneratorInputError):
+            with profile.phase('parse_function_file'):
+                raise GeneratorInputError('error')
+        self.assertIn('parse_function_file', profile.phases)
+
+
+class GenerationProfileFile(TempDirTestCase):
+    """
+    Test suite for writing generation profiles to a file.
+    """
+
+    def test_append_to(self):
+        """
+        Test that profiles are appended as JSON lines.
+        :return:
+        """
+        data_file = self.write_file('test_suite_ut.data', 'Test 1\nfunc1:0\n')
+        profile_file = os.path.join(self.tmp_dir, 'profile.json')
+        for suite_name in ('test_suite_ut', 'test_suite_ut2'):
+            profile = GenerationProfile(suite_name)
+            profile.add_file_sizes(data_file=data_file,
+                                   c_file=os.path.join(self.tmp_dir, 'none'))
+            profile.counts['test_cases'] = 1
+            profile.append_to(profile_file)
+        with open(profile_file) as profile_f:
+            profiles = [json.loads(line) for line in profile_f]
+        self.assertEqual([profile['suite'] for profile in profiles],
+                         ['test_suite_ut', 'test_suite_ut2'])
+        self.assertEqual(profiles[0], {'suite': 'test_suite_ut',
+                                       'cached': False,
+                                       'phases': {},
+                                       'bytes': {'data_file': 15},
+                                       'counts': {'test_cases': 1}})
+
+    def test_generate_code(self):
+        """
+        Test that generate_code() times all the generation phases and
+        records the sizes and counts of the suite.
+        :return:
+        """
+        data = 'Test 1\nfunc1:0\n\nTest 2\ndepends_on:YAHOO\nfunc1:1\n'
+        input_info = self.write_suite('''/* BEGIN_HEADER */
+/* END_HEADER */
+
+/* BEGIN_CASE */
+void func1( int x )
+{
+}
+/* END_CASE */
+''', data)
+        profile_file = os.path.join(self.tmp_dir, 'profile.json')
+        generate_code(profile_file=profile_file, **input_info)
+        with open(profile_file) as profile_f:
+            profiles = [json.loads(line) for line in profile_f]
+        self.assertEqual(len(profiles), 1)
+        profile = profiles[0]
+        self.assertEqual(profile['suite'], 'test_suite_ut')
+        self.assertFalse(profile['cached'])
+        self.assertEqual(sorted(profile['phases']), sorted(PROFILE_PHASES))
+        self.assertEqual(profile['counts'], {'test_functions': 1,
+                                             'test_cases': 2,
+                                             'test_cases_left_out': 0})
+        self.assertEqual(profile['bytes'],
+                         {'functions_file': os.path.getsize(
+                             input_info['funcs_file']),
+                          'data_file': len(data),
+                          'c_file': os.path.getsize(input_info['c_file']),
+                          'datax_file': os.path.getsize(
+                              input_info['out_data_file'])})
+
+
 if __name__ == '__main__':
     unittest_main()